@@ -0,0 +1,172 @@
+"""
+@file batcher.py Dynamic micro-batching of character classification.
+
+When several requests are served at once, each of them calling the model with
+its own small batch wastes most of every model call. The `MicroBatcher` sits in
+front of the classifier: callers submit their (preprocessed) character batches,
+which are queued and flushed to the model together as soon as either
+`max_batch` characters are waiting or the oldest of them has waited `max_wait`
+seconds. Each caller gets its own rows of the predictions back.
+
+The batcher offers the same `predict` method as a Keras model, so it can be
+passed to `charclf.predict` / `main.transcribe` in place of the model.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+MAX_BATCH = 64
+MAX_WAIT = 0.005
+
+class _Request:
+    """
+    A slice of a caller's batch waiting in the queue.
+    """
+    __slots__ = ("batch", "future", "enqueued")
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+class MicroBatcher:
+    """
+    Queues character batches from many callers and runs them through the
+    model in combined batches on a single background thread.
+
+    :param model: Object with a Keras like `predict(batch, batch_size, verbose)`
+    :param max_batch: {integer} Most characters sent to the model at once
+    :param max_wait: {float} Longest time (seconds) a character waits for others
+    """
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self._queue = deque()
+        self._depth = 0
+        self._cond = threading.Condition()
+        self._running = True
+
+        # Counters for `stats`
+        self._batches = 0
+        self._rows = 0
+        self._wait = 0.0
+        self._maxWait = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def input_shape(self):
+        # Input of the model, see `charclf.inputShape`
+        return getattr(self.model, "input_shape", None)
+
+    # ---------- Callers - Begin ----------
+    def submit(self, batch):
+        """
+        Queues a batch of preprocessed characters.
+
+        :param batch: {numpy array} Model input of shape (N, ...)
+        :return: {list} Futures resolving to the predictions of consecutive slices of the batch
+        """
+        requests = [_Request(batch[i:i + self.max_batch])
+                    for i in range(0, len(batch), self.max_batch)]
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.extend(requests)
+            self._depth += len(batch)
+            self._cond.notify()
+        return [r.future for r in requests]
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        """
+        Blocking, model like interface: returns the predictions of the batch.
+        `batch_size` and `verbose` are accepted for compatibility and ignored.
+        """
+        if len(batch) == 0:
+            return np.zeros((0, 26), dtype=np.float32)
+        return np.concatenate([f.result() for f in self.submit(batch)])
+
+    def stats(self):
+        """
+        Reports the state of the queue for tuning `max_batch` and `max_wait`.
+
+        :return: {dict} queue depth (characters waiting), batches run, mean
+        batch fill ratio and the mean / max wait added by the batching (seconds)
+        """
+        with self._cond:
+            batches = self._batches
+            return {
+                "queue_depth": self._depth,
+                "batches": batches,
+                "chars": self._rows,
+                "fill_ratio": self._rows / (batches * self.max_batch) if batches else 0.0,
+                "mean_wait": self._wait / self._rows if self._rows else 0.0,
+                "max_wait": self._maxWait,
+            }
+
+    def close(self):
+        """
+        Stops the background thread once the queued characters are classified.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+    # ---------- Callers - End ----------
+
+    # ---------- Background Thread - Begin ----------
+    def _next(self):
+        # Waits for a flush condition and pops the requests of the next batch
+        with self._cond:
+            while not self._queue and self._running:
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            deadline = self._queue[0].enqueued + self.max_wait
+            while self._running and self._depth < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            requests, rows = [], 0
+            while self._queue and (not requests or rows + len(self._queue[0].batch) <= self.max_batch):
+                r = self._queue.popleft()
+                requests.append(r)
+                rows += len(r.batch)
+            self._depth -= rows
+
+            now = time.perf_counter()
+            for r in requests:
+                waited = now - r.enqueued
+                self._wait += waited * len(r.batch)
+                self._maxWait = max(self._maxWait, waited)
+            self._batches += 1
+            self._rows += rows
+            return requests
+
+    def _loop(self):
+        while True:
+            requests = self._next()
+            if requests is None:
+                return
+            try:
+                batch = np.concatenate([r.batch for r in requests])
+                predictions = self.model.predict(batch, batch_size=len(batch), verbose=0)
+            except Exception as e:
+                for r in requests:
+                    r.future.set_exception(e)
+                continue
+
+            start = 0
+            for r in requests:
+                r.future.set_result(predictions[start:start + len(r.batch)])
+                start += len(r.batch)
+    # ---------- Background Thread - End ----------
@@ -0,0 +1,6 @@
+"""
+@file __init__.py Sub Package Intitalization: `Benchmarks`
+
+The benchmarks are run as scripts from the `engine` directory, e.g.
+`python benchmarks/bench_charseg.py`.
+"""
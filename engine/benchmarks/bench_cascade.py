@@ -0,0 +1,86 @@
+"""
+@file bench_cascade.py Accuracy and throughput of the classifier cascade per threshold.
+
+Classifies the labelled character crops of a dataset folder (one sub folder
+per letter, see `dataset.py`) with the fast model alone, the heavy model alone
+and `charclf.Cascade` of both at every threshold, and reports the share of
+characters escalated to the heavy model, the accuracy and the characters per
+second (fastest of the repeats):
+
+    python benchmarks/bench_cascade.py <dataset dir> --fast <small.h5> [--heavy <model>]
+                                       [--thresholds 0.5 0.9 ...] [--repeat N] [--out FILE]
+"""
+import os
+import sys
+import json
+import time
+import contextlib
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_DIR)
+
+import numpy as np
+
+import util
+import dataset
+import charclf as cf
+
+THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+def run(model, crops, labels, repeat):
+    """
+    :return: {dict} Accuracy, escalation rate (cascades only) and characters per second
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if isinstance(model, cf.Cascade):
+            model.chars = model.escalated = 0
+        start = time.perf_counter()
+        predictions = cf.predict(model, crops)
+        best = min(best, time.perf_counter() - start)
+    report = {"accuracy": float(np.mean(predictions.argmax(axis=1) == labels)),
+              "chars_per_s": len(crops) / best}
+    if isinstance(model, cf.Cascade):
+        report["escalated"] = model.stats()["rate"]
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import main as Main
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("folder", help="Dataset folder with one sub folder per letter")
+    parser.add_argument("--fast", required=True, help="Fast model (e.g. from smallclf.py)")
+    parser.add_argument("--heavy", default=Main.MODEL)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Also write the report (JSON) to this file")
+    args = parser.parse_args()
+
+    paths, labels = dataset.listDataset(args.folder)
+    crops, labels = [util.readImage(p) for p in paths], np.asarray(labels)
+    with contextlib.redirect_stdout(sys.stderr):
+        fast, heavy = cf.load(args.fast, warm=True), cf.load(args.heavy, warm=True)
+
+    # Untimed first pass of both models
+    cf.predict(fast, crops[:cf.MAX_INFLIGHT])
+    cf.predict(heavy, crops[:cf.MAX_INFLIGHT])
+
+    reports = {"fast": run(fast, crops, labels, args.repeat),
+               "heavy": run(heavy, crops, labels, args.repeat)}
+    for threshold in args.thresholds:
+        reports[f"cascade@{threshold}"] = run(cf.Cascade(fast, heavy, threshold), crops, labels,
+                                              args.repeat)
+
+    print(f"{len(crops)} crops, fast {os.path.basename(args.fast)}, "
+          f"heavy {os.path.basename(args.heavy)}")
+    print(f"{'classifier':>16}{'escalated':>12}{'accuracy':>12}{'chars/s':>12}")
+    for name, r in reports.items():
+        escalated = f"{r['escalated']:.1%}" if "escalated" in r else "-"
+        print(f"{name:>16}{escalated:>12}{r['accuracy']:>12.1%}{r['chars_per_s']:>12.0f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(reports, f, indent=2)
+    exit(0)
@@ -0,0 +1,50 @@
+"""
+@file bench_charseg.py Micro-benchmark of the charseg projection profile steps.
+
+Times the PSC computation (binarization, peaks, merging, troughs and false PSC
+removal) of the array based `charseg` functions against the original per
+column loops, on the words of the sample images and on synthetic wide words.
+
+Usage: python benchmarks/bench_charseg.py [--repeat N]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from benchmarks import reference as ref
+
+def syntheticCounts(width, rng):
+    """
+    Vertical pixel count of a word `width` columns wide: characters of 20 to
+    60 columns separated by gaps of 2 to 10 empty columns.
+    """
+    pixels = np.zeros(width, dtype=np.uint64)
+    x = 0
+    while x < width:
+        w = rng.integers(20, 60)
+        pixels[x:x + w] = rng.integers(10, 255 * 30, min(w, width - x))
+        x += w + rng.integers(2, 10)
+    return pixels
+
+def bench(name, counts, repeat):
+    loops = min(timeit.repeat(lambda: [ref.referencePSC(p) for p in counts], number=1, repeat=repeat))
+    arrays = min(timeit.repeat(lambda: [ref.vectorizedPSC(p) for p in counts], number=1, repeat=repeat))
+    columns = sum(len(p) for p in counts)
+    print(f"{name:<28}{len(counts):>7}{columns:>10}{loops * 1000:>12.2f}{arrays * 1000:>12.2f}"
+          f"{loops / arrays:>10.1f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'input':<28}{'words':>7}{'columns':>10}{'loops ms':>12}{'arrays ms':>12}{'speedup':>11}")
+    bench("sample images", ref.samplePixelCounts(), args.repeat)
+    for width in (512, 2048, 8192):
+        bench(f"synthetic words, {width} px", [syntheticCounts(width, rng) for _ in range(100)], args.repeat)
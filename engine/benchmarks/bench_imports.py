@@ -0,0 +1,76 @@
+"""
+@file bench_imports.py Cold import time of each engine module.
+
+Imports every module in a fresh interpreter with `python -X importtime` and
+reports its cumulative import time, the peak memory of the interpreter and
+whether TensorFlow / Matplotlib got loaded along the way. Only `tfutil` (and
+whatever uses the model) should pay for TensorFlow.
+
+Usage: python benchmarks/bench_imports.py [--repeat N] [--json <file>]
+"""
+import os
+import sys
+import json
+import subprocess
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["util", "display", "tfutil", "wordext", "charseg", "charclf",
+           "batcher", "cache", "main", "worker"]
+PROBE = ("import {0}, sys, resource; "
+         "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "
+         "'tensorflow' in sys.modules, 'matplotlib' in sys.modules)")
+
+def importTime(module):
+    """
+    Imports the module in a new interpreter.
+
+    :param module: {string} Name of the engine module
+    :return: {dict} Cumulative import time (ms), peak RSS (MB) and heavy imports
+    """
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL="3")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(module)],
+                          cwd=ENGINE_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative = None
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1]) / 1000
+
+    rss, tf, mpl = proc.stdout.split()[-3:]
+    return {"module": module, "import_ms": cumulative, "rss_mb": int(rss) / 1024,
+            "tensorflow": tf == "True", "matplotlib": mpl == "True"}
+
+def run(modules=MODULES, repeat=3):
+    """
+    :return: {list} Best of `repeat` measurements for every module
+    """
+    results = []
+    for module in modules:
+        runs = [importTime(module) for _ in range(repeat)]
+        results.append(min(runs, key=lambda r: r["import_ms"]))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    results = run(args.modules, args.repeat)
+    print(f"{'module':<12}{'import ms':>12}{'rss MB':>10}{'tensorflow':>12}{'matplotlib':>12}")
+    for r in results:
+        print(f"{r['module']:<12}{r['import_ms']:>12.1f}{r['rss_mb']:>10.1f}"
+              f"{str(r['tensorflow']):>12}{str(r['matplotlib']):>12}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,76 @@
+"""
+@file bench_memory.py Peak memory of the word extraction on very large scans.
+
+Runs `wordext.locate` on a synthetic scan in a fresh process for every page
+size and mode, and reports the peak resident memory added on top of the decoded
+page (in MB and MB per megapixel) and the time taken:
+
+    * whole: the page converted and rescaled at once
+    * tiled: the page downscaled in strips within `--budget` MB
+
+Usage: python benchmarks/bench_memory.py [--budget MB]
+"""
+import os
+import sys
+import json
+import subprocess
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_DIR)
+
+# Letter at 300 dpi, A4 at 300 dpi, A3 at 600 dpi
+SIZES = ((2550, 3300), (2480, 3508), (7016, 9921))
+
+def measure(width, height, budget):
+    """
+    Runs in the child process: prints the peak memory and time of one run
+    (without a budget the page is processed whole, whatever its size).
+    """
+    import time
+    import resource
+    import cv2 as cv
+    import numpy as np
+    import wordext as wx
+
+    # Words large enough to stay apart once the page is rescaled to 224 columns
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    scale = width / 500
+    for y in range(int(80 * scale), height - int(20 * scale), int(60 * scale)):
+        cv.putText(page, "HELLO THERE TEST", (int(10 * scale), y), cv.FONT_HERSHEY_SIMPLEX,
+                   scale, (0, 0, 0), max(1, int(3 * scale)))
+    if budget is None:
+        wx.TILE_ABOVE = float("inf")
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    boxes, rect = wx.locate(page, budget=budget, buffers={})
+    elapsed = time.perf_counter() - start
+
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux
+    print(json.dumps({"peak_mb": (after - before) / 1024, "seconds": elapsed,
+                      "words": int(sum(len(l) for l in boxes))}))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--budget", type=float, default=32, help="Budget of the tiled mode, in MB")
+    parser.add_argument("--child", nargs=3, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        width, height, budget = args.child
+        measure(width, height, budget or None)
+        exit(0)
+
+    print(f"{'page':<14}{'Mpx':>7}{'mode':>8}{'peak MB':>10}{'MB/Mpx':>9}{'seconds':>9}{'words':>7}")
+    for width, height in SIZES:
+        mpx = width * height / 1e6
+        for mode, budget in (("whole", 0), ("tiled", int(args.budget * 2 ** 20))):
+            out = subprocess.run([sys.executable, __file__, "--child", str(width), str(height), str(budget)],
+                                 capture_output=True, text=True, check=True).stdout
+            r = json.loads(out)
+            print(f"{width}x{height:<9}{mpx:>7.1f}{mode:>8}{r['peak_mb']:>10.1f}"
+                  f"{r['peak_mb'] / mpx:>9.2f}{r['seconds']:>9.2f}{r['words']:>7}")
@@ -0,0 +1,290 @@
+"""
+@file bench_pipeline.py End-to-end benchmark of the engine on a synthetic corpus.
+
+Renders a reproducible corpus of uppercase text pages offline (glyphs drawn one
+by one with size, baseline and spacing jitter, blur, uneven lighting, noise and
+specks, various line counts and scan resolutions), runs the whole `wordext` ->
+`charseg` -> `charclf` pipeline over it and reports, for every stage and in
+total, the wall time, the throughput (pages/sec, chars/sec) and the peak memory.
+
+Times are the best of `--repeat` runs. Memory is measured in a separate run
+with `tracemalloc` (so that tracing does not slow the timed runs down): it sees
+the numpy and OpenCV arrays the stages allocate but not TensorFlow's own
+buffers, which the peak resident memory of the process includes.
+
+    python benchmarks/bench_pipeline.py --save baseline.json
+    python benchmarks/bench_pipeline.py --compare baseline.json [--tolerance 0.1]
+
+`--compare` flags every stage whose time or peak memory grew by more than the
+tolerance over the baseline (measured on the same corpus) and exits with 1 if
+any did. `--out DIR` also writes the corpus pages and their text.
+
+Usage: python benchmarks/bench_pipeline.py [--pages N] [--seed N] [--repeat N]
+       [--model <model>] [--save FILE] [--compare FILE] [--tolerance T] [--out DIR]
+"""
+import os
+import sys
+import json
+import time
+import difflib
+import resource
+import tracemalloc
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_DIR)
+import cv2 as cv
+import numpy as np
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+STAGES = ("wordext", "charseg", "charclf")
+# Letter at 150 dpi, A4 at 200 dpi, A4 at 300 dpi
+SIZES = ((1275, 1650), (1654, 2339), (2480, 3508))
+LINES = (3, 12)
+
+# ---------- Synthetic Corpus - Begin ----------
+def renderPage(rng, width, height, lines):
+    """
+    Renders `lines` lines of random uppercase words on a scanned looking page.
+
+    :param rng: {numpy Generator} Source of all the randomness of the page
+    :param width: {integer} Width of the page in pixels
+    :param height: {integer} Height of the page in pixels
+    :param lines: {integer} Number of lines of text
+    :return: {tuple} (BGR page {numpy array}, text {string}, one line per line)
+    """
+    page = np.full((height, width), 255, dtype=np.uint8)
+    # Glyphs large enough to stay apart once the page is rescaled to 224 columns
+    scale = width / 450
+    thickness = max(2, int(2.5 * scale))
+    lineHeight = min(int(60 * scale), (height - int(40 * scale)) // lines)
+    text = []
+    for i in range(lines):
+        y = int(40 * scale) + (i + 1) * lineHeight - int(rng.integers(0, 5) * scale)
+        x, words = int(rng.uniform(10, 30) * scale), []
+        while True:
+            word = "".join(rng.choice(list(LETTERS), int(rng.integers(2, 8))))
+            size = scale * rng.uniform(0.9, 1.1)
+            (w, h), _ = cv.getTextSize(word, cv.FONT_HERSHEY_SIMPLEX, size, thickness)
+            if x + 1.2 * w >= width - 10 * scale:
+                break
+            for c in word:
+                (cw, ch), _ = cv.getTextSize(c, cv.FONT_HERSHEY_SIMPLEX, size, thickness)
+                dy = int(rng.normal(0, 0.6) * scale)
+                cv.putText(page, c, (x, y + dy), cv.FONT_HERSHEY_SIMPLEX, size, 0, thickness)
+                x += cw + int(rng.uniform(1, 3) * scale)
+            words.append(word)
+            x += int(rng.uniform(25, 40) * scale)
+        text.append(" ".join(words))
+
+    # Scanner blur, uneven lighting, sensor noise and a few specks (`wordext`
+    # thresholds 2 gray levels below the local mean, stronger pixel noise
+    # turns the whole page into words)
+    page = cv.GaussianBlur(page.astype(np.float32), (0, 0), width / 1000)
+    lighting = cv.resize(rng.normal(0, 15, (4, 3)).astype(np.float32), (width, height),
+                         interpolation=cv.INTER_CUBIC)
+    page -= np.abs(lighting)
+    page += rng.normal(0, 1, page.shape).astype(np.float32)
+    for _ in range(int(rng.integers(5, 20))):
+        cv.circle(page, (int(rng.integers(0, width)), int(rng.integers(0, height))),
+                  int(rng.integers(1, 3)), 0, -1)
+    page = np.clip(page, 0, 255).astype(np.uint8)
+    return cv.cvtColor(page, cv.COLOR_GRAY2BGR), "\n".join(text)
+
+def corpus(pages, seed=0):
+    """
+    Renders the benchmark corpus, always the same for the same arguments.
+
+    :param pages: {integer} Number of pages
+    :param seed: {integer} Seed of the corpus
+    :return: {list} (page {numpy array}, text {string}) of every page
+    """
+    rng = np.random.default_rng(seed)
+    result = []
+    for _ in range(pages):
+        width, height = SIZES[int(rng.integers(0, len(SIZES)))]
+        result.append(renderPage(rng, width, height, int(rng.integers(LINES[0], LINES[1] + 1))))
+    return result
+# ---------- Synthetic Corpus - End ----------
+
+# ---------- Pipeline - Begin ----------
+def runPipeline(pages, model, memory=False):
+    """
+    Runs the stages one after the other over all the pages.
+
+    :param pages: {list} Page images
+    :param model: {keras model} Loaded (and warmed up) character classifier
+    :param memory: {bool} Trace the peak memory of every stage
+    :return: {tuple} (stage -> seconds or peak MB {dict}, text of every page {list},
+    words {integer}, characters {integer})
+    """
+    import wordext as wx
+    import charseg as cs
+    import charclf as cf
+
+    def stage(name, work):
+        if memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = work()
+        elapsed = time.perf_counter() - start
+        if memory:
+            measured[name] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        else:
+            measured[name] = elapsed
+        return result
+
+    measured = {}
+    buffers = {}
+    # New copies, the rescaled pages of an earlier run are shared by identity (see `util.resized`)
+    pages = [p.copy() for p in pages]
+    lines = stage("wordext", lambda: [wx.extract(p, buffers) for p in pages])
+    words = stage("charseg", lambda: [[[cs.main(w) for w in line] for line in page] for page in lines])
+    chars = [c for page in words for line in page for word in line for c in word]
+    labels = stage("charclf", lambda: cf.extractText(cf.predict(model, chars)))
+
+    # Putting the labels back into words and lines
+    texts, k = [], 0
+    for page in words:
+        text = []
+        for line in page:
+            text.append(" ".join(labels[k:(k := k + len(word))] for word in line))
+        texts.append("\n".join(text))
+    return measured, texts, sum(len(line) for page in words for line in page), len(chars)
+
+def accuracy(texts, expected):
+    # Share of the expected letters recognized (in order), spaces and line breaks aside
+    found = "".join("".join(t.split()) for t in texts)
+    truth = "".join("".join(t.split()) for t in expected)
+    matcher = difflib.SequenceMatcher(None, found, truth, autojunk=False)
+    return sum(b.size for b in matcher.get_matching_blocks()) / max(1, len(truth))
+
+def benchmark(pages, seed, repeat, modelPath):
+    """
+    Measures the pipeline on the corpus.
+
+    :return: {dict} Results, as saved in the baseline file
+    """
+    import charclf as cf
+
+    data = corpus(pages, seed)
+    images = [image for image, text in data]
+
+    start = time.perf_counter()
+    model = cf.load(modelPath)
+    loading = time.perf_counter() - start
+    # The first call builds the prediction function, steady state is measured
+    cf.predict(model, [np.zeros((32, 32), dtype=np.uint8)])
+
+    runs = [runPipeline(images, model) for _ in range(repeat)]
+    seconds = {s: min(r[0][s] for r in runs) for s in STAGES}
+    peaks, texts, words, chars = runPipeline(images, model, memory=True)
+
+    stages = {}
+    for s in STAGES + ("total",):
+        elapsed = sum(seconds.values()) if s == "total" else seconds[s]
+        stages[s] = {
+            "seconds": elapsed,
+            "pages_per_sec": pages / elapsed if elapsed > 0 else 0.0,
+            "chars_per_sec": chars / elapsed if elapsed > 0 else 0.0,
+            "peak_mb": max(peaks.values()) if s == "total" else peaks[s],
+        }
+    return {
+        "corpus": {"pages": pages, "seed": seed,
+                   "megapixels": sum(i.shape[0] * i.shape[1] for i in images) / 1e6,
+                   "chars": sum(len("".join(t.split())) for image, t in data)},
+        "model": os.path.basename(modelPath),
+        "model_load_seconds": loading,
+        "words": words,
+        "chars": chars,
+        "accuracy": accuracy(texts, [t for image, t in data]),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": stages,
+    }
+# ---------- Pipeline - End ----------
+
+# ---------- Reporting - Begin ----------
+def report(result, baseline=None):
+    c = result["corpus"]
+    print(f"{c['pages']} pages ({c['megapixels']:.1f} Mpx, {c['chars']} letters, seed {c['seed']}), "
+          f"{result['words']} words and {result['chars']} characters found, "
+          f"accuracy {result['accuracy']:.1%}")
+    print(f"model {result['model']} loaded in {result['model_load_seconds']:.2f}s, "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB")
+    header = f"{'stage':<10}{'seconds':>10}{'pages/sec':>11}{'chars/sec':>11}{'peak MB':>9}"
+    print(header + (f"{'time vs base':>14}{'mem vs base':>13}" if baseline else ""))
+    for s, r in result["stages"].items():
+        line = (f"{s:<10}{r['seconds']:>10.3f}{r['pages_per_sec']:>11.2f}"
+                f"{r['chars_per_sec']:>11.1f}{r['peak_mb']:>9.1f}")
+        if baseline and s in baseline["stages"]:
+            b = baseline["stages"][s]
+            line += f"{r['seconds'] / b['seconds'] - 1:>+14.1%}{r['peak_mb'] / max(b['peak_mb'], 1e-9) - 1:>+13.1%}"
+        print(line)
+
+def compare(result, baseline, tolerance):
+    """
+    Lists the regressions of the result over the baseline.
+
+    :param result: {dict} Result of `benchmark`
+    :param baseline: {dict} Earlier result of `benchmark`
+    :param tolerance: {float} Relative growth allowed (0.1 for 10%)
+    :return: {list} Description of every regression, empty if there is none
+    """
+    if result["corpus"]["pages"] != baseline["corpus"]["pages"] or \
+            result["corpus"]["seed"] != baseline["corpus"]["seed"]:
+        raise ValueError("The baseline was measured on another corpus (--pages / --seed)")
+
+    regressions = []
+    for s, b in baseline["stages"].items():
+        r = result["stages"].get(s)
+        if r is None:
+            continue
+        for key, unit in (("seconds", "s"), ("peak_mb", " MB")):
+            if r[key] > b[key] * (1 + tolerance):
+                regressions.append(f"{s} {key}: {b[key]:.3f}{unit} -> {r[key]:.3f}{unit}")
+    if result["accuracy"] < baseline["accuracy"] - tolerance / 10:
+        regressions.append(f"accuracy: {baseline['accuracy']:.1%} -> {result['accuracy']:.1%}")
+    return regressions
+# ---------- Reporting - End ----------
+
+
+if __name__ == "__main__":
+    import argparse
+    import main as Main
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model", default=Main.MODEL)
+    parser.add_argument("--save", help="Write the results to this baseline file")
+    parser.add_argument("--compare", help="Baseline file to compare the results with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative growth allowed")
+    parser.add_argument("--out", help="Also write the corpus pages and their text to this folder")
+    args = parser.parse_args()
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        for i, (image, text) in enumerate(corpus(args.pages, args.seed)):
+            cv.imwrite(os.path.join(args.out, f"page-{i:03d}.png"), image)
+            with open(os.path.join(args.out, f"page-{i:03d}.txt"), "w") as f:
+                f.write(text + "\n")
+
+    result = benchmark(args.pages, args.seed, args.repeat, args.model)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved the baseline to {args.save}")
+    if baseline:
+        regressions = compare(result, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        exit(1 if regressions else 0)
+    exit(0)
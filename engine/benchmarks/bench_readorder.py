@@ -0,0 +1,57 @@
+"""
+@file bench_readorder.py Benchmark of the reading order of word boxes.
+
+Times `readorder.readingOrder` on synthetic pages of increasing word counts
+(up to a hundred thousand boxes) and reports, next to the fixed 30 pixel bands
+of `wordext.extractLines`, the share of text lines each of them recovers
+exactly on straight and slightly skewed pages.
+
+Usage: python benchmarks/bench_readorder.py [--repeat N]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import readorder as ro
+from benchmarks.reference import page
+
+def bands(boxes, thresh=30):
+    # `extractLines` / `extractWords` on box arrays
+    x, y, w, h = boxes.T
+    r_mark = (y + h / 2).astype(np.int64) // thresh
+    order = np.lexsort(((x + w / 2).astype(np.int64), r_mark))
+    starts = np.flatnonzero(np.diff(r_mark[order]))
+    return np.split(boxes[order], starts + 1)
+
+def recovered(lines, boxes, truth):
+    # Share of text lines found whole, with their words in order
+    position = {tuple(b): t for b, t in zip(boxes.tolist(), truth)}
+    found = set()
+    for line in lines:
+        words = [position[tuple(b)] for b in line.tolist()]
+        if len({i for i, j in words}) == 1 and [j for i, j in words] == list(range(len(words))):
+            found.add(words[0][0])
+    return len(found) / (max(t[0] for t in truth) + 1)
+
+def bench(lines, words, slope, repeat, rng):
+    boxes, truth = page(lines, words, height=20, pitch=36, slope=slope, rng=rng)
+    t = min(timeit.repeat(lambda: ro.readingOrder(boxes), number=1, repeat=repeat))
+    print(f"{len(boxes):>9}{slope:>8.2f}{t * 1000:>12.2f}{t * 1e6 / len(boxes):>14.3f}"
+          f"{recovered(ro.readingOrder(boxes), boxes, truth):>10.1%}"
+          f"{recovered(bands(boxes), boxes, truth):>10.1%}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>9}{'skew':>8}{'ms':>12}{'us per box':>14}{'lines':>10}{'bands':>10}")
+    for lines, words in ((50, 20), (100, 100), (250, 200), (500, 200)):
+        for slope in (0.0, 0.02):
+            bench(lines, words, slope, args.repeat, rng)
@@ -0,0 +1,80 @@
+"""
+@file bench_warm.py Cold and warm latency of the classifier per batch size.
+
+Loads the model in a fresh process for every mode and reports, for every batch
+size, the latency of its first call (cold) and the fastest of the following
+calls (warm):
+
+    * keras: `model.predict` of the plain Keras model
+    * compiled: `charclf.CompiledModel`, buckets traced on first use
+    * warmed: `charclf.CompiledModel` after `warmup`, as the worker loads it
+
+Batch sizes between the buckets (5, 20) are padded up to the next bucket.
+
+Usage: python benchmarks/bench_warm.py [--model <model>] [--threads N] [--repeat N]
+"""
+import os
+import sys
+import json
+import subprocess
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_DIR)
+
+SIZES = (1, 5, 8, 16, 20, 32, 64)
+MODES = ("keras", "compiled", "warmed")
+
+def measure(mode, modelPath, threads, repeat):
+    """
+    Runs in the child process: prints the cold and warm latency (ms) of every batch size.
+    """
+    import time
+    import contextlib
+    import numpy as np
+    import charclf as cf
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        model = cf.load(modelPath, threads=threads or None, warm=mode == "warmed",
+                        buckets=None if mode == "keras" else cf.BUCKETS)
+    loading = time.perf_counter() - start
+
+    report = {"load_s": loading}
+    for size in SIZES:
+        batch = np.random.default_rng(size).random((size, 224, 224, 3), dtype=np.float32)
+        times = []
+        for _ in range(repeat + 1):
+            start = time.perf_counter()
+            model.predict(batch, batch_size=size, verbose=0)
+            times.append(time.perf_counter() - start)
+        report[size] = {"cold_ms": times[0] * 1000, "warm_ms": min(times[1:]) * 1000}
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    import argparse
+    import main as Main
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--model", default=Main.MODEL)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads, 0 for all cores")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child, args.model, args.threads, args.repeat)
+        exit(0)
+
+    reports = {}
+    for mode in MODES:
+        out = subprocess.run([sys.executable, __file__, "--child", mode, "--model", args.model,
+                              "--threads", str(args.threads), "--repeat", str(args.repeat)],
+                             capture_output=True, text=True, check=True).stdout
+        reports[mode] = json.loads(out)
+
+    print("load: " + ", ".join(f"{m} {r['load_s']:.2f}s" for m, r in reports.items()))
+    print(f"{'batch':>6}" + "".join(f"{m + ' cold':>16}{m + ' warm':>16}" for m in MODES) + "  (ms)")
+    for size in SIZES:
+        print(f"{size:>6}" + "".join(f"{reports[m][str(size)]['cold_ms']:>16.1f}"
+                                     f"{reports[m][str(size)]['warm_ms']:>16.1f}" for m in MODES))
@@ -0,0 +1,74 @@
+"""
+@file bench_wordext.py Benchmark of the word detection methods of wordext.
+
+Times word detection and reading order (steps 4 to 6 of the Word Extraction)
+with the contour approximation method (contour tree, areas, bounding boxes)
+against the connected components statistics, on the dilated sample images and
+on synthetic dense scans of increasing size.
+
+Usage: python benchmarks/bench_wordext.py [--repeat N]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cv2 as cv
+import numpy as np
+import util
+import wordext as wx
+import readorder
+
+ENGINE_DIR = os.path.dirname(util.__file__)
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+def syntheticScan(width, height, rng):
+    """
+    Dilated page `width` x `height` densely filled with lines of random
+    uppercase words, as `wordext.dilate` returns it.
+    """
+    page = np.full((height, width), 255, dtype=np.uint8)
+    for y in range(40, height - 10, 40):
+        x = 10
+        while True:
+            word = "".join(rng.choice(list(LETTERS), rng.integers(2, 9)))
+            (w, h), _ = cv.getTextSize(word, cv.FONT_HERSHEY_SIMPLEX, 0.8, 2)
+            if x + w >= width:
+                break
+            cv.putText(page, word, (x, y), cv.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+            x += w + rng.integers(15, 30)
+    binary = cv.threshold(page, 127, 255, cv.THRESH_BINARY_INV)[1]
+    return wx.dilate(binary)
+
+def contours(dilated):
+    words = wx.extractWords(wx.extractLines(wx.contourApx(dilated)))
+    return [[cv.boundingRect(cnt) for cnt in line] for line in words]
+
+def components(dilated):
+    return readorder.readingOrder(wx.componentStats(dilated)[0])
+
+def bench(name, pages, repeat):
+    a = min(timeit.repeat(lambda: [contours(p) for p in pages], number=1, repeat=repeat))
+    b = min(timeit.repeat(lambda: [components(p) for p in pages], number=1, repeat=repeat))
+    words = sum(len(np.concatenate(components(p))) for p in pages)
+    pixels = sum(p.size for p in pages) / 1e6
+    print(f"{name:<30}{pixels:>8.1f}{words:>8}{a * 1000:>14.2f}{b * 1000:>16.2f}{a / b:>10.1f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [os.path.join(ENGINE_DIR, "images", "test_sample.jpg"),
+               os.path.join(ENGINE_DIR, "data", "images", "test_sample.jpeg")]
+    samples = [wx.dilate(wx.preprocess(util.readImage(p))) for p in samples]
+
+    rng = np.random.default_rng(0)
+    print(f"{'input':<30}{'Mpx':>8}{'words':>8}{'contours ms':>14}{'components ms':>16}{'speedup':>11}")
+    bench("sample images", samples, args.repeat)
+    # Letter, A4 at 300 dpi and twice that
+    for width, height in ((1275, 1650), (2480, 3508), (4960, 7016)):
+        bench(f"dense scan {width}x{height}", [syntheticScan(width, height, rng)], args.repeat)
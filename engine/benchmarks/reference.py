@@ -0,0 +1,123 @@
+"""
+@file reference.py Reference implementations shared by the benchmarks and the tests.
+
+The original per column loops of the `charseg` projection profile steps, which
+the array based functions must match (see `bench_charseg.py`), the sample
+inputs they are compared on, and the synthetic pages of word boxes of the
+reading order (see `bench_readorder.py`).
+"""
+import os
+import numpy as np
+
+import util
+import wordext
+import charseg as cs
+
+ENGINE_DIR = os.path.dirname(util.__file__)
+WORD_DIR = os.path.join(ENGINE_DIR, "images", "words", "test_sample")
+PAGES = [os.path.join(ENGINE_DIR, "images", "test_sample.jpg"),
+         os.path.join(ENGINE_DIR, "data", "images", "test_sample.jpeg")]
+
+# ---------- Reference Implementation - Begin ----------
+def binarizeCount(pixels, min=0, max=1000, threshold=20):
+    binary = np.zeros(len(pixels))
+    for i, px in enumerate(pixels):
+        if px > threshold:
+            binary[i] = max
+        else:
+            binary[i] = min
+    return binary
+
+def getPeaks(binary):
+    peaks, widths, found, leftEnd = [], [], False, -1
+    max = np.max(binary)
+    for i in range(len(binary)):
+        if binary[i] == max:
+            if found == True:
+                continue
+            found = True
+            leftEnd = i
+        else:
+            if found == True:
+                peaks.append((leftEnd, i))
+                widths.append(i-leftEnd)
+                found = False
+    return (peaks, widths)
+
+def flagged(widths, k = 0.5):
+    flags, avg = [], np.mean(widths) if len(widths) else 0
+    for w in widths:
+        if w > avg * k:
+            flags.append(1)
+        else:
+            flags.append(0)
+    return flags
+
+def merge(candidates, peaks, binary):
+    max = np.max(binary)
+    for i, j in candidates:
+        x1, x2 = peaks[i][1], peaks[j][0]
+        for x in range(x1, x2 + 1):
+            binary[x] = max
+    return binary
+
+def troughs(peaks):
+    troughs = []
+    for i in range(len(peaks) - 1):
+        x1, x2 = peaks[i][1], peaks[i + 1][0]
+        troughs.append(int((x1 + x2) / 2))
+    return troughs
+
+def ridFalsePSC(troughs, pixels, threshold = 1):
+    psc = []
+    for v in troughs:
+        if pixels[int(v)] > threshold:
+            continue
+        psc.append(int(v))
+    return psc
+
+def referencePSC(pixels):
+    """
+    Original PSC computation from a vertical pixel count.
+    """
+    binary = binarizeCount(pixels)
+    peaks, widths = getPeaks(binary)
+    candidates = cs.enumeration(peaks, flagged(widths))
+    n_peaks, n_widths = getPeaks(merge(candidates, peaks, binary))
+    return ridFalsePSC(troughs(n_peaks), pixels)
+# ---------- Reference Implementation - End ----------
+
+def vectorizedPSC(pixels):
+    binary = cs.binarizeCount(pixels)
+    peaks, widths = cs.getPeaks(binary)
+    candidates = cs.enumeration(peaks, cs.flagged(widths))
+    n_peaks, n_widths = cs.getPeaks(cs.merge(candidates, peaks, binary))
+    return cs.ridFalsePSC(cs.troughs(n_peaks), pixels)
+
+def samplePixelCounts():
+    """
+    Vertical pixel counts of every sample word image.
+    """
+    words = [util.readImage(os.path.join(WORD_DIR, f)) for f in sorted(os.listdir(WORD_DIR))]
+    for page in PAGES:
+        words += [w for line in wordext.main(page) for w in line]
+    return [cs.pixelCount(cs.preprocess(w)) for w in words]
+
+# ---------- Synthetic Pages ----------
+def page(lines=5, words=8, height=20, pitch=40, slope=0.0, rng=None):
+    """
+    Word boxes of a synthetic page, with the line and word of every box.
+    """
+    rng = rng or np.random.default_rng(0)
+    boxes, truth = [], []
+    for i in range(lines):
+        x = 10
+        for j in range(words):
+            w = int(rng.integers(20, 80))
+            h = int(rng.integers(height - 4, height + 4))
+            y = int(30 + i * pitch + slope * x - h / 2)
+            boxes.append((x, y, w, h))
+            truth.append((i, j))
+            x += w + int(rng.integers(8, 20))
+    order = rng.permutation(len(boxes))
+    return np.array(boxes, dtype=np.int32)[order], [truth[k] for k in order]
@@ -0,0 +1,241 @@
+"""
+@file bulk.py Batch OCR of folders, globs and multi-page files.
+
+The OpenCV stages (word extraction and character segmentation) of every file
+run in a pool of processes, one per core, while the parent process holds the
+one classifier and classifies the characters of a window of files at once.
+Results are written as JSON lines in input order, one line per file:
+
+    {"file": ..., "pages": ["<text of page 1>", ...], "chars": ...,
+     "segment_s": ..., "classify_s": ..., "error": null}
+
+A file that cannot be read or processed gets its `error` set and does not
+affect the other files, even when it takes its pool process down with it (out
+of memory on a huge TIFF): the pool is then recreated. At most about twice a
+window of files is segmented ahead of the classification, so memory does not
+grow with the number of files.
+
+Usage: python bulk.py <dir | glob | file> ... [--out results.jsonl]
+       [--workers N] [--window N] [--model <model>]
+"""
+import os
+import sys
+import json
+import glob
+import time
+import contextlib
+import collections
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2 as cv
+
+import util
+import wordext as wx
+import main as Main
+import charclf as cf
+
+EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+# Files whose characters are classified together
+WINDOW = 8
+# Intermediate images of the word extraction, reused by each pool process
+_buffers = {}
+
+# ---------- Inputs - Begin ----------
+def expandInputs(inputs):
+    """
+    Expands directories (their images, sorted by name) and glob patterns.
+
+    :param inputs: {list} Directories, glob patterns or file locations
+    :return: {list} Image file locations in input order
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += [os.path.join(item, f) for f in sorted(os.listdir(item))
+                      if f.lower().endswith(EXTENSIONS)]
+        elif glob.has_magic(item):
+            files += sorted(glob.glob(item))
+        else:
+            files.append(item)
+    return files
+
+def readPages(imageLocation):
+    """
+    Reads every page of an image file (multi-page TIFF files have several).
+
+    :param imageLocation: {string} Location of the image file
+    :return: {list} Pages as numpy arrays
+    """
+    if imageLocation.lower().endswith((".tif", ".tiff")):
+        ok, pages = cv.imreadmulti(imageLocation, flags=cv.IMREAD_COLOR)
+        pages = list(pages) if ok else []
+    else:
+        image = util.readImage(imageLocation)
+        pages = [] if image is None else [image]
+    if len(pages) == 0:
+        raise ValueError(f"Could not read image: {imageLocation}")
+    return pages
+# ---------- Inputs - End ----------
+
+# ---------- Segmentation (pool processes) ----------
+def segmentFile(imageLocation):
+    """
+    Runs the OpenCV stages on every page of a file. Executed in the pool.
+
+    :param imageLocation: {string} Location of the image file
+    :return: {dict} Words per line of each page, characters with their
+    (page, line, word) and the time taken, or the error message
+    """
+    start = time.perf_counter()
+    try:
+        shapes, chars, index = [], [], []
+        for p, page in enumerate(readPages(imageLocation)):
+            lines = wx.extract(page, _buffers)
+            pageChars, pageIndex = Main.segmentWords(lines)
+            shapes.append([len(line) for line in lines])
+            chars += pageChars
+            index += [(p, i, j) for i, j in pageIndex]
+    except Exception as e:
+        return {"file": imageLocation, "error": f"{type(e).__name__}: {e}",
+                "segment_s": time.perf_counter() - start}
+    return {"file": imageLocation, "shapes": shapes, "chars": chars, "index": index,
+            "segment_s": time.perf_counter() - start}
+
+def _segmentAlone(imageLocation, ctx):
+    # Runs one file in a process of its own, after a pool process died: the
+    # file is only marked failed if it takes this process down as well
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as single:
+        try:
+            return single.submit(segmentFile, imageLocation).result()
+        except BrokenProcessPool:
+            return {"file": imageLocation, "segment_s": time.perf_counter() - start,
+                    "error": "BrokenProcessPool: the segmentation process died (out of memory?)"}
+
+# ---------- Classification (parent process) ----------
+def classifyWindow(model, results):
+    """
+    Classifies the characters of a window of segmented files together and
+    turns each of them into its output record.
+
+    :param model: Loaded classifier
+    :param results: {list} Results of `segmentFile`
+    :return: {list} Output records, in the same order
+    """
+    done = [r for r in results if "error" not in r]
+    chars = [c for r in done for c in r["chars"]]
+
+    start = time.perf_counter()
+    labels = cf.extractText(cf.predict(model, chars)) if chars else ""
+    elapsed = time.perf_counter() - start
+
+    records, offset = [], 0
+    for r in results:
+        if "error" in r:
+            records.append({"file": r["file"], "pages": None, "chars": 0,
+                            "segment_s": r["segment_s"], "classify_s": 0.0, "error": r["error"]})
+            continue
+
+        n = len(r["chars"])
+        words = [[["" for _ in range(count)] for count in shape] for shape in r["shapes"]]
+        Main.scatterLabels(words, r["index"], labels[offset:offset + n])
+        offset += n
+
+        records.append({"file": r["file"], "pages": [Main.layoutText(w) for w in words],
+                        "chars": n, "segment_s": r["segment_s"],
+                        # The window's classification time shared by characters
+                        "classify_s": elapsed * n / len(chars) if chars else 0.0,
+                        "error": None})
+    return records
+
+# ---------- Wrapper - Begin ----------
+def run(files, out, model, workers=None, window=WINDOW):
+    """
+    OCRs the given files, writing one JSON line per file to `out` in order.
+
+    :param files: {list} Image file locations
+    :param out: {file} Text stream to write the JSON lines to
+    :param model: Loaded classifier
+    :param workers: {integer} Segmentation processes (one per core by default)
+    :param window: {integer} Files whose characters are classified together
+    :return: {dict} Files processed, failed, characters and total time
+    """
+    start = time.perf_counter()
+    summary = {"files": 0, "failed": 0, "chars": 0}
+    workers = workers or os.cpu_count()
+    # Files segmented ahead of the classification (their crops wait in memory)
+    ahead = max(2 * window, workers)
+    # Spawned rather than forked: the parent may already run TensorFlow threads
+    ctx = mp.get_context("spawn")
+    files, queue, pending = collections.deque(files), collections.deque(), []
+    pool = None
+    try:
+        while files or queue:
+            try:
+                pool = pool or ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+                while files and len(queue) < ahead:
+                    queue.append((files[0], pool.submit(segmentFile, files[0])))
+                    files.popleft()
+                # Results are taken in input order while the pool works on the next files
+                result = queue[0][1].result()
+                queue.popleft()
+            except BrokenProcessPool:
+                # A process died and took every queued file with it, any of them may be the
+                # cause: they go back in line and the first one runs alone
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = None
+                files.extendleft(reversed([f for f, _ in queue]))
+                queue.clear()
+                result = _segmentAlone(files.popleft(), ctx)
+
+            pending.append(result)
+            if len(pending) >= window:
+                _write(out, classifyWindow(model, pending), summary)
+                pending = []
+        if pending:
+            _write(out, classifyWindow(model, pending), summary)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def _write(out, records, summary):
+    for record in records:
+        out.write(json.dumps(record) + "\n")
+        summary["files"] += 1
+        summary["failed"] += record["error"] is not None
+        summary["chars"] += record["chars"]
+    out.flush()
+# ---------- Wrapper - End ----------
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Batch OCR of folders, globs and multi-page files")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns or image files")
+    parser.add_argument("--out", help="JSON lines output file (stdout by default)")
+    parser.add_argument("--workers", type=int, help="Segmentation processes (one per core by default)")
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("--model", default=Main.MODEL)
+    args = parser.parse_args()
+
+    files = expandInputs(args.inputs)
+    # Keeps stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        model = cf.load(args.model)
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        summary = run(files, out, model, args.workers, args.window)
+    finally:
+        if args.out:
+            out.close()
+
+    rate = summary["chars"] / summary["seconds"] if summary["seconds"] > 0 else 0.0
+    print(f"{summary['files']} files ({summary['failed']} failed), {summary['chars']} characters "
+          f"in {summary['seconds']:.2f}s ({rate:.1f} chars/sec)", file=sys.stderr)
+    exit(1 if summary["failed"] else 0)
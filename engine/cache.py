@@ -0,0 +1,191 @@
+"""
+@file cache.py Content addressed cache of recognition results.
+
+The same forms and scans are submitted again and again. Results are cached by
+a hash of the decoded image (not the file, so re-encoded uploads still hit)
+together with the model identifier and the pipeline version:
+
+    * Page level: the text of a whole image is returned without any work.
+    * Word level: identical word images (headers, printed labels) skip
+      character segmentation and classification.
+
+Each level is an LRU bounded by bytes, optionally backed by an SQLite file so
+that the results survive restarts.
+"""
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Memory budget of the page and word levels together
+MAX_BYTES = 64 * 2 ** 20
+# Budget of the on-disk store
+MAX_DISK_BYTES = 512 * 2 ** 20
+# Rough per entry bookkeeping overhead, in bytes
+OVERHEAD = 100
+
+# ---------- Hashing ----------
+def digest(image, *params):
+    """
+    Hashes the pixels of an image together with the given parameters.
+
+    :param image: {numpy array} Decoded image
+    :param params: Anything that changes the result for the same pixels
+    :return: {string} Hex digest
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((image.shape, image.dtype.str, params)).encode("utf-8"))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+# ---------- Result Cache - Begin ----------
+class ResultCache:
+    """
+    String results by key, evicting the least recently used ones once
+    `max_bytes` is exceeded. With a `path` the entries are also written to an
+    SQLite database (bounded by `max_disk_bytes`), which is read on misses.
+
+    :param max_bytes: {integer} Memory budget
+    :param path: {string} SQLite database location (memory only if None)
+    :param table: {string} Table holding this cache in the database
+    :param max_disk_bytes: {integer} Budget of the table in the database
+    """
+    def __init__(self, max_bytes=MAX_BYTES, path=None, table="results",
+                 max_disk_bytes=MAX_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.table = table
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} "
+                            "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)")
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_used ON {table} (used)")
+            self.db.commit()
+
+    @staticmethod
+    def _size(key, value):
+        return len(key) + len(value.encode("utf-8")) + OVERHEAD
+
+    def _remember(self, key, value):
+        # Inserts into the memory LRU, lock must be held
+        if key in self.entries:
+            self.bytes -= self._size(key, self.entries.pop(key))
+        self.entries[key] = value
+        self.bytes += self._size(key, value)
+        while self.bytes > self.max_bytes and self.entries:
+            k, v = self.entries.popitem(last=False)
+            self.bytes -= self._size(k, v)
+
+    def get(self, key):
+        """
+        :param key: {string} Key of the result
+        :return: {string} Cached result, None on a miss
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            value = None
+            if self.db is not None:
+                row = self.db.execute(f"SELECT value FROM {self.table} WHERE key = ?",
+                                      (key,)).fetchone()
+                if row is not None:
+                    value = row[0]
+                    self.db.execute(f"UPDATE {self.table} SET used = ? WHERE key = ?",
+                                    (time.time(), key))
+                    self.db.commit()
+                    self._remember(key, value)
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores a result, evicting old ones to stay within budget.
+
+        :param key: {string} Key of the result
+        :param value: {string} Result to cache
+        """
+        with self.lock:
+            self._remember(key, value)
+            if self.db is None:
+                return
+            size = self._size(key, value)
+            self.db.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                            (key, value, size, time.time()))
+            total = self.db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total > self.max_disk_bytes:
+                # Drops the least recently used entries, about a tenth of the budget at once
+                self.db.execute(f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+                                f"(SELECT key, SUM(size) OVER (ORDER BY used) AS running "
+                                f"FROM {self.table}) WHERE running <= ?)",
+                                (total - self.max_disk_bytes * 0.9,))
+            self.db.commit()
+
+    def stats(self):
+        """
+        :return: {dict} Hits, misses, hit rate, entries and bytes held in memory
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+            }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+# ---------- Result Cache - End ----------
+
+# ---------- OCR Cache - Begin ----------
+class OCRCache:
+    """
+    The page and word level caches used by `main.recognize` / `main.transcribe`.
+
+    :param model: {string or callable} Identifier of the model in use. A callable
+    is asked on every lookup, so that a reloaded model does not see old results.
+    :param pipeline: {string} Version of the segmentation pipeline
+    :param max_bytes: {integer} Memory budget of both levels together
+    :param path: {string} SQLite database location (memory only if None)
+    """
+    def __init__(self, model, pipeline, max_bytes=MAX_BYTES, path=None):
+        self.model = model
+        self.pipeline = pipeline
+        self.pages = ResultCache(max_bytes // 4, path, "pages")
+        self.words = ResultCache(max_bytes - max_bytes // 4, path, "words")
+
+    def _namespace(self):
+        model = self.model() if callable(self.model) else self.model
+        return (model, self.pipeline)
+
+    def pageKey(self, image):
+        return digest(image, "page", *self._namespace())
+
+    def wordKey(self, word):
+        return digest(word, "word", *self._namespace())
+
+    def stats(self):
+        return {"pages": self.pages.stats(), "words": self.words.stats()}
+
+    def close(self):
+        self.pages.close()
+        self.words.close()
+# ---------- OCR Cache - End ----------
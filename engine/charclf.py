@@ -10,37 +10,387 @@ model as a classifier and classifying is as simple as calling the
 # ---------- Necessary Libraries - Begin ----------
 import os
 import sys
+import time
+import threading
 import util
+import profiler
+import numpy as np
 import charseg as cs
 
 # MODEL_PATH = "models/20210420-06461618901219-all-images-Adam.h5"
 MODEL_PATH = "models/20210427-03301619494256-final-train.h5"
 CHAR_DIR = cs.CHAR_DIR
+# Characters per model call, a few per core keeps every core busy
+BATCH_SIZE = min(64, 8 * (os.cpu_count() or 1))
+# Characters preprocessed at once (~600 KB each as 224x224x3 float32, 4 KB
+# for a 32x32 grayscale classifier)
+MAX_INFLIGHT = 256
+# Batch sizes the compiled classifier is traced for, batches are padded up to one
+BUCKETS = (1, 8, 16, 32, 64)
+# Characters the fast model of a `Cascade` is less confident about go to the heavy one
+THRESHOLD = 0.9
+# ---------- Model Backends - Begin ----------
+class TFLiteModel:
+    """
+    Runs an exported (see `export.py`) TensorFlow Lite classifier behind the
+    same `predict` method as the Keras model. Uses the standalone
+    `tflite_runtime` package when installed, TensorFlow's interpreter otherwise.
+
+    :param path: {string} Location of the `.tflite` model
+    :param threads: {integer} CPU threads used by the interpreter
+    """
+    def __init__(self, path, threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=path, num_threads=threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(int(d) for d in self.input["shape"][1:])
+        self.size = None
+        self.lock = threading.Lock()
+
+    def _invoke(self, batch):
+        if self.size != len(batch):
+            self.interpreter.resize_tensor_input(self.input["index"], batch.shape)
+            self.interpreter.allocate_tensors()
+            self.size = len(batch)
+        self.interpreter.set_tensor(self.input["index"], batch.astype(self.input["dtype"]))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output["index"]).copy()
+
+    def predict(self, batch, batch_size=BATCH_SIZE, verbose=0):
+        """
+        Predicts the given batch `batch_size` images at a time.
+
+        :param batch: {numpy array} Model input of shape (N, IMG_SIZE, IMG_SIZE, 3)
+        :return: {numpy array} Prediction probabilities of shape (N, 26)
+        """
+        batch_size = batch_size or BATCH_SIZE
+        with self.lock:
+            return np.concatenate([self._invoke(batch[i:i + batch_size])
+                                   for i in range(0, len(batch), batch_size)])
+
+class CompiledModel:
+    """
+    Runs a Keras classifier through a `tf.function` with a fixed input
+    signature per batch size bucket, behind the same `predict` method.
+
+    `model.predict` goes through Keras' data adapters on every call and the
+    first calls after loading are much slower than the following ones. Here
+    batches are padded up to the nearest of a few bucket sizes, each traced
+    once, so that after `warmup` no call traces or builds anything anymore.
+
+    :param model: {keras model} Loaded classifier
+    :param buckets: {tuple} Batch sizes to trace, larger batches are split
+    """
+    def __init__(self, model, buckets=BUCKETS):
+        import tensorflow as tf
+
+        self.model = model
+        self.buckets = tuple(sorted(buckets))
+        self.input_shape = tuple(model.input_shape)
+        self.shape = self.input_shape[1:]
+        self.forward = tf.function(lambda batch: model(batch, training=False))
+        self.functions = {}
+        self.lock = threading.Lock()
+
+    def _function(self, size):
+        # Traced on first use (or by `warmup`)
+        function = self.functions.get(size)
+        if function is None:
+            import tensorflow as tf
+            with self.lock:
+                function = self.functions.get(size)
+                if function is None:
+                    spec = tf.TensorSpec((size,) + self.shape, tf.float32)
+                    function = self.functions[size] = self.forward.get_concrete_function(spec)
+        return function
+
+    def _invoke(self, batch):
+        n = len(batch)
+        size = next(b for b in self.buckets if b >= n)
+        if size != n:
+            padding = np.zeros((size - n,) + self.shape, dtype=np.float32)
+            batch = np.concatenate([batch, padding])
+        return self._function(size)(batch.astype(np.float32, copy=False)).numpy()[:n]
+
+    def warmup(self, repeat=3):
+        """
+        Traces every bucket and runs it until it reaches its steady latency.
+
+        :param repeat: {integer} Warm calls timed per bucket
+        :return: {dict} Bucket -> {"cold_ms": trace and first call, "warm_ms":
+        fastest of the following calls}
+        """
+        report = {}
+        for size in self.buckets:
+            batch = np.zeros((size,) + self.shape, dtype=np.float32)
+            start = time.perf_counter()
+            self._invoke(batch)
+            cold = time.perf_counter() - start
+            warm = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                self._invoke(batch)
+                warm.append(time.perf_counter() - start)
+            report[size] = {"cold_ms": cold * 1000, "warm_ms": min(warm) * 1000}
+        return report
+
+    def predict(self, batch, batch_size=BATCH_SIZE, verbose=0):
+        """
+        Predicts the given batch at most `batch_size` (and the largest bucket)
+        images at a time.
+
+        :param batch: {numpy array} Model input of shape (N, IMG_SIZE, IMG_SIZE, 3)
+        :return: {numpy array} Prediction probabilities of shape (N, 26)
+        """
+        step = min(batch_size or BATCH_SIZE, self.buckets[-1])
+        if len(batch) == 0:
+            return np.zeros((0, 26), dtype=np.float32)
+        return np.concatenate([self._invoke(batch[i:i + step]) for i in range(0, len(batch), step)])
+
+def configureThreads(threads, inter=1):
+    """
+    Limits the CPU threads of TensorFlow, so that several engine processes on
+    one host do not oversubscribe its cores. Has to be called before
+    TensorFlow runs anything in the process.
+
+    :param threads: {integer} Threads working on one operation (intra-op)
+    :param inter: {integer} Operations run in parallel (inter-op)
+    """
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        print(f"TensorFlow threads already set up, keeping them: {e}", file=sys.stderr)
+
+def load(path, threads=None, warm=False, buckets=BUCKETS):
+    """
+    Loads the classifier with the backend matching the file: TensorFlow Lite
+    for `.tflite` models, Keras (compiled per batch size bucket, see
+    `CompiledModel`) for anything else.
+
+    :param path: {string} Location of the model
+    :param threads: {integer} CPU threads of the model (all cores if None)
+    :param warm: {bool} Trace and run every bucket before returning (long
+    lived processes), otherwise buckets are traced on first use
+    :param buckets: {tuple} Batch sizes of the compiled model, None for the plain Keras model
+    :return: Model with a Keras like `predict` method
+    """
+    with profiler.stage("model.load"):
+        if path.endswith(".tflite"):
+            print(f"Loading TFLite model from: {path}")
+            return TFLiteModel(path, threads)
+        if threads:
+            configureThreads(threads)
+        model = util.load_model(path)
+        if not buckets:
+            return model
+        model = CompiledModel(model, buckets)
+    if warm:
+        with profiler.stage("model.warmup"):
+            for size, r in model.warmup().items():
+                print(f"Batch of {size}: {r['cold_ms']:.1f} ms cold, {r['warm_ms']:.1f} ms warm",
+                      file=sys.stderr)
+    return model
+# ---------- Model Backends - End ----------
+
+def inputShape(model):
+    """
+    Input size and channels of a classifier (the 224x224 RGB input of the
+    hub model unless the model, or the wrapper around it, tells otherwise).
+
+    :param model: Model with a Keras like `predict` method
+    :return: {tuple} (size {integer}, channels {integer})
+    """
+    shape = getattr(model, "input_shape", None)
+    if shape is None:
+        return util.IMG_SIZE, 3
+    return shape[1], shape[3]
+
 # ---------- Extracting Text from Predictions ----------
 def extractText(predictions):
-    text = ""
-    for pred in predictions:
-        char = util.get_pred_label(pred)
-        text += char
-    return text
+    return util.decodeLabels(predictions)
+
+# ---------- In-Memory Classification ----------
+def predict(model, chars, batch_size=BATCH_SIZE, max_inflight=MAX_INFLIGHT):
+    """
+    Runs the model over any number of character images. The images are
+    preprocessed `max_inflight` at a time to bound memory and fed to the
+    model in batches of `batch_size`.
+
+    :param model: {keras model} Loaded character classifier
+    :param chars: {list} Character images (numpy arrays)
+    :param batch_size: {integer} Characters per model call
+    :param max_inflight: {integer} Characters preprocessed at once
+    :return: {numpy array} Prediction probabilities of shape (N, 26)
+    """
+    if isinstance(model, Cascade):
+        return model.predictCrops(chars, batch_size, max_inflight)
+
+    size, channels = inputShape(model)
+    predictions = []
+    for i in range(0, len(chars), max_inflight):
+        with profiler.stage("charclf.preprocess"):
+            batch = util.create_image_batch(chars[i:i + max_inflight], size, channels)
+        with profiler.stage("model.predict"):
+            predictions.append(model.predict(batch, batch_size=batch_size, verbose=0))
+        profiler.count("model.calls", -(-len(batch) // batch_size))
+        profiler.count("model.chars", len(batch))
+
+    if len(predictions) == 0:
+        return np.zeros((0, 26), dtype=np.float32)
+    return np.concatenate(predictions)
+
+# ---------- Cascade - Begin ----------
+class Cascade:
+    """
+    Classifies every character with a fast model (e.g. a small classifier, see
+    `smallclf.py`) and only those whose top-1 probability is below the
+    threshold with the heavy model, all of them together in batches. Used in
+    place of a model by `predict` (and by `main.transcribe` in turn).
+
+    :param fast: Model with a Keras like `predict` method, run on every character
+    :param heavy: Model with a Keras like `predict` method, run on the escalated ones
+    :param threshold: {float} Least top-1 probability accepted from the fast model
+    """
+    def __init__(self, fast, heavy, threshold=THRESHOLD):
+        self.fast = fast
+        self.heavy = heavy
+        self.threshold = threshold
+        self.chars = 0
+        self.escalated = 0
+        self.lock = threading.Lock()
+
+    def predictCrops(self, chars, batch_size=BATCH_SIZE, max_inflight=MAX_INFLIGHT):
+        """
+        :param chars: {list} Character images (numpy arrays)
+        :return: {numpy array} Prediction probabilities of shape (N, 26), the
+        heavy model's for the escalated characters
+        """
+        with profiler.stage("cascade.fast"):
+            predictions = predict(self.fast, chars, batch_size, max_inflight)
+        escalate = np.flatnonzero(predictions.max(axis=1) < self.threshold)
+        if len(escalate):
+            with profiler.stage("cascade.heavy"):
+                predictions[escalate] = predict(self.heavy, [chars[i] for i in escalate],
+                                                batch_size, max_inflight)
+
+        profiler.count("cascade.escalated", len(escalate))
+        with self.lock:
+            self.chars += len(chars)
+            self.escalated += len(escalate)
+        return predictions
+
+    def stats(self):
+        """
+        :return: {dict} Characters classified, escalated and the escalation rate so far
+        """
+        with self.lock:
+            return {"chars": self.chars, "escalated": self.escalated,
+                    "rate": self.escalated / self.chars if self.chars else 0.0}
+# ---------- Cascade - End ----------
+
+def classify(model, chars, batch_size=BATCH_SIZE, max_inflight=MAX_INFLIGHT):
+    """
+    Classifies the given character images without writing them to disk.
+
+    :param model: {keras model} Loaded character classifier
+    :param chars: {list} Character images (numpy arrays) in reading order
+    :return: {string} String representation of the classified characters
+    """
+    return extractText(predict(model, chars, batch_size, max_inflight))
+
+# ---------- Ordered Crops - Begin ----------
+def readManifest(path):
+    """
+    Reads a manifest: the character image files to classify, one per line in
+    reading order, relative to the folder of the manifest. Blank lines and
+    lines starting with `#` are skipped.
+
+    :param path: {string} Location of the manifest
+    :return: {list} Locations of the character images, in order
+    """
+    folder = os.path.dirname(path)
+    with open(path) as f:
+        names = [line.strip() for line in f]
+    return [os.path.join(folder, n) for n in names if n and not n.startswith("#")]
+
+def sortedCrops(folder):
+    """
+    Character images of a folder without manifest, in the order of their
+    numbered names (`2.png` before `10.png`).
+
+    :param folder: {string} Folder of `<index>.png` character images
+    :return: {list} Locations of the character images, in order
+    """
+    def index(name):
+        stem = os.path.splitext(name)[0]
+        return (0, int(stem), name) if stem.isdigit() else (1, 0, name)
+    names = [n for n in os.listdir(folder) if n.lower().endswith((".png", ".jpg", ".jpeg"))]
+    return [os.path.join(folder, n) for n in sorted(names, key=index)]
+
+def orderedCrops(manifest=None, folder=CHAR_DIR):
+    """
+    Character images to classify: those of the given manifest, by default
+    those of the manifest of `folder` or, without one, its numbered images.
+
+    :param manifest: {string} Location of the manifest
+    :param folder: {string} Folder of the saved word when no manifest is given
+    :return: {list} Locations of the character images, in order
+    """
+    if manifest is not None:
+        return readManifest(manifest)
+    manifest = os.path.join(folder, cs.MANIFEST)
+    return readManifest(manifest) if os.path.exists(manifest) else sortedCrops(folder)
+
+def iterClassify(model, crops, batch_size=BATCH_SIZE, max_inflight=MAX_INFLIGHT):
+    """
+    Streams character images through the model, `max_inflight` at a time,
+    without holding all of them. Results come in the order of the input.
+
+    :param model: {keras model} Loaded character classifier
+    :param crops: {iterable} Character images, or (key, image) pairs; the key
+    of a bare image is its position in the input
+    :return: Generator of (key, label, confidence) tuples
+    """
+    def flush(pending):
+        predictions = predict(model, [c for k, c in pending], batch_size, max_inflight)
+        labels = util.decodeLabels(predictions)
+        for (key, c), label, confidence in zip(pending, labels, predictions.max(axis=1)):
+            yield key, label, float(confidence)
+
+    pending = []
+    for i, item in enumerate(crops):
+        pending.append(item if isinstance(item, tuple) else (i, item))
+        if len(pending) == max_inflight:
+            yield from flush(pending)
+            pending = []
+    if pending:
+        yield from flush(pending)
+# ---------- Ordered Crops - End ----------
 
 # ---------- Wrapper Function - Begin ----------
-def main(model):
+def main(model, manifest=None):
     """
     A wrapper function for all the methods of the module. This function
-    performs text classification on the given image list.
+    performs text classification on the character images listed by a manifest,
+    by default the one of the word saved in CHAR_DIR (see
+    `charseg.main(image, save=True)`).
 
+    :param manifest: {string} Location of the manifest
     :return: {string} String representation of the classified image text
     """
-    # Getting character file path
-    imageFiles = [CHAR_DIR + imFile for imFile in os.listdir(CHAR_DIR)]
-    # Creating batches of data
-    data_batch = util.create_data_batches(imageFiles, test_data=True)
+    # Getting character file paths in order
+    imageFiles = orderedCrops(manifest)
 
-    # Making Predictions
-    predictions = model.predict(data_batch)
-    # Extracting text out of predictions
-    text = extractText(predictions)
+    # Classifying the characters
+    text = classify(model, [util.readImage(f) for f in imageFiles])
 
     return text
 # ---------- Wrapper Function - End ----------
@@ -51,17 +401,24 @@ if __name__ == "__main__":
     This module when used as a standalone application, displays the text of the image
     as a string on the terminal.
     """
-    print(f"Caution: Standalone usage of the module!!!")
-    # If ImageLocation not passed as an argument to the module call.
-    if len(sys.argv) != 1:
-        print(f"Critical Error: Argument Error!")
-        print(f"Usage: {sys.argv[0]}")
-        exit(1)
-    # Loading the model
-    model = util.load_model(MODEL_PATH)
-    text = main(model)
-    print(f"Resulting text: " + text)
-
+    import json
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Classify character images in order")
+    parser.add_argument("--manifest", help="Character images to classify, one per line "
+                                           f"(default: the word saved in {CHAR_DIR})")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--jsonl", action="store_true",
+                        help="Print the label and confidence of every character as JSON lines")
+    args = parser.parse_args()
 
+    # Loading the model
+    model = load(args.model)
+    if args.jsonl:
+        crops = ((f, util.readImage(f)) for f in orderedCrops(args.manifest))
+        for key, label, confidence in iterClassify(model, crops):
+            print(json.dumps({"file": key, "label": label, "confidence": confidence}))
+        exit(0)
 
+    text = main(model, args.manifest)
+    print(f"Resulting text: " + text)
@@ -12,12 +12,14 @@ implementation of the `Efficient Character Segmentation` Algorithm proposed in
 import os
 import sys
 import util
+import profiler
 import cv2 as cv
 import numpy as np
-import matplotlib.pyplot as plt
 # ---------- Necessary Imports - Ends ----------
 
 CHAR_DIR = "images/chars/saved/"
+# Lists the characters of the last saved word, in order (see `main`)
+MANIFEST = "manifest.txt"
 
 # ---------- PreProcessing Image - Begin ----------
 def preprocess(image):
@@ -29,17 +31,14 @@ def preprocess(image):
     :param image: {numpy array} Image to preprocess
     :return: {numpy array} PreProcessed image
     """
+    # Rescaling (shared with the segmentation, see `segment`)
+    rescaled = util.resized(image, util.reshape(image, width=512),\
+                            interpolation=cv.INTER_CUBIC)
     # ColorSpace Conversion
-    if len(image.shape) > 2:
-        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-    else:
-        gray = image
-
-    # Rescaling
-    rescaled = util.rescaleImage(gray, util.reshape(gray, height=512),\
-                                 interpolation=cv.INTER_CUBIC)
+    gray = util.toGray(rescaled)
+
     # Noise Reduction
-    blur = cv.GaussianBlur(rescaled, (5, 5), 0)
+    blur = cv.GaussianBlur(gray, (5, 5), 0)
     # Image Thresholding
     thresh = cv.adaptiveThreshold(blur, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C,\
                                   cv.THRESH_BINARY_INV, 11, 2)
@@ -77,14 +76,7 @@ def binarizeCount(pixels, min=0, max=1000, threshold=20):
 
     :return: {numpy array} binarized pixel count of the image
     """
-    binary = np.zeros(len(pixels))
-    for i, px in enumerate(pixels):
-        if px > threshold:
-            binary[i] = max
-        else:
-            binary[i] = min
-
-    return binary
+    return np.where(np.asarray(pixels) > threshold, max, min).astype(np.float64)
 # ---------- Pixel Count Graph Formation - End ----------
 
 # ---------- Peak Extraction & Flagging - Begin ----------
@@ -96,20 +88,15 @@ def getPeaks(binary):
     :param binary: {numpy array} Binary pixel count of the given image
     :return: {tuple} (All peaks {list}, Peak Widths {list})
     """
-    peaks, widths, found, leftEnd = [], [], False, -1
-    max = np.max(binary)
-    for i in range(len(binary)):
-        if binary[i] == max:
-            if found == True:
-                continue
-            found = True
-            leftEnd = i
-        else:
-            if found == True:
-                peaks.append((leftEnd, i))
-                widths.append(i-leftEnd)
-                found = False
-
+    # Run starts (+1) and ends (-1) of the columns at the maximum value.
+    # A run still open at the last column is not a peak.
+    atMax = (binary == np.max(binary)).astype(np.int8)
+    edges = np.diff(atMax, prepend=0)
+    ends = np.flatnonzero(edges == -1)
+    starts = np.flatnonzero(edges == 1)[:len(ends)]
+
+    peaks = list(zip(starts.tolist(), ends.tolist()))
+    widths = (ends - starts).tolist()
     return (peaks, widths)
 
 def flagged(widths, k = 0.5):
@@ -120,14 +107,10 @@ def flagged(widths, k = 0.5):
     :param widths: {numpy array} Widths of each peaks
     :return: {numpy array} Flags for each of the corresponding peaks
     """
-    flags, avg = [], np.mean(widths)
-    for w in widths:
-        if w > avg * k:
-            flags.append(1)
-        else:
-            flags.append(0)
-
-    return flags
+    if len(widths) == 0:
+        return []
+    widths = np.asarray(widths)
+    return (widths > np.mean(widths) * k).astype(int).tolist()
 # ---------- Peak Extraction & Flagging - End ----------
 
 # ---------- Merging Peaks - Begin ----------
@@ -177,8 +160,7 @@ def merge(candidates, peaks, binary):
     max = np.max(binary)
     for i, j in candidates:
         x1, x2 = peaks[i][1], peaks[j][0]
-        for x in range(x1, x2 + 1):
-            binary[x] = max
+        binary[x1:x2 + 1] = max
     return binary
 # ---------- Merging Peaks - End ----------
 
@@ -191,11 +173,11 @@ def troughs(peaks):
     :param peaks: {list of tuples} List of end points for each peak
     :return: {list} List of troughs centre coordinate in the image
     """
-    troughs = []
-    for i in range(len(peaks) - 1):
-        x1, x2 = peaks[i][1], peaks[i + 1][0]
-        troughs.append(int((x1 + x2) / 2))
-    return troughs
+    if len(peaks) < 2:
+        return []
+    bounds = np.asarray(peaks)
+    # Centre between the end of each peak and the start of the next one
+    return ((bounds[:-1, 1] + bounds[1:, 0]) // 2).tolist()
 
 def ridFalsePSC(troughs, pixels, threshold = 1):
     """
@@ -209,15 +191,23 @@ def ridFalsePSC(troughs, pixels, threshold = 1):
 
     :return: {list} A list of true PSC values which could be used for image segmentation
     """
-    psc = []
-    for v in troughs:
-        if pixels[int(v)] > threshold:
-            continue
-        psc.append(int(v))
-    return psc
+    troughs = np.asarray(troughs, dtype=int)
+    return troughs[np.asarray(pixels)[troughs] <= threshold].tolist()
 # ---------- PSC Extraction - End ----------
 
 # ---------- Segmentation - Begin ----------
+def charSpans(psc, end):
+    """
+    Finds the column range of each character given the psc values. Repeated or
+    edge PSC values would produce empty ranges, which are not characters.
+
+    :param psc: {list} List of PSC values
+    :param end: {integer} Width of the segmented image
+    :return: {list of tuples} (start, end) columns of each character
+    """
+    edges = [0] + list(psc) + [end]
+    return [(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
 def charSeg(image, psc):
     """
     Segments the given image by the psc values.
@@ -225,18 +215,7 @@ def charSeg(image, psc):
     :param psc: {list} List of PSC values
     :return: {list} List of segmented characters as image
     """
-    begin, end = 0, image.shape[1]
-    print(end)
-
-    psc.append(end)
-    chars = []
-    for i in range(len(psc)):
-        if i == 0:
-            chars.append(image[:,begin:psc[i]])
-        else:
-            chars.append(image[:,psc[i-1]:psc[i]])
-
-    return chars
+    return [image[:, a:b] for a, b in charSpans(psc, image.shape[1])]
 
 # ---------- Segmentation - End ----------
 
@@ -267,13 +246,14 @@ def extractText(char):
 # ---------- Extraction - End ----------
 
 # ---------- Wrapper - Begin ----------
-def main(image):
+def segment(image):
     """
-    A Wrapper function for all the methods in the module. Performs all the
-    character segmentation steps sequentially.
+    Performs all the character segmentation steps sequentially, also returning
+    where each character was found.
 
     :param image: {numpy array} Image for which to segment characters
-    :return: {list} List of segmented character images
+    :return: {tuple} (characters {list of images}, their (start, end) columns
+    {list of tuples}, width of the image these columns refer to {integer})
     """
     # Preprocessing the image for better clarity
     preprocessed = preprocess(image)
@@ -300,25 +280,45 @@ def main(image):
     psc = ridFalsePSC(trough, pixels)
 
     # ## Displaying the image to be segmented with their positions
-    image_seg = util.rescaleImage(image, util.reshape(image, height=512), interpolation=cv.INTER_CUBIC)
+    image_seg = util.resized(image, util.reshape(image, width=512), interpolation=cv.INTER_CUBIC)
     # util.segmentImage(image_seg, psc)
 
     # Segmenting the image into individual characters
-    chars = charSeg(image_seg, psc)
+    spans = charSpans(psc, image_seg.shape[1])
+    chars = [image_seg[:, a:b] for a, b in spans]
     #
     # # Extraction of text
     # extractText(chars[0])
 
-
     # Displaying all characters
     # for char in chars:
     #     util.displayImage(char)
 
-    # Clearing Contents of directory
-    util.clearDir(CHAR_DIR)
-    # Saving all characters
-    for i,c in enumerate(chars):
-        cv.imwrite(CHAR_DIR + str(i) + ".png", c)
+    return chars, spans, image_seg.shape[1]
+
+@profiler.timed("charseg.main")
+def main(image, save=False, folder=CHAR_DIR):
+    """
+    A Wrapper function for all the methods in the module. Performs all the
+    character segmentation steps sequentially.
+
+    :param image: {numpy array} Image for which to segment characters
+    :param save: {bool} Also dump the characters as png in `folder` (for debugging)
+    :param folder: {string} Where to save the characters
+    :return: {list} List of segmented character images
+    """
+    chars, spans, width = segment(image)
+    profiler.count("chars", len(chars))
+
+    if save:
+        # Saving all characters, the manifest tells them apart from older files
+        # (see `charclf.readManifest`) so the folder need not be cleared
+        with profiler.stage("charseg.write"):
+            names = [str(i) + ".png" for i in range(len(chars))]
+            for name, c in zip(names, chars):
+                cv.imwrite(os.path.join(folder, name), c)
+            with open(os.path.join(folder, MANIFEST), "w") as f:
+                f.write("\n".join(names) + "\n")
 
     return chars
 
@@ -341,8 +341,8 @@ if __name__ == "__main__":
     # Reading Image from file
     image = util.readImage(imageLocation)
     # Finding all the different characters in the image
-    # Calling main saves the image as png in the character dir mentioned in this module
-    main(image)
+    # Saving the images as png in the character dir mentioned in this module
+    main(image, save=True)
     #
     # # Displaying all the characters one by one
     # for i, c in enumerate(characters):
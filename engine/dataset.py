@@ -0,0 +1,262 @@
+"""
+@file dataset.py Input pipeline for training and evaluating the character classifier.
+
+Reading thousands of small png files (and decoding them one after the other)
+keeps the CPU nodes waiting on I/O while retraining. The character dataset, a
+folder with one sub folder per letter (`A/`, `B/`, ...), is packed once into a
+few TFRecord shards holding the encoded images and their labels:
+
+    python dataset.py pack <dataset dir> --out <shards dir> [--shards N]
+
+and then streamed with parallel reads and decoding, caching of the encoded
+records, a bounded shuffle buffer and prefetching. The images are shuffled once
+before they are dealt into the shards (or streamed from the files), the
+buffer then only mixes records that are already in random order:
+
+    python dataset.py bench <shards dir | dataset dir> [--batch-size N] [--epochs N]
+
+reports the images per second the pipeline delivers.
+"""
+import os
+import time
+import string
+
+import numpy as np
+import tensorflow as tf
+
+from util import IMG_SIZE, BATCH_SIZE
+import profiler
+
+AUTOTUNE = tf.data.AUTOTUNE
+LETTERS = string.ascii_uppercase
+EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+# Encoded records held by the shuffle buffer (not the whole dataset)
+SHUFFLE_BUFFER = 4096
+SHARDS = 16
+
+FEATURES = {
+    "image": tf.io.FixedLenFeature([], tf.string),
+    "label": tf.io.FixedLenFeature([], tf.int64),
+}
+
+# ---------- Dataset Files ----------
+def listDataset(folder):
+    """
+    Lists the character images of a dataset folder, sorted by letter and name.
+
+    :param folder: {string} Folder with one sub folder per letter
+    :return: {tuple} (file paths {list}, labels {list of integers, 0 for A})
+    """
+    paths, labels = [], []
+    for letter in sorted(os.listdir(folder)):
+        if letter.upper() not in LETTERS or len(letter) != 1:
+            continue
+        root = os.path.join(folder, letter)
+        names = sorted(n for n in os.listdir(root) if n.lower().endswith(EXTENSIONS))
+        paths += [os.path.join(root, n) for n in names]
+        labels += [LETTERS.index(letter.upper())] * len(names)
+    return paths, labels
+
+def shuffled(paths, labels, seed=None):
+    """
+    Shuffles the images and their labels together. Sorted by letter (as
+    listed by `listDataset`), a bounded shuffle buffer only ever holds one or
+    two letters of a large dataset.
+
+    :param paths: {list} Image files
+    :param labels: {list | numpy array} Label of every image
+    :param seed: {integer} Seed of the permutation
+    :return: {tuple} (file paths {list}, labels {numpy array})
+    """
+    order = np.random.default_rng(seed).permutation(len(paths))
+    return [paths[i] for i in order], np.asarray(labels)[order]
+
+# ---------- TFRecord Shards - Begin ----------
+def pack(folder, outDir, shards=SHARDS, seed=0):
+    """
+    Writes the images of a dataset folder (still encoded, as read from disk)
+    with their labels into TFRecord shards, shuffled and dealt round robin so
+    that every shard holds every letter in random order.
+
+    :param folder: {string} Folder with one sub folder per letter
+    :param outDir: {string} Folder to write the shards to
+    :param shards: {integer} Number of shards
+    :param seed: {integer} Seed of the shuffling (the same shards on every run)
+    :return: {list} Locations of the shards
+    """
+    paths, labels = listDataset(folder)
+    if len(paths) == 0:
+        raise ValueError(f"No character images found in {folder}")
+    paths, labels = shuffled(paths, labels, seed)
+    os.makedirs(outDir, exist_ok=True)
+
+    shards = max(1, min(shards, len(paths)))
+    files = [os.path.join(outDir, f"chars-{i:05d}-of-{shards:05d}.tfrecord") for i in range(shards)]
+    writers = [tf.io.TFRecordWriter(f) for f in files]
+    try:
+        for i, (path, label) in enumerate(zip(paths, labels)):
+            with open(path, "rb") as f:
+                image = f.read()
+            example = tf.train.Example(features=tf.train.Features(feature={
+                "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[image])),
+                "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)])),
+            }))
+            writers[i % shards].write(example.SerializeToString())
+    finally:
+        for w in writers:
+            w.close()
+    return files
+
+def _parse(record):
+    example = tf.io.parse_single_example(record, FEATURES)
+    return example["image"], example["label"]
+# ---------- TFRecord Shards - End ----------
+
+# ---------- Decoding ----------
+def decodeImage(data, size=IMG_SIZE, channels=3):
+    """
+    Decodes an encoded image (png, jpeg, bmp or gif) into the model input.
+
+    :param data: {string tensor} Encoded image
+    :param size: {integer} Height and width of the result
+    :param channels: {integer} 3 for RGB, 1 for grayscale (see `smallclf.py`)
+    :return: {tensor} float32 image of shape (size, size, channels), values 0-1
+    """
+    image = tf.io.decode_image(data, channels=channels, expand_animations=False)
+    image = tf.image.convert_image_dtype(image, tf.float32)
+    return tf.image.resize(image, size=[size, size])
+
+# ---------- Pipeline - Begin ----------
+def _stream(records, batch_size, training, cache, shuffle_buffer, deterministic, seed, onehot,
+            size, channels):
+    # Shared by `fromShards` and `fromFiles`, `records` yields (encoded image, label)
+    if cache is not None:
+        # Encoded images are small, decoded ones are 600 KB each
+        records = records.cache(cache)
+    if training:
+        records = records.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+
+    def decode(data, label):
+        label = tf.one_hot(label, len(LETTERS)) if onehot else label
+        return decodeImage(data, size, channels), label
+
+    data = records.map(decode, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    return data.batch(batch_size).prefetch(AUTOTUNE)
+
+def fromShards(location, batch_size=BATCH_SIZE, training=False, cache="",
+               shuffle_buffer=SHUFFLE_BUFFER, deterministic=None, seed=None, onehot=True,
+               size=IMG_SIZE, channels=3):
+    """
+    Streams the batches of the TFRecord shards written by `pack`.
+
+    :param location: {string} Folder of the shards or a glob pattern
+    :param batch_size: {integer} Images per batch
+    :param training: {boolean} Shuffle the shards and the records (every epoch)
+    :param cache: {string} Cache the encoded records in memory ("") or in the
+    given file, None not to cache
+    :param shuffle_buffer: {integer} Records held by the shuffle buffer
+    :param deterministic: {boolean} Keep the order of the parallel reads and
+    decoding (and, with a seed, of the shuffling) so that runs are repeatable.
+    By default the order is given up for speed when training.
+    :param seed: {integer} Seed of the shuffling
+    :param onehot: {boolean} One hot labels (as the classifier is trained on)
+    or letter indices
+    :param size: {integer} Height and width of the images
+    :param channels: {integer} 3 for RGB, 1 for grayscale
+    :return: {tf.data.Dataset} Batches of (images, labels)
+    """
+    pattern = os.path.join(location, "*.tfrecord") if os.path.isdir(location) else location
+    if deterministic is None:
+        deterministic = not training
+
+    files = tf.data.Dataset.list_files(pattern, shuffle=training, seed=seed)
+    records = files.interleave(tf.data.TFRecordDataset, cycle_length=AUTOTUNE,
+                               num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    records = records.map(_parse, num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    return _stream(records, batch_size, training, cache, shuffle_buffer, deterministic, seed, onehot,
+                   size, channels)
+
+def fromFiles(paths, labels, batch_size=BATCH_SIZE, training=False, cache="",
+              shuffle_buffer=SHUFFLE_BUFFER, deterministic=None, seed=None, onehot=True,
+              size=IMG_SIZE, channels=3):
+    """
+    Same as `fromShards`, reading the image files directly (see `listDataset`).
+    Without `onehot` the labels may also be given as probabilities (N, 26),
+    e.g. the soft targets of a distillation. When training the files are
+    shuffled with `seed` first (see `shuffled`).
+    """
+    if deterministic is None:
+        deterministic = not training
+    if training:
+        paths, labels = shuffled(paths, labels, seed)
+
+    labels = np.asarray(labels)
+    labels = tf.constant(labels, tf.float32 if labels.dtype.kind == "f" else tf.int64)
+    files = tf.data.Dataset.from_tensor_slices((tf.constant(paths), labels))
+    records = files.map(lambda path, label: (tf.io.read_file(path), label),
+                        num_parallel_calls=AUTOTUNE, deterministic=deterministic)
+    return _stream(records, batch_size, training, cache, shuffle_buffer, deterministic, seed, onehot,
+                   size, channels)
+# ---------- Pipeline - End ----------
+
+# ---------- Throughput ----------
+def throughput(data, epochs=1):
+    """
+    Runs through the dataset and measures the images delivered per second.
+    The wait for every batch is profiled as stage `dataset.nextBatch`: the
+    datasets are lazy, files are only read and decoded while iterating.
+
+    :param data: {tf.data.Dataset} Batches of (images, labels)
+    :param epochs: {integer} Passes over the dataset
+    :return: {list} (images, seconds, images per second) of every epoch
+    """
+    report = []
+    for _ in range(epochs):
+        images, start = 0, time.perf_counter()
+        batches = iter(data)
+        while True:
+            with profiler.stage("dataset.nextBatch"):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            images += int(batch[0].shape[0])
+        elapsed = time.perf_counter() - start
+        profiler.count("dataset.images", images)
+        report.append((images, elapsed, images / elapsed if elapsed > 0 else 0.0))
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Character dataset input pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+    packing = commands.add_parser("pack", help="Pack a dataset folder into TFRecord shards")
+    packing.add_argument("folder", help="Folder with one sub folder per letter")
+    packing.add_argument("--out", required=True, help="Folder to write the shards to")
+    packing.add_argument("--shards", type=int, default=SHARDS)
+    bench = commands.add_parser("bench", help="Report the images/sec of the pipeline")
+    bench.add_argument("location", help="Shards folder / pattern, or a dataset folder")
+    bench.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    bench.add_argument("--epochs", type=int, default=3)
+    bench.add_argument("--training", action="store_true", help="Shuffle as for training")
+    bench.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        files = pack(args.folder, args.out, args.shards)
+        print(f"Wrote {len(files)} shards to {args.out}")
+        exit(0)
+
+    cache = None if args.no_cache else ""
+    shards = not os.path.isdir(args.location) or any(
+        f.endswith(".tfrecord") for f in os.listdir(args.location))
+    if shards:
+        data = fromShards(args.location, args.batch_size, args.training, cache)
+    else:
+        paths, labels = listDataset(args.location)
+        data = fromFiles(paths, labels, args.batch_size, args.training, cache)
+
+    for epoch, (images, seconds, rate) in enumerate(throughput(data, args.epochs)):
+        print(f"Epoch {epoch + 1}: {images} images in {seconds:.2f}s ({rate:.1f} images/sec)")
+    exit(0)
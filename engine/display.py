@@ -0,0 +1,189 @@
+"""
+@file display.py
+@author Himanshu Mishra
+
+This module contains the plotting and displaying features used for debugging
+the engine (OpenCV windows and Matplotlib plots). It is loaded on demand, see
+`util.py`.
+"""
+import cv2 as cv  # OpenCV library used for image processing
+import matplotlib.pyplot as plt  # Matplotlib used for plotting
+
+from util import rescaleImage, reshape
+
+# --- Displaying Image ---
+def displayImage(image, comments="Test Image"):
+    """
+    Displays image in a window using OpenCV.
+
+    @params image {numpy array} Image to display
+    @params comments {string} Sets the title of the image window 
+    """
+    cv.imshow(comments, image)
+    cv.waitKey(0)
+
+    cv.destroyAllWindows()
+    return
+
+
+# --- Plotting Image ---
+def plotImage(image, comments="Test Image", col="gray"):
+    """
+    Plots image using Matplotlib.
+
+    @params image {numpy array} Image to plot
+    @params comments {string} Sets the title of the plot
+    @params col {string} Color channel of the image (Gray by default)
+    """
+    if col == "gray":
+        plt.imshow(image, cmap=col)
+    else:
+        plt.imshow(image)
+
+    plt.title(comments)
+    plt.axis("off")
+    return
+
+
+############### Contours ###############
+
+# --- Draw Contours ---
+def drawContour(image, cnt, num):
+    """
+    Draws a bounded rectangle around the contour passed and puts the given text into the rectangle.
+
+    @params image {numpy array} Image to draw contour on.
+    @params cnt {numpy array} Contour to bound
+    @params num {string / integer} Text to put in
+    """
+    M = cv.moments(cnt)
+    cX = int(M["m10"] / M["m00"])
+    cY = int(M["m01"] / M["m00"])
+
+    # drawing the contour number on the image
+    cv.putText(image, f"{num + 1}", (cX - 20, cY), cv.FONT_HERSHEY_PLAIN, \
+               1.0, (255, 128, 0), 1)
+    x, y, w, h = cv.boundingRect(cnt)
+    cv.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
+    return image
+
+def drawAllContours(image, contours):
+    """
+
+    Draws a bounded rectangle around all the contours passed and puts an index to each.
+
+    :param image: {numpy array} image to draw contours on
+    :param contours: {list} list of all contours to be drawn
+    :return: image with contours drawn on it
+    """
+    for i, cnt in enumerate(contours):
+        M = cv.moments(cnt)
+        cX = int(M["m10"] / M["m00"])
+        cY = int(M["m01"] / M["m00"])
+
+        # drawing the contour number on the image
+        cv.putText(image, f"{i + 1}", (cX - 20, cY), cv.FONT_HERSHEY_PLAIN,\
+                   1.0, (255, 128, 0), 1)
+        x, y, w, h = cv.boundingRect(cnt)
+        cv.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
+
+    return image
+
+
+# --- Plot All Lines ---
+def plotAllLines(image, lines, comments="All lines"):
+    """
+    Plots all lines
+    """
+    image_rect = rescaleImage(image, reshape(image))
+    lineCount = 0
+    for line in lines:
+        for word in line:
+            drawContour(image_rect, word, lineCount)
+        lineCount += 1
+
+    displayImage(image_rect, comments)
+
+# --- Plot All Words ---
+def plotAllWords(image, lines, comments="Final Result"):
+    """
+    Plots all the words in order.
+    """
+    wordCount = 0
+    image_rect = rescaleImage(image.copy(), reshape(image))
+
+    for words in lines:
+        for word in words:
+            drawContour(image_rect, word, wordCount)
+            wordCount += 1
+
+    # plotImage(image_rect, comments)
+    displayImage(image_rect, comments)
+
+# --- Display All Words ---
+def displayAllWords(lines, comments="All Words"):
+    """
+    Displays all the words in reading order one by one.
+    """
+    wordCount = 0
+    for line in lines:
+        for word in line:
+            displayImage(word, str(wordCount))
+            wordCount += 1
+
+    return
+
+# --- Save All Words ---
+def saveAllWords(lines, dir):
+    """
+    Saves all the words in the given directory.
+    """
+    wordCount = 0
+    for line in lines:
+        for word in line:
+            wordFile = dir + "/" + str(wordCount) + ".png"
+            # print(f"Word File: {wordFile}")
+            # print(os.listdir(dir + "/.."))
+
+            cv.imwrite(wordFile, word)
+            # cv.imwrite()
+            wordCount += 1
+    return
+
+# --- Save All Characters ---
+def saveAllChars(chars, dir):
+    """
+    Saves all the character images in the given directory.
+    """
+    for i,c in enumerate(chars):
+        charFile = dir + "/" + str(i) + ".png"
+        cv.imwrite(charFile, c)
+
+    return
+
+
+# Plotting the graph obtained
+def plotGraph(graph):
+    """
+    Plots the given graph.
+    """
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(graph)
+
+
+def segmentImage(image, segment_array, c='g'):
+    """
+    Segments the given image at the positions in the given array.
+    @param c Color of the segmented lines
+    """
+    for x in segment_array:
+        image[:,x] = (0,255,0)
+
+    displayImage(image, "Segmented Image")
+
+
+def plotDualGraphs(graph1, graph2, c2='g'):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.plot(graph1)
+    ax.plot(graph2, color=c2)
+    return fig, ax
@@ -0,0 +1,181 @@
+"""
+@file export.py Exports the character classifier for a lightweight CPU runtime.
+
+Loading the Keras `.h5` model (with its TensorFlow Hub layer) is slow and its
+inference is heavy for CPU only machines. This module converts the model to
+TensorFlow Lite, optionally post-training quantized to float16 or int8 (the
+int8 ranges are calibrated on a set of character crops), and compares the
+exported model against the Keras one on the same crops.
+
+Usage:
+    python export.py <model.h5> [--quantize none|float16|int8] [--calibration <dir>]
+                     [--out <model.tflite>] [--compare <dir>]
+
+The exported `.tflite` file is used by `charclf.load` wherever a model path is
+accepted (`main.MODEL`, `worker.py --model`).
+"""
+import os
+import time
+import json
+import numpy as np
+
+import util
+import charclf as cf
+
+QUANTIZATIONS = ("none", "float16", "int8")
+# Crops used for int8 calibration (more only slow the export down)
+CALIBRATION_SIZE = 200
+
+# ---------- Character Crops ----------
+def readCrops(folder, limit=None):
+    """
+    Reads the character crops (png / jpg) found under the given folder.
+
+    :param folder: {string} Folder to search recursively
+    :param limit: {integer} Most crops to read (all by default)
+    :return: {tuple} (crops {list of numpy arrays}, file paths {list})
+    """
+    files = []
+    for root, dirs, names in os.walk(folder):
+        dirs.sort()
+        files += [os.path.join(root, n) for n in sorted(names)
+                  if n.lower().endswith((".png", ".jpg", ".jpeg"))]
+    files = files[:limit]
+    crops = [util.readImage(f) for f in files]
+    for f, crop in zip(files, crops):
+        if crop is None:
+            raise ValueError(f"Could not read character crop: {f}")
+    return crops, files
+
+# ---------- Export ----------
+def export(modelPath, outPath=None, quantize="none", calibration=None):
+    """
+    Converts the Keras model to a TensorFlow Lite flatbuffer.
+
+    :param modelPath: {string} Location of the `.h5` model
+    :param outPath: {string} Where to write the `.tflite` file (next to the model by default)
+    :param quantize: {string} One of `QUANTIZATIONS`
+    :param calibration: {string} Folder of character crops, required for int8
+    :return: {string} Location of the exported model
+    """
+    import tensorflow as tf
+
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantize}")
+    if quantize == "int8" and calibration is None:
+        raise ValueError("int8 quantization needs a calibration folder of character crops")
+
+    model = util.load_model(modelPath)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        crops, files = readCrops(calibration, CALIBRATION_SIZE)
+        if len(crops) == 0:
+            raise ValueError(f"No character crops found in {calibration}")
+
+        def representative():
+            for crop in crops:
+                yield [util.create_image_batch([crop], *cf.inputShape(model))]
+
+        # Weights and activations in int8, input and output stay float32
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative
+
+    if outPath is None:
+        suffix = "" if quantize == "none" else "-" + quantize
+        outPath = os.path.splitext(modelPath)[0] + suffix + ".tflite"
+    with open(outPath, "wb") as f:
+        f.write(converter.convert())
+    return outPath
+
+# ---------- Comparison ----------
+def compare(modelPaths, folder, repeat=3):
+    """
+    Runs every model over the crops of the given folder and reports load time,
+    latency, throughput and agreement with the first (reference) model. When the
+    crops are kept in one folder per letter (`A/`, `B/`, ...), accuracy is
+    reported as well.
+
+    :param modelPaths: {list} Model locations, the first one is the reference
+    :param folder: {string} Folder of character crops
+    :param repeat: {integer} Timed passes over the crops (best one is reported)
+    :return: {list} One report dict per model
+    """
+    crops, files = readCrops(folder)
+    if len(crops) == 0:
+        raise ValueError(f"No character crops found in {folder}")
+    labels = [os.path.basename(os.path.dirname(f)).upper() for f in files]
+    labelled = all(len(l) == 1 and l.isalpha() for l in labels)
+
+    reports, reference = [], None
+    for path in modelPaths:
+        start = time.perf_counter()
+        model = cf.load(path)
+        loadTime = time.perf_counter() - start
+
+        # The first pass also warms the model up
+        predictions = cf.predict(model, crops)
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cf.predict(model, crops)
+            best = min(best, time.perf_counter() - start)
+
+        top1 = np.argmax(predictions, axis=1)
+        if reference is None:
+            reference = top1
+        size, channels = cf.inputShape(model)
+        report = {
+            "model": path,
+            "size_mb": os.path.getsize(path) / 2 ** 20,
+            "input_kb": size * size * channels * 4 / 1024,
+            "load_s": loadTime,
+            "ms_per_char": 1000 * best / len(crops),
+            "chars_per_sec": len(crops) / best,
+            "agreement": float(np.mean(top1 == reference)),
+        }
+        if labelled:
+            text = cf.extractText(predictions)
+            report["accuracy"] = float(np.mean([p == l for p, l in zip(text, labels)]))
+        reports.append(report)
+
+    return reports
+
+def printReport(reports):
+    """
+    Prints the comparison as a table, the reference model first.
+    """
+    keys = ["size_mb", "input_kb", "load_s", "ms_per_char", "chars_per_sec", "agreement", "accuracy"]
+    keys = [k for k in keys if k in reports[0]]
+    print("model".ljust(48) + "".join(k.rjust(14) for k in keys))
+    for r in reports:
+        name = os.path.basename(r["model"])
+        print(name.ljust(48) + "".join(f"{r[k]:14.3f}" for k in keys))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the classifier to TensorFlow Lite")
+    parser.add_argument("model", help="Keras .h5 model to export")
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, default="none")
+    parser.add_argument("--calibration", help="Folder of character crops for int8 calibration")
+    parser.add_argument("--out", help="Location of the exported .tflite model")
+    parser.add_argument("--compare", metavar="DIR",
+                        help="Compare the exported model with the Keras one on the crops in DIR")
+    parser.add_argument("--json", help="Also write the comparison report to this file")
+    args = parser.parse_args()
+
+    out = export(args.model, args.out, args.quantize, args.calibration)
+    print(f"Exported model: {out}")
+
+    if args.compare:
+        reports = compare([args.model, out], args.compare)
+        printReport(reports)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(reports, f, indent=2)
+    exit(0)
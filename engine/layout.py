@@ -0,0 +1,140 @@
+"""
+@file layout.py Structured layout of a recognized page.
+
+Instead of a bare string, `main.recognizeLayout` describes the page as
+lines -> words -> characters with their bounding boxes, in the coordinates of
+the original image, and the classifier's confidence for every character. The
+boxes are kept in NumPy structured arrays, one row per word / character, so a
+page with thousands of characters stays compact and serializes quickly:
+
+    * `toDict` / `fromDict`: column oriented, JSON friendly
+    * `toBytes` / `fromBytes`: NumPy `.npz` archive
+
+Downstream consumers (e.g. searchable PDF overlays) can use it without running
+the OCR again.
+"""
+import io
+import numpy as np
+
+WORD_DTYPE = np.dtype([("line", np.int32), ("word", np.int32),
+                       ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32)])
+CHAR_DTYPE = np.dtype([("line", np.int32), ("word", np.int32), ("char", np.int32),
+                       ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32),
+                       ("label", "U1"), ("confidence", np.float32)])
+LINE_DTYPE = np.dtype([("line", np.int32),
+                       ("x", np.int32), ("y", np.int32), ("w", np.int32), ("h", np.int32)])
+
+def _records(rows, dtype):
+    # Rounds the (index, box) rows into the leading fields of new records
+    records = np.zeros(len(rows), dtype=dtype)
+    if len(rows):
+        values = np.rint(np.asarray(rows, dtype=np.float64)).astype(np.int32)
+        for k, name in enumerate(dtype.names[:values.shape[1]]):
+            records[name] = values[:, k]
+    return records
+
+class PageLayout:
+    """
+    Words and characters of a page, in reading order.
+
+    :param width: {integer} Width of the original image
+    :param height: {integer} Height of the original image
+    :param words: {numpy array} Records of `WORD_DTYPE`
+    :param chars: {numpy array} Records of `CHAR_DTYPE`
+    """
+    __slots__ = ("width", "height", "words", "chars")
+
+    def __init__(self, width, height, words, chars):
+        self.width = int(width)
+        self.height = int(height)
+        self.words = words
+        self.chars = chars
+
+    @classmethod
+    def fromRows(cls, width, height, words, chars, labels, confidences):
+        """
+        Builds the layout from the boxes found by the pipeline.
+
+        :param words: {list} (line, word, x, y, w, h) of each word
+        :param chars: {list} (line, word, char, x, y, w, h) of each character
+        :param labels: {string} Label of each character
+        :param confidences: {numpy array} Confidence of each character's label
+        """
+        charRecords = _records(chars, CHAR_DTYPE)
+        charRecords["label"] = list(labels)
+        charRecords["confidence"] = confidences
+        return cls(width, height, _records(words, WORD_DTYPE), charRecords)
+
+    def lines(self):
+        """
+        :return: {numpy array} Records of `LINE_DTYPE`, the box of each line
+        enclosing its words
+        """
+        w = self.words
+        lines = np.zeros(len(np.unique(w["line"])), dtype=LINE_DTYPE)
+        if len(w) == 0:
+            return lines
+        # Words are stored line after line
+        starts = np.flatnonzero(np.diff(w["line"], prepend=-1))
+        x0 = np.minimum.reduceat(w["x"], starts)
+        y0 = np.minimum.reduceat(w["y"], starts)
+        x1 = np.maximum.reduceat(w["x"] + w["w"], starts)
+        y1 = np.maximum.reduceat(w["y"] + w["h"], starts)
+        lines["line"], lines["x"], lines["y"] = w["line"][starts], x0, y0
+        lines["w"], lines["h"] = x1 - x0, y1 - y0
+        return lines
+
+    def text(self):
+        """
+        :return: {string} Text of the page, as returned by `main.recognize`
+        """
+        words = {}
+        for c in self.chars:
+            key = (int(c["line"]), int(c["word"]))
+            words[key] = words.get(key, "") + str(c["label"])
+
+        t, line = "", None
+        for w in self.words:
+            if line is not None and w["line"] != line:
+                t += "\n"
+            line = w["line"]
+            t += words.get((int(w["line"]), int(w["word"])), "") + " "
+        return t + "\n" if line is not None else t
+
+    # ---------- Serialization - Begin ----------
+    def toDict(self):
+        """
+        :return: {dict} Column oriented representation, ready for `json.dumps`
+        """
+        return {
+            "width": self.width, "height": self.height,
+            "words": {name: self.words[name].tolist() for name in WORD_DTYPE.names},
+            "chars": {name: self.chars[name].tolist() for name in CHAR_DTYPE.names},
+        }
+
+    @classmethod
+    def fromDict(cls, data):
+        def columns(cols, dtype):
+            n = len(cols[dtype.names[0]])
+            records = np.zeros(n, dtype=dtype)
+            for name in dtype.names:
+                records[name] = cols[name]
+            return records
+        return cls(data["width"], data["height"], columns(data["words"], WORD_DTYPE),
+                   columns(data["chars"], CHAR_DTYPE))
+
+    def toBytes(self):
+        """
+        :return: {bytes} `.npz` archive of the layout
+        """
+        buffer = io.BytesIO()
+        np.savez(buffer, size=np.array([self.width, self.height]),
+                 words=self.words, chars=self.chars)
+        return buffer.getvalue()
+
+    @classmethod
+    def fromBytes(cls, data):
+        archive = np.load(io.BytesIO(data))
+        width, height = archive["size"]
+        return cls(width, height, archive["words"], archive["chars"])
+    # ---------- Serialization - End ----------
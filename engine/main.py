@@ -3,53 +3,249 @@
 @author Himanshu Mishra
 """
 import os
-import src.util as util
-import tensorflow as tf
-import sys
-
 import sys
+import json
+import time
+import contextlib
 
 import util
-from wordext import main as wx
+import wordext as wx
 import charseg as cs
 import charclf as cf
-# import tensorflow as tf
+import layout
+import profiler
 
 CHAR_DIR = "images/e/"
 MODEL = "models/20210427-03301619494256-final-train.h5"
+# Identifies the segmentation steps in cached results, change it whenever
+# wordext / charseg would produce different words or characters
+PIPELINE_VERSION = "5"
+
+def transcribePages(pages, model, debug=False, batch_size=cf.BATCH_SIZE,
+                    max_inflight=cf.MAX_INFLIGHT, stats=None, cache=None):
+    """
+    Recognizes a window of pages with as few model calls as possible. The
+    characters of every word of every page are segmented first, classified
+    together in fixed size batches and then put back in their place.
+
+    :param pages: {list} Pages as returned by `wordext.main` (lines of word images)
+    :param model: {keras model} Loaded character classifier
+    :param debug: {bool} Also dump each word's characters in `charseg.CHAR_DIR`
+    :param batch_size: {integer} Characters per model call
+    :param max_inflight: {integer} Characters preprocessed at once
+    :param stats: {dict} If given, filled with the character count, time and chars/sec
+    :param cache: {cache.OCRCache} If given, words seen before are not classified again
+    :return: {list} Recognized text of each page
+    """
+    words = [[["" for word in line] for line in lines] for lines in pages]
+
+    # 1. Segmenting every word, remembering where each character belongs
+    chars, index, missed = [], [], []
+    for p, lines in enumerate(pages):
+        known = set()
+        if cache is not None:
+            for i, line in enumerate(lines):
+                for j, word in enumerate(line):
+                    key = cache.wordKey(word)
+                    text = cache.words.get(key)
+                    if text is not None:
+                        words[p][i][j] = text
+                        known.add((i, j))
+                    else:
+                        missed.append((key, p, i, j))
+        pageChars, pageIndex = segmentWords(lines, debug, known)
+        chars += pageChars
+        index += [(p, i, j) for i, j in pageIndex]
+
+    # 2. Classifying all the characters together
+    start = time.perf_counter()
+    predictions = cf.predict(model, chars, batch_size, max_inflight)
+    elapsed = time.perf_counter() - start
+    if stats is not None:
+        rate = len(chars) / elapsed if elapsed > 0 else 0.0
+        stats.update(chars=len(chars), seconds=elapsed, chars_per_sec=rate)
+
+    # 3. Scattering the labels back into the layout (characters are in reading order)
+    scatterLabels(words, index, util.decodeLabels(predictions))
+    for key, p, i, j in missed:
+        cache.words.put(key, words[p][i][j])
+
+    return [layoutText(page) for page in words]
 
-def main(imageLocation):
-    model = util.load_model(MODEL)
-    lines = wx(imageLocation)
+def segmentWords(lines, debug=False, skip=()):
+    """
+    Segments the characters of every word of a page.
+
+    :param lines: {2D list} Word images, lines in 1st and words in 2nd dimension
+    :param debug: {bool} Also dump each word's characters in `charseg.CHAR_DIR`
+    :param skip: {set} (line, word) of the words not to segment (e.g. already recognized)
+    :return: {tuple} (characters {list}, (line, word) of each character {list})
+    """
+    chars, index = [], []
+    for i, line in enumerate(lines):
+        for j, word in enumerate(line):
+            if (i, j) in skip:
+                continue
+            for c in cs.main(word, save=debug):
+                chars.append(c)
+                index.append((i, j))
+    return chars, index
+
+def scatterLabels(words, index, labels):
+    """
+    Appends the label of every character to the text of its word.
+
+    :param words: {3D list} Text of each word, pages, lines and words
+    :param index: {list} (page, line, word) of each character
+    :param labels: {string} Label of each character, in the same order
+    """
+    for (p, i, j), label in zip(index, labels):
+        words[p][i][j] += label
+
+def layoutText(words):
+    """
+    Joins the text of each word back into the text of the page.
+
+    :param words: {2D list} Text of each word, lines in 1st and words in 2nd dimension
+    :return: {string} Text of the page, one line of the image per line
+    """
     t = ""
-    for line in lines:
-        l = ""
-        for word in line:
-            cs.main(word)
-            l += cf.main(model) + " "
-        t += l + "\n"
+    for line in words:
+        t += "".join(w + " " for w in line) + "\n"
     return t
 
+def transcribe(lines, model, debug=False, **kwargs):
+    """
+    Classifies the characters of every word in the given lines and joins
+    them back into text.
+
+    :param lines: {2D list} Word images, lines in 1st and words in 2nd dimension
+    :param model: {keras model} Loaded character classifier
+    :param debug: {bool} Also dump each word's characters in `charseg.CHAR_DIR`
+    :return: {string} Recognized text, one line of the image per line
+    """
+    return transcribePages([lines], model, debug, **kwargs)[0]
+
+def recognize(image, model, cache=None):
+    """
+    Recognizes the text of an already decoded image. Loading the model is
+    left to the caller so that a long lived process does it only once.
+
+    :param image: {numpy array} Image to recognize text from
+    :param model: {keras model} Loaded character classifier
+    :param cache: {cache.OCRCache} If given, images and words seen before are not recognized again
+    :return: {string} Recognized text
+    """
+    if cache is None:
+        return transcribe(wx.extract(image), model)
+
+    key = cache.pageKey(image)
+    text = cache.pages.get(key)
+    if text is None:
+        text = transcribe(wx.extract(image), model, cache=cache)
+        cache.pages.put(key, text)
+    return text
+
+def streamLines(image, model, cache=None, **kwargs):
+    """
+    Recognizes an image line by line, yielding each line as soon as it is
+    recognized instead of waiting for the whole page.
+
+    :param image: {numpy array} Image to recognize text from
+    :param model: {keras model} Loaded character classifier
+    :param cache: {cache.OCRCache} If given, images and words seen before are not recognized again
+    :return: Generator of {"line": index, "text": text} dicts in reading order
+    """
+    key = None
+    if cache is not None:
+        key = cache.pageKey(image)
+        text = cache.pages.get(key)
+        if text is not None:
+            for i, line in enumerate(text.split("\n")[:-1]):
+                yield {"line": i, "text": line}
+            return
+
+    text = ""
+    for i, line in enumerate(wx.iterExtract(image)):
+        t = transcribe([line], model, cache=cache, **kwargs)
+        text += t
+        yield {"line": i, "text": t[:-1]}
+
+    if key is not None:
+        cache.pages.put(key, text)
+
+def recognizeLayout(image, model, batch_size=cf.BATCH_SIZE, max_inflight=cf.MAX_INFLIGHT):
+    """
+    Recognizes an image keeping the geometry: the box of every word and
+    character in the coordinates of the given image, and the confidence of
+    every character.
+
+    :param image: {numpy array} Image to recognize text from
+    :param model: {keras model} Loaded character classifier
+    :return: {layout.PageLayout} Layout of the page, `.text()` gives the text
+    """
+    boxes, image_rect = wx.locate(image)
+    # Words are found in a rescaled copy of the image
+    sx = image.shape[1] / image_rect.shape[1]
+    sy = image.shape[0] / image_rect.shape[0]
+
+    wordRows, charRows, chars = [], [], []
+    for i, line in enumerate(boxes):
+        for j, (x, y, w, h) in enumerate(line):
+            wordRows.append((i, j, x * sx, y * sy, w * sx, h * sy))
+            crops, spans, width = cs.segment(image_rect[y:y+h, x:x+w])
+            # Characters are cut out of the word rescaled to `width` columns
+            for k, (a, b) in enumerate(spans):
+                charRows.append((i, j, k, (x + a * w / width) * sx, y * sy,
+                                 (b - a) * w / width * sx, h * sy))
+            chars += crops
+
+    predictions = cf.predict(model, chars, batch_size, max_inflight)
+    return layout.PageLayout.fromRows(image.shape[1], image.shape[0], wordRows, charRows,
+                                      cf.extractText(predictions), predictions.max(axis=1))
+
+def main(imageLocation, model=None, debug=False, stats=None):
+    if model is None:
+        model = cf.load(MODEL)
+    lines = wx.main(imageLocation)
+    return transcribe(lines, model, debug, stats=stats)
+
 
 if __name__ == "__main__":
-    print("Main file: ")
-    # imageLocation = CHAR_DIR + os.listdir(CHAR_DIR)[0]
-    # test_batch = util.create_data_batches([imageLocation], test_data=True)
-    # model = util.load_model(MODEL)
-    # predictions = model.predict(test_batch)
-    #
-    # str = ""
-    # for p in predictions:
-    #     s = util.get_pred_label(p)
-    #     str += s
-
-    imageLocation = sys.argv[1]
-    text = main(imageLocation)
-    print("Result: " + text)
-
-    # print(str)
-    exit(0)
+    import argparse
 
+    parser = argparse.ArgumentParser(description="Recognizes the text of an image")
+    parser.add_argument("image", help="Location of the image")
+    parser.add_argument("--stream", action="store_true",
+                        help="Newline delimited JSON on stdout, one object per recognized line")
+    parser.add_argument("--profile", help="Write the stage timings and counters (JSON) to this file")
+    parser.add_argument("--trace", help="Write a Chrome trace of the stages to this file")
+    parser.add_argument("--fast", help="Fast model classifying every character first, the "
+                                       "characters it is unsure of go to the main model")
+    parser.add_argument("--threshold", type=float, default=cf.THRESHOLD,
+                        help="Least confidence accepted from the fast model")
+    args = parser.parse_args()
 
+    with profiler.profile(enabled=bool(args.profile or args.trace)) as p:
+        with contextlib.redirect_stdout(sys.stderr):
+            model = cf.load(MODEL)
+            if args.fast:
+                model = cf.Cascade(cf.load(args.fast), model, args.threshold)
+        if args.stream:
+            for line in streamLines(util.readImage(args.image), model):
+                print(json.dumps(line), flush=True)
+        else:
+            stats = {}
+            text = main(args.image, model, stats=stats)
+            print(f"Classified {stats['chars']} characters in {stats['seconds']:.3f}s "
+                  f"({stats['chars_per_sec']:.1f} chars/sec)", file=sys.stderr)
+            print("Result: " + text)
 
+    if args.profile:
+        with open(args.profile, "w") as f:
+            json.dump(p.toDict(), f, indent=2)
+    if args.trace:
+        with open(args.trace, "w") as f:
+            json.dump(p.chromeTrace(), f)
 
+    exit(0)
@@ -0,0 +1,190 @@
+"""
+@file profiler.py Stage timers and counters of the engine.
+
+The hot paths of the engine (model load, word extraction, character
+segmentation, png writes, dataset batches, model calls) are wrapped in named
+stages:
+
+    with profiler.stage("wordext.preprocess"):
+        ...
+
+    @profiler.timed("charseg.main")
+    def main(...):
+
+and count what they work on (`profiler.count("chars", len(chars))`). Nothing is
+measured unless a profile is active in the current context (thread or request),
+so a disabled stage costs one context variable lookup:
+
+    with profiler.profile() as p:
+        text = Main.recognize(image, model)
+    p.toDict()          # per request JSON: stages, counters
+    p.chromeTrace()     # trace events, open with chrome://tracing or Perfetto
+
+Finished profiles are added to the totals of the process, exported in the
+Prometheus text format by `prometheus()`.
+"""
+import os
+import time
+import functools
+import threading
+import contextlib
+import contextvars
+
+_current = contextvars.ContextVar("profile", default=None)
+_totals = {"stages": {}, "counters": {}}
+_totalsLock = threading.Lock()
+
+# ---------- Profile - Begin ----------
+class Profile:
+    """
+    Timings and counters of one request (or run). Stages may be nested and the
+    same stage may run any number of times, its calls and seconds add up.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                calls, seconds = self.stages.get(name, (0, 0.0))
+                self.stages[name] = (calls + 1, seconds + end - start)
+                self.events.append((name, start, end, threading.get_ident()))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def toDict(self):
+        """
+        :return: {dict} Stages (calls and seconds), counters and the total time
+        """
+        return {
+            "seconds": time.perf_counter() - self.start,
+            "stages": {name: {"calls": c, "seconds": s} for name, (c, s) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def chromeTrace(self):
+        """
+        :return: {dict} Trace event format (complete events, in microseconds)
+        """
+        pid = os.getpid()
+        events = [{"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": tid,
+                   "ts": (start - self.start) * 1e6, "dur": (end - start) * 1e6}
+                  for name, start, end, tid in self.events]
+        events += [{"name": name, "ph": "C", "pid": pid, "tid": 0,
+                    "ts": (time.perf_counter() - self.start) * 1e6, "args": {name: value}}
+                   for name, value in self.counters.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+# ---------- Profile - End ----------
+
+# ---------- Instrumentation - Begin ----------
+_disabled = contextlib.nullcontext()
+
+def stage(name):
+    """
+    Times the enclosed block as stage `name` of the active profile, if any.
+
+    :param name: {string} Stage name, `<module>.<step>`
+    :return: Context manager
+    """
+    p = _current.get()
+    return _disabled if p is None else p.stage(name)
+
+def timed(name):
+    """
+    Decorator timing every call of the function as stage `name`.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            p = _current.get()
+            if p is None:
+                return func(*args, **kwargs)
+            with p.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, n=1):
+    """
+    Adds `n` to counter `name` of the active profile, if any.
+    """
+    p = _current.get()
+    if p is not None:
+        p.count(name, n)
+
+def active():
+    """
+    :return: {Profile} Active profile of the current context, None when disabled
+    """
+    return _current.get()
+
+@contextlib.contextmanager
+def profile(enabled=True):
+    """
+    Activates a new profile for the enclosed block (in the current thread or
+    request only). With `enabled` False nothing is measured and None is given.
+
+    :param enabled: {bool} Whether to profile, e.g. from a request flag
+    :return: Context manager giving the {Profile}
+    """
+    if not enabled:
+        yield None
+        return
+    p = Profile()
+    token = _current.set(p)
+    try:
+        yield p
+    finally:
+        _current.reset(token)
+        _addTotals(p)
+# ---------- Instrumentation - End ----------
+
+# ---------- Process Totals - Begin ----------
+def _addTotals(p):
+    with _totalsLock, p.lock:
+        for name, (calls, seconds) in p.stages.items():
+            c, s = _totals["stages"].get(name, (0, 0.0))
+            _totals["stages"][name] = (c + calls, s + seconds)
+        for name, value in p.counters.items():
+            _totals["counters"][name] = _totals["counters"].get(name, 0) + value
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus():
+    """
+    Totals of all the finished profiles of the process, in the Prometheus text
+    exposition format.
+
+    :return: {string} Metrics text
+    """
+    with _totalsLock:
+        stages = sorted(_totals["stages"].items())
+        counters = sorted(_totals["counters"].items())
+    lines = ["# HELP ocr_stage_seconds_total Time spent in each engine stage.",
+             "# TYPE ocr_stage_seconds_total counter"]
+    lines += [f'ocr_stage_seconds_total{{stage="{_label(n)}"}} {s:.6f}' for n, (c, s) in stages]
+    lines += ["# HELP ocr_stage_calls_total Runs of each engine stage.",
+              "# TYPE ocr_stage_calls_total counter"]
+    lines += [f'ocr_stage_calls_total{{stage="{_label(n)}"}} {c}' for n, (c, s) in stages]
+    lines += ["# HELP ocr_items_total Items (words, characters, ...) processed by the engine.",
+              "# TYPE ocr_items_total counter"]
+    lines += [f'ocr_items_total{{item="{_label(n)}"}} {v}' for n, v in counters]
+    return "\n".join(lines) + "\n"
+
+def resetTotals():
+    with _totalsLock:
+        _totals["stages"].clear()
+        _totals["counters"].clear()
+# ---------- Process Totals - End ----------
@@ -0,0 +1,130 @@
+"""
+@file readorder.py Groups word boxes into lines and sorts them in reading order.
+
+`wordext.extractLines` cuts the page into fixed bands 30 pixels high, so a line
+straddling a band boundary is split in two and lines closer than a band are
+merged. Here the lines are found by clustering the vertical centers of the
+words instead:
+
+    * The threshold follows the median word height of the page, so it works
+      for any resolution and font size.
+    * The page skew is estimated from neighbouring words and removed first,
+      so slightly rotated scans still give one line per text line.
+    * Specks much smaller than a word (dots, noise) do not start lines of their
+      own, they join the nearest line.
+    * Everything is a sort or an array operation, O(n log n) for n words.
+
+Words of a line are sorted from left to right; words sharing the same position
+are all kept.
+"""
+import numpy as np
+
+# Largest gap between the (deskewed) centers of consecutive words of a line,
+# as a fraction of the median word height
+GAP = 0.5
+# Boxes lower than this fraction of the median word height join the nearest line
+SMALL = 0.5
+# Largest skew taken into account (slope, about 10 degrees)
+MAX_SKEW = 0.18
+# Farthest horizontal neighbour used for the skew estimate, in word heights
+NEIGHBOUR = 8
+
+# ---------- Measurements ----------
+def medianHeight(boxes):
+    """
+    :param boxes: {numpy array (N, 4)} Word boxes as x, y, w, h
+    :return: {float} Median height of the words (at least 1)
+    """
+    if len(boxes) == 0:
+        return 1.0
+    return max(float(np.median(boxes[:, 3])), 1.0)
+
+def estimateSkew(boxes, height=None):
+    """
+    Estimates the slope of the text lines from the words following each other
+    in rough bands one word high.
+
+    :param boxes: {numpy array (N, 4)} Word boxes as x, y, w, h
+    :param height: {float} Median word height (measured if None)
+    :return: {float} Slope (dy / dx) of the lines, 0 if it cannot be told
+    """
+    if len(boxes) < 2:
+        return 0.0
+    height = height or medianHeight(boxes)
+    cx = boxes[:, 0] + boxes[:, 2] / 2
+    cy = boxes[:, 1] + boxes[:, 3] / 2
+
+    band = np.floor(cy / height)
+    order = np.lexsort((cx, band))
+    cx, cy, band = cx[order], cy[order], band[order]
+
+    # Consecutive words of the same band, close enough to be neighbours
+    dx, dy = np.diff(cx), np.diff(cy)
+    pairs = (np.diff(band) == 0) & (dx > 0) & (dx < NEIGHBOUR * height)
+    slopes = dy[pairs] / dx[pairs]
+    slopes = slopes[np.abs(slopes) <= MAX_SKEW]
+    if len(slopes) < 3:
+        return 0.0
+    return float(np.median(slopes))
+
+# ---------- Grouping - Begin ----------
+def groupLines(boxes, gap=GAP, skew=True):
+    """
+    Assigns every word to a line.
+
+    :param boxes: {numpy array (N, 4)} Word boxes as x, y, w, h
+    :param gap: {float} Largest center gap inside a line, in median word heights
+    :param skew: {boolean} Estimate and remove the page skew first
+    :return: {numpy array (N,)} Line number of each word, lines numbered from
+    top to bottom
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    height = medianHeight(boxes)
+
+    cx = boxes[:, 0] + boxes[:, 2] / 2
+    cy = boxes[:, 1] + boxes[:, 3] / 2
+    if skew:
+        cy = cy - estimateSkew(boxes, height) * cx
+
+    small = boxes[:, 3] < SMALL * height
+    if small.all():
+        small[:] = False
+    regular = np.flatnonzero(~small)
+
+    order = regular[np.argsort(cy[regular], kind="stable")]
+    # A new line starts wherever consecutive centers are too far apart
+    breaks = np.diff(cy[order]) > gap * height
+
+    lines = np.empty(len(boxes), dtype=np.int64)
+    lines[order] = np.concatenate(([0], np.cumsum(breaks)))
+
+    if small.any():
+        # Centers of the lines, increasing with the line number
+        centers = np.bincount(lines[order], cy[order]) / np.bincount(lines[order])
+        k = np.searchsorted(centers, cy[small])
+        above = np.clip(k - 1, 0, len(centers) - 1)
+        below = np.clip(k, 0, len(centers) - 1)
+        nearer = np.abs(cy[small] - centers[above]) <= np.abs(centers[below] - cy[small])
+        lines[small] = np.where(nearer, above, below)
+    return lines
+
+def readingOrder(boxes, gap=GAP, skew=True):
+    """
+    Sorts the word boxes in reading order.
+
+    :param boxes: {numpy array (N, 4)} Word boxes as x, y, w, h
+    :param gap: {float} Largest center gap inside a line, in median word heights
+    :param skew: {boolean} Estimate and remove the page skew first
+    :return: {list} Boxes of each line, as numpy arrays (k, 4) in reading order
+    """
+    if len(boxes) == 0:
+        return []
+    boxes = np.asarray(boxes)
+    lines = groupLines(boxes, gap, skew)
+
+    order = np.lexsort((boxes[:, 0] + boxes[:, 2] / 2, lines))
+    starts = np.flatnonzero(np.diff(lines[order]))
+    return np.split(boxes[order], starts + 1)
+# ---------- Grouping - End ----------
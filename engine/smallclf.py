@@ -0,0 +1,184 @@
+"""
+@file smallclf.py Trains a small grayscale character classifier.
+
+The hub classifier needs every character upsampled to 224x224x3 float32
+(~600 KB) and a MobileNet sized forward pass, while the segmented characters
+are grayscale strokes only tens of pixels wide. This module trains a small
+convolutional network on 32x32 (or 64x64) single channel inputs instead, on
+the character dataset (one sub folder per letter, see `dataset.py`):
+
+    python smallclf.py <dataset dir> --out <small.h5> [--size 32|64] [--epochs N]
+                       [--teacher <model.h5> [--alpha A] [--temperature T]]
+                       [--compare DIR --reference <model>]
+
+With a teacher (the existing `.h5` model) the small model is distilled: it
+learns the teacher's softened probabilities mixed with the true labels.
+`--compare` reports the accuracy, latency and input size per character of the
+reference and the small model on the crops of DIR (see `export.compare`).
+
+The result is a plain Keras `.h5` model, used by `charclf.load` wherever a
+model path is accepted; `charclf.predict` feeds it grayscale characters of its
+own input size.
+"""
+import json
+import numpy as np
+
+import util
+import dataset
+import charclf as cf
+
+SIZES = (32, 64)
+SIZE = 32
+EPOCHS = 10
+# Share of the validation images (the same ones on every run)
+VALIDATION = 0.1
+# Weight of the teacher's softened probabilities in the distillation targets
+ALPHA = 0.7
+TEMPERATURE = 4.0
+
+# ---------- Model ----------
+def build(size=SIZE):
+    """
+    Builds the small classifier: three (four at 64 px) convolution blocks and
+    a global average pooling in front of the 26 letters.
+
+    :param size: {integer} Height and width of the grayscale input
+    :return: {keras model} Compiled, untrained model
+    """
+    import tensorflow as tf
+
+    layers = tf.keras.layers
+    blocks = [16, 32, 64] + ([64] if size >= 64 else [])
+    model = tf.keras.Sequential([tf.keras.Input((size, size, 1))])
+    for i, filters in enumerate(blocks):
+        if i > 0:
+            model.add(layers.MaxPooling2D())
+        model.add(layers.Conv2D(filters, 3, padding="same", use_bias=False))
+        model.add(layers.BatchNormalization())
+        model.add(layers.ReLU())
+    model.add(layers.GlobalAveragePooling2D())
+    model.add(layers.Dropout(0.2))
+    model.add(layers.Dense(26, activation="softmax"))
+    model.compile(optimizer=tf.keras.optimizers.Adam(1e-3),
+                  loss="categorical_crossentropy", metrics=["accuracy"])
+    return model
+
+# ---------- Distillation ----------
+def soften(probabilities, temperature=TEMPERATURE):
+    """
+    Softmax of the logits divided by the temperature, from the probabilities
+    (the teacher only gives those).
+
+    :param probabilities: {numpy array} (N, 26) probabilities
+    :param temperature: {float} Higher values spread the probabilities
+    :return: {numpy array} (N, 26) softened probabilities
+    """
+    logits = np.log(np.clip(probabilities, 1e-8, 1.0)) / temperature
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+def softTargets(teacher, paths, labels, alpha=ALPHA, temperature=TEMPERATURE):
+    """
+    Distillation targets: the teacher's softened probabilities mixed with the
+    one hot true labels.
+
+    :param teacher: Loaded teacher model (see `charclf.load`)
+    :param paths: {list} Image files
+    :param labels: {list} Letter index of every image
+    :return: {numpy array} float32 (N, 26) targets
+    """
+    probabilities = []
+    for i in range(0, len(paths), cf.MAX_INFLIGHT):
+        crops = [util.readImage(p) for p in paths[i:i + cf.MAX_INFLIGHT]]
+        probabilities.append(cf.predict(teacher, crops))
+    probabilities = np.concatenate(probabilities) if probabilities else np.zeros((0, 26))
+    onehot = np.eye(26)[np.asarray(labels, dtype=int)]
+    return ((1 - alpha) * onehot + alpha * soften(probabilities, temperature)).astype(np.float32)
+
+# ---------- Training ----------
+def split(paths, labels, validation=VALIDATION):
+    """
+    Holds every k-th image out for validation, k = 1 / `validation`.
+
+    :return: {tuple} ((train paths, labels), (validation paths, labels))
+    """
+    k = max(2, round(1 / validation)) if validation > 0 else len(paths) + 1
+    held = [i % k == k - 1 for i in range(len(paths))]
+    train = [(p, l) for p, l, h in zip(paths, labels, held) if not h]
+    valid = [(p, l) for p, l, h in zip(paths, labels, held) if h]
+    return tuple(map(list, zip(*train))) or ([], []), tuple(map(list, zip(*valid))) or ([], [])
+
+def train(folder, outPath, size=SIZE, epochs=EPOCHS, batch_size=util.BATCH_SIZE, teacher=None,
+          alpha=ALPHA, temperature=TEMPERATURE, validation=VALIDATION, seed=0, verbose=2):
+    """
+    Trains (or distills) the small classifier on a dataset folder and saves it.
+
+    :param folder: {string} Folder with one sub folder per letter
+    :param outPath: {string} Where to save the `.h5` model
+    :param size: {integer} Height and width of the grayscale input
+    :param epochs: {integer} Passes over the training images
+    :param batch_size: {integer} Images per training step
+    :param teacher: {string} Location of the model to distill, None to train on the labels only
+    :param alpha: {float} Weight of the teacher's probabilities in the targets
+    :param temperature: {float} Softening of the teacher's probabilities
+    :param validation: {float} Share of the images held out for validation
+    :param seed: {integer} Seed of the weights and of the shuffling
+    :return: {tuple} (trained keras model, history {dict})
+    """
+    import tensorflow as tf
+
+    paths, labels = dataset.listDataset(folder)
+    if len(paths) == 0:
+        raise ValueError(f"No character images found in {folder}")
+    (trainPaths, trainLabels), (validPaths, validLabels) = split(paths, labels, validation)
+
+    targets, onehot = trainLabels, True
+    if teacher is not None:
+        targets, onehot = softTargets(cf.load(teacher), trainPaths, trainLabels, alpha, temperature), False
+
+    tf.keras.utils.set_random_seed(seed)
+    # The letter sorted files (and their targets) are shuffled with the seed first
+    data = dataset.fromFiles(trainPaths, targets, batch_size, training=True, seed=seed,
+                             onehot=onehot, size=size, channels=1)
+    valid = None
+    if validPaths:
+        valid = dataset.fromFiles(validPaths, validLabels, batch_size, size=size, channels=1)
+
+    model = build(size)
+    history = model.fit(data, validation_data=valid, epochs=epochs, verbose=verbose)
+    model.save(outPath)
+    return model, history.history
+
+
+if __name__ == "__main__":
+    import argparse
+    import export
+
+    parser = argparse.ArgumentParser(description="Train a small grayscale character classifier")
+    parser.add_argument("folder", help="Dataset folder with one sub folder per letter")
+    parser.add_argument("--out", required=True, help="Location of the trained .h5 model")
+    parser.add_argument("--size", type=int, choices=SIZES, default=SIZE)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=util.BATCH_SIZE)
+    parser.add_argument("--teacher", help="Model to distill (e.g. the hub .h5 classifier)")
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE)
+    parser.add_argument("--validation", type=float, default=VALIDATION)
+    parser.add_argument("--compare", metavar="DIR",
+                        help="Compare the trained model with the reference one on the crops in DIR")
+    parser.add_argument("--reference", help="Reference model of the comparison (default: the teacher)")
+    parser.add_argument("--json", help="Also write the comparison report to this file")
+    args = parser.parse_args()
+
+    train(args.folder, args.out, args.size, args.epochs, args.batch_size, args.teacher,
+          args.alpha, args.temperature, args.validation)
+    print(f"Saved model: {args.out}")
+
+    if args.compare:
+        reference = args.reference or args.teacher
+        reports = export.compare(([reference] if reference else []) + [args.out], args.compare)
+        export.printReport(reports)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(reports, f, indent=2)
+    exit(0)
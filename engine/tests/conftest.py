@@ -0,0 +1,13 @@
+"""
+@file conftest.py Pytest configuration for the engine tests.
+
+The engine modules import each other by their plain names (`import util`),
+just as they do when run from the `engine` directory, so that directory is
+put on the import path before the tests are collected.
+"""
+import os
+import sys
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ENGINE_DIR not in sys.path:
+    sys.path.insert(0, ENGINE_DIR)
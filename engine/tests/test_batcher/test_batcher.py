@@ -0,0 +1,81 @@
+"""
+@file test_batcher.py Used for testing the engine `batcher` module.
+
+This module contains the test cases for the micro-batching scheduler.
+"""
+import threading
+import unittest as utest
+import numpy as np
+import batcher
+
+class EchoModel:
+    """
+    Stand-in classifier whose predictions echo the first input value,
+    recording the size of every batch it is called with.
+    """
+    def __init__(self):
+        self.sizes = []
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        self.sizes.append(len(batch))
+        return np.repeat(batch[:, :1], 26, axis=1)
+
+class TestMicroBatcher(utest.TestCase):
+
+    def test_results_routed_to_callers(self):
+        """
+        Concurrent callers get back exactly the rows they submitted, in order.
+        """
+        model = EchoModel()
+        b = batcher.MicroBatcher(model, max_batch=16, max_wait=0.05)
+        results = {}
+
+        def call(n):
+            batch = np.arange(n * 100, n * 100 + n, dtype=np.float32)[:, None]
+            results[n] = b.predict(batch)
+
+        threads = [threading.Thread(target=call, args=(n,)) for n in range(1, 9)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        b.close()
+
+        for n, pred in results.items():
+            np.testing.assert_array_equal(pred[:, 0], np.arange(n * 100, n * 100 + n))
+        # 36 characters from 8 callers, at most 16 per model call
+        self.assertEqual(sum(model.sizes), 36)
+        self.assertTrue(max(model.sizes) <= 16)
+        self.assertTrue(len(model.sizes) < 8)
+
+    def test_flush_on_timeout(self):
+        """
+        A lone caller is served after `max_wait` without a full batch.
+        """
+        model = EchoModel()
+        b = batcher.MicroBatcher(model, max_batch=64, max_wait=0.001)
+        pred = b.predict(np.ones((3, 1), dtype=np.float32))
+        stats = b.stats()
+        b.close()
+
+        self.assertEqual(pred.shape, (3, 26))
+        self.assertEqual(stats["batches"], 1)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertAlmostEqual(stats["fill_ratio"], 3 / 64)
+
+    def test_errors_reach_callers(self):
+        """
+        A failing model call raises in the callers instead of hanging them.
+        """
+        class Broken:
+            def predict(self, batch, batch_size=None, verbose=0):
+                raise ValueError("broken")
+
+        b = batcher.MicroBatcher(Broken(), max_wait=0.001)
+        with self.assertRaises(ValueError):
+            b.predict(np.ones((2, 1), dtype=np.float32))
+        b.close()
+
+
+if __name__ == "__main__":
+    utest.main()
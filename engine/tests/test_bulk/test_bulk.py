@@ -0,0 +1,93 @@
+"""
+@file test_bulk.py Used for testing the engine `bulk` module.
+
+This module OCRs a few files through the pool of segmentation processes with a
+stand-in classifier, checking the order of the results and that failures,
+including a dying pool process, only affect their own file.
+"""
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest as utest
+from unittest import mock
+import util
+import bulk
+from tests.test_main.test_main import SequenceModel
+
+ENGINE_DIR = os.path.dirname(util.__file__)
+WORD_DIR = os.path.join(ENGINE_DIR, "images", "words", "test_sample")
+_segmentFile = bulk.segmentFile
+
+def segmentOrDie(imageLocation):
+    # Pool function taking its process down on the files named "die..."
+    if os.path.basename(imageLocation).startswith("die"):
+        os._exit(1)
+    return _segmentFile(imageLocation)
+
+class TestBulk(utest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.files = []
+        sources = [os.path.join(ENGINE_DIR, "images", "test_sample.jpg")] + \
+                  [os.path.join(WORD_DIR, f) for f in ("0.png", "3.png", "5.png")]
+        for name, source in zip(("a.jpg", "b.png", "c.png", "d.png"), sources):
+            self.files.append(os.path.join(self.folder, name))
+            shutil.copy(source, self.files[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_bulk(self, files, window=2):
+        out = io.StringIO()
+        summary = bulk.run(files, out, SequenceModel(), workers=2, window=window)
+        return summary, [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_input_order(self):
+        """
+        One record per file in input order, each with the characters of its own file.
+        """
+        files = self.files + self.files[::-1]
+        summary, records = self.run_bulk(files)
+        self.assertEqual([r["file"] for r in records], files)
+        expected = [len(_segmentFile(f)["chars"]) for f in files]
+        self.assertEqual([r["chars"] for r in records], expected)
+        self.assertEqual(summary["chars"], sum(expected))
+        self.assertEqual(summary["failed"], 0)
+        self.assertTrue(all(len(r["pages"]) == 1 and r["error"] is None for r in records))
+
+    def test_unreadable_file(self):
+        """
+        A file that cannot be read gets an error record, the others their text.
+        """
+        bad = os.path.join(self.folder, "bad.png")
+        with open(bad, "w") as f:
+            f.write("not an image")
+        files = self.files[:2] + [bad] + self.files[2:]
+        summary, records = self.run_bulk(files)
+        self.assertEqual([r["file"] for r in records], files)
+        self.assertIn("ValueError", records[2]["error"])
+        self.assertIsNone(records[2]["pages"])
+        self.assertTrue(all(r["error"] is None and r["pages"][0].strip() for r in records[:2] + records[3:]))
+        self.assertEqual((summary["files"], summary["failed"]), (5, 1))
+
+    def test_dead_process(self):
+        """
+        A file taking its pool process down fails alone, the pool is recreated for the others.
+        """
+        die = os.path.join(self.folder, "die.png")
+        shutil.copy(self.files[1], die)
+        files = self.files[:2] + [die] + self.files[2:]
+        # Imported by its package path, as the spawned processes import it
+        from tests.test_bulk.test_bulk import segmentOrDie as pooled
+        with mock.patch.object(bulk, "segmentFile", pooled):
+            summary, records = self.run_bulk(files)
+        self.assertEqual([r["file"] for r in records], files)
+        self.assertIn("BrokenProcessPool", records[2]["error"])
+        self.assertTrue(all(r["error"] is None for r in records[:2] + records[3:]))
+        self.assertEqual((summary["files"], summary["failed"]), (5, 1))
+
+if __name__ == "__main__":
+    utest.main()
@@ -0,0 +1,63 @@
+"""
+@file test_cache.py Used for testing the engine `cache` module.
+
+This module contains the test cases for the recognition result cache.
+"""
+import os
+import tempfile
+import unittest as utest
+import numpy as np
+import cache
+
+class TestResultCache(utest.TestCase):
+
+    def test_lru_by_bytes(self):
+        """
+        The least recently used entries are evicted once over budget.
+        """
+        c = cache.ResultCache(max_bytes=3 * (cache.OVERHEAD + 12))
+        for k in ("a", "b", "c"):
+            c.put(k, "x" * 11)
+        c.get("a")
+        c.put("d", "x" * 11)
+
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(c.get("a"), "x" * 11)
+        self.assertTrue(c.stats()["bytes"] <= c.max_bytes)
+        self.assertEqual(c.stats()["hits"], 2)
+        self.assertEqual(c.stats()["misses"], 1)
+
+    def test_persisted(self):
+        """
+        Entries written to the database are found by a new cache.
+        """
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "cache.db")
+            c = cache.ResultCache(path=path)
+            c.put("key", "TEXT")
+            c.close()
+
+            c = cache.ResultCache(path=path)
+            self.assertEqual(c.get("key"), "TEXT")
+            c.close()
+
+class TestOCRCache(utest.TestCase):
+
+    def test_keys(self):
+        """
+        Keys follow the pixels and the model, not the array object.
+        """
+        model = ["v1"]
+        c = cache.OCRCache(lambda: model[0], "1")
+        image = np.arange(60, dtype=np.uint8).reshape(6, 10)
+
+        self.assertEqual(c.pageKey(image), c.pageKey(image.copy()))
+        self.assertNotEqual(c.pageKey(image), c.wordKey(image))
+        self.assertNotEqual(c.pageKey(image), c.pageKey(image[:, :5]))
+        key = c.pageKey(image)
+        model[0] = "v2"
+        self.assertNotEqual(c.pageKey(image), key)
+
+
+if __name__ == "__main__":
+    utest.main()
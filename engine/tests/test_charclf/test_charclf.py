@@ -0,0 +1,152 @@
+"""
+@file test_charclf.py Used for testing the engine `charclf` module.
+
+This module contains the test cases for classifying ordered character crops,
+for the compiled classifier and for the classifier cascade.
+"""
+import os
+import shutil
+import tempfile
+import unittest as utest
+import cv2 as cv
+import numpy as np
+import util
+import charseg as cs
+import charclf as cf
+import profiler
+from tests.test_main.test_main import SequenceModel
+
+WORD = os.path.join(os.path.dirname(util.__file__), "images", "words", "test_sample", "0.png")
+
+class TestOrderedCrops(utest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.crops = [np.full((40, 20 + i, 3), 10 * i, dtype=np.uint8) for i in range(12)]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_stream(self):
+        """
+        Results keep the input order and keys, whatever the chunk size.
+        """
+        for max_inflight in (1, 5, 64):
+            results = list(cf.iterClassify(SequenceModel(), iter(self.crops), max_inflight=max_inflight))
+            self.assertEqual([k for k, l, c in results], list(range(12)))
+            self.assertEqual("".join(l for k, l, c in results), "ABCDEFGHIJKL")
+            self.assertTrue(all(c == 1.0 for k, l, c in results))
+
+        keyed = [(f"c{i}", c) for i, c in enumerate(self.crops)]
+        keys = [k for k, l, c in cf.iterClassify(SequenceModel(), keyed, max_inflight=5)]
+        self.assertEqual(keys, [f"c{i}" for i in range(12)])
+
+    def test_numbered_files(self):
+        """
+        Without manifest, numbered files are read in number order.
+        """
+        for i in range(12):
+            cv.imwrite(os.path.join(self.folder, f"{i}.png"), self.crops[i])
+        names = [os.path.basename(f) for f in cf.sortedCrops(self.folder)]
+        self.assertEqual(names, [f"{i}.png" for i in range(12)])
+        names = [os.path.basename(f) for f in cf.orderedCrops(folder=self.folder)]
+        self.assertEqual(names, [f"{i}.png" for i in range(12)])
+
+    def test_manifest(self):
+        """
+        A saved word is classified from its manifest, ignoring older files.
+        """
+        cv.imwrite(os.path.join(self.folder, "40.png"), self.crops[0])
+        chars = cs.main(util.readImage(WORD), save=True, folder=self.folder)
+        files = cf.readManifest(os.path.join(self.folder, cs.MANIFEST))
+
+        self.assertEqual([os.path.basename(f) for f in files], [f"{i}.png" for i in range(len(chars))])
+        self.assertEqual(cf.orderedCrops(folder=self.folder), files)
+        for f, c in zip(files, chars):
+            np.testing.assert_array_equal(util.readImage(f), c)
+        text = cf.main(SequenceModel(), os.path.join(self.folder, cs.MANIFEST))
+        self.assertEqual(text, "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:len(chars)])
+
+class TestCompiled(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import tensorflow as tf
+        tf.keras.utils.set_random_seed(0)
+        cls.keras = tf.keras.Sequential([tf.keras.Input((8, 8, 3)), tf.keras.layers.Flatten(),
+                                         tf.keras.layers.Dense(26, activation="softmax")])
+
+    def test_same_predictions(self):
+        """
+        Padded bucketed batches give the predictions of the Keras model.
+        """
+        model = cf.CompiledModel(self.keras, buckets=(1, 4, 16))
+        batch = np.random.default_rng(0).random((23, 8, 8, 3), dtype=np.float32)
+        expected = self.keras.predict(batch, verbose=0)
+        for batch_size in (1, 5, 16, 64):
+            np.testing.assert_allclose(model.predict(batch, batch_size=batch_size), expected,
+                                       rtol=1e-5, atol=1e-6)
+        self.assertEqual(model.predict(batch[:0]).shape, (0, 26))
+
+    def test_warmup(self):
+        """
+        Warm up traces every bucket once, later calls trace nothing new.
+        """
+        model = cf.CompiledModel(self.keras, buckets=(2, 8))
+        report = model.warmup(repeat=1)
+        self.assertEqual(sorted(report), [2, 8])
+        functions = dict(model.functions)
+        model.predict(np.zeros((11, 8, 8, 3), dtype=np.float32))
+        self.assertEqual(model.functions, functions)
+
+class StubModel:
+    """
+    Grayscale 8x8 model: predicts letter `letter` with the crop's mean brightness
+    as its probability, recording the size of every batch it gets.
+    """
+    input_shape = (None, 8, 8, 1)
+
+    def __init__(self, letter):
+        self.letter = letter
+        self.batches = []
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        self.batches.append(len(batch))
+        confidence = batch.mean(axis=(1, 2, 3))
+        predictions = np.tile(((1 - confidence) / 25)[:, np.newaxis], (1, 26))
+        predictions[:, self.letter] = confidence
+        return predictions.astype(np.float32)
+
+class TestCascade(utest.TestCase):
+
+    def setUp(self):
+        # Crops of brightness 0.99, 0.5, 0.95, 0.2, 0.8
+        self.chars = [np.full((12, 12), round(v * 255), dtype=np.uint8)
+                      for v in (0.99, 0.5, 0.95, 0.2, 0.8)]
+        self.fast, self.heavy = StubModel(0), StubModel(1)
+
+    def test_escalation(self):
+        """
+        Only the characters the fast model is unsure of go to the heavy model, in one batch.
+        """
+        cascade = cf.Cascade(self.fast, self.heavy, threshold=0.9)
+        with profiler.profile() as p:
+            text = cf.extractText(cf.predict(cascade, self.chars))
+        self.assertEqual(text, "ABABB")
+        self.assertEqual(self.fast.batches, [5])
+        self.assertEqual(self.heavy.batches, [3])
+        self.assertEqual(p.toDict()["counters"]["cascade.escalated"], 3)
+        self.assertEqual(cascade.stats(), {"chars": 5, "escalated": 3, "rate": 0.6})
+
+    def test_thresholds(self):
+        """
+        A zero threshold never runs the heavy model, one above 1 always does.
+        """
+        self.assertEqual(cf.classify(cf.Cascade(self.fast, self.heavy, 0.0), self.chars), "AAAAA")
+        self.assertEqual(self.heavy.batches, [])
+        self.assertEqual(cf.classify(cf.Cascade(self.fast, self.heavy, 1.01), self.chars), "BBBBB")
+        self.assertEqual(self.heavy.batches, [5])
+        self.assertEqual(cf.predict(cf.Cascade(self.fast, self.heavy), []).shape, (0, 26))
+
+if __name__ == "__main__":
+    utest.main()
@@ -0,0 +1,45 @@
+"""
+@file test_charseg.py Used for testing the engine `charseg` module.
+
+This module checks the array based projection profile steps against the
+original per column loops (the reference implementation, see
+`benchmarks/reference.py`).
+"""
+import unittest as utest
+import numpy as np
+import charseg as cs
+from benchmarks import reference as ref
+
+class TestVectorizedPSC(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.counts = ref.samplePixelCounts()
+
+    def test_sample_images(self):
+        """
+        Identical PSC values on every word of the sample images.
+        """
+        self.assertTrue(len(self.counts) > 10)
+        for pixels in self.counts:
+            self.assertEqual(ref.vectorizedPSC(pixels), ref.referencePSC(pixels))
+
+    def test_steps(self):
+        """
+        Identical intermediate results, including runs touching the borders.
+        """
+        rng = np.random.default_rng(0)
+        counts = self.counts + [rng.integers(0, 60, n) for n in (1, 2, 50, 500)]
+        counts += [np.zeros(30), np.full(30, 100), np.r_[np.full(5, 100), np.zeros(5)]]
+        for pixels in counts:
+            binary = cs.binarizeCount(pixels)
+            np.testing.assert_array_equal(binary, ref.binarizeCount(pixels))
+            peaks, widths = cs.getPeaks(binary)
+            self.assertEqual((peaks, widths), ref.getPeaks(binary))
+            self.assertEqual(cs.flagged(widths), ref.flagged(widths))
+            self.assertEqual(cs.troughs(peaks), ref.troughs(peaks))
+            self.assertEqual(ref.vectorizedPSC(pixels), ref.referencePSC(pixels))
+
+
+if __name__ == "__main__":
+    utest.main()
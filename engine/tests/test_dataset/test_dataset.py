@@ -0,0 +1,140 @@
+"""
+@file test_dataset.py Used for testing the engine `dataset` module.
+
+This module packs a small character dataset into shards and streams it back,
+and checks that a large letter sorted dataset is streamed in mixed batches.
+"""
+import os
+import shutil
+import tempfile
+import unittest as utest
+import numpy as np
+import util
+import dataset
+import profiler
+
+CHAR_DIR = os.path.join(os.path.dirname(util.__file__), "images", "chars", "saved")
+
+class TestDataset(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Two letters with the saved crops each
+        cls.root = tempfile.mkdtemp()
+        cls.folder = os.path.join(cls.root, "chars")
+        for letter in ("A", "C"):
+            shutil.copytree(CHAR_DIR, os.path.join(cls.folder, letter))
+        cls.shards = dataset.pack(cls.folder, os.path.join(cls.root, "shards"), shards=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_list(self):
+        """
+        Images are listed by letter with their label index.
+        """
+        paths, labels = dataset.listDataset(self.folder)
+        n = len(os.listdir(CHAR_DIR))
+        self.assertEqual(labels, [0] * n + [2] * n)
+        self.assertTrue(all(os.path.basename(os.path.dirname(p)) == "AC"[l // 2]
+                            for p, l in zip(paths, labels)))
+
+    def test_shards(self):
+        """
+        Shards give back every image decoded as the model input, with its label.
+        """
+        self.assertEqual(len(self.shards), 3)
+        images, labels = zip(*dataset.fromShards(os.path.dirname(self.shards[0]), batch_size=3))
+        images, labels = np.concatenate(images), np.concatenate(labels)
+
+        paths, expected = dataset.listDataset(self.folder)
+        self.assertEqual(images.shape, (len(paths), util.IMG_SIZE, util.IMG_SIZE, 3))
+        self.assertEqual(sorted(np.argmax(labels, axis=1)), sorted(expected))
+        reference = np.stack([util.process_image(p).numpy() for p in paths])
+        # Same images, whatever the order of the shards
+        np.testing.assert_allclose(np.sort(images.reshape(len(paths), -1).sum(axis=1)),
+                                   np.sort(reference.reshape(len(paths), -1).sum(axis=1)), rtol=1e-5)
+
+    def test_deterministic(self):
+        """
+        A seeded, deterministic training pipeline repeats its order.
+        """
+        def order():
+            data = dataset.fromShards(self.shards[0].replace("00000-of", "*-of"), batch_size=2,
+                                      training=True, deterministic=True, seed=7, onehot=False)
+            return [int(l) for images, labels in data for l in labels]
+        self.assertEqual(order(), order())
+
+    def test_files(self):
+        """
+        Reading the files directly gives the same batches as the shards hold.
+        """
+        paths, labels = dataset.listDataset(self.folder)
+        images, found = zip(*dataset.fromFiles(paths, labels, batch_size=4, onehot=False))
+        self.assertEqual(np.concatenate(found).tolist(), labels)
+        reference = np.stack([util.process_image(p).numpy() for p in paths])
+        np.testing.assert_allclose(np.concatenate(images), reference, atol=1e-6)
+
+    def test_throughput(self):
+        """
+        Every batch taken from the dataset is profiled, with the images delivered.
+        """
+        paths, labels = dataset.listDataset(self.folder)
+        with profiler.profile() as p:
+            (images, seconds, rate), = dataset.throughput(dataset.fromFiles(paths, labels, batch_size=4))
+        result = p.toDict()
+        self.assertEqual(images, len(paths))
+        self.assertEqual(result["counters"]["dataset.images"], len(paths))
+        # One more call finds the end of the dataset
+        self.assertEqual(result["stages"]["dataset.nextBatch"]["calls"], -(-len(paths) // 4) + 1)
+
+class TestShuffling(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Two letters of more images each than the shuffle buffer holds, sorted by letter
+        cls.root = tempfile.mkdtemp()
+        cls.folder = os.path.join(cls.root, "chars")
+        crop = os.path.join(CHAR_DIR, sorted(os.listdir(CHAR_DIR))[0])
+        for letter in ("A", "B"):
+            os.makedirs(os.path.join(cls.folder, letter))
+            for i in range(dataset.SHUFFLE_BUFFER + 100):
+                os.link(crop, os.path.join(cls.folder, letter, f"{i}.png"))
+        cls.paths, cls.labels = dataset.listDataset(cls.folder)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def assertMixed(self, data, labelsOf=lambda labels: labels):
+        for _, (images, labels) in zip(range(3), data):
+            self.assertEqual(sorted(set(np.asarray(labelsOf(labels)).tolist())), [0, 1])
+
+    def test_files(self):
+        """
+        Training batches of letter sorted files hold both letters.
+        """
+        self.assertEqual(self.labels[0], 0)
+        self.assertMixed(dataset.fromFiles(self.paths, self.labels, batch_size=32, training=True,
+                                           cache=None, seed=0, onehot=False, size=8))
+
+    def test_shards(self):
+        """
+        Training batches of the shards of a letter sorted folder hold both letters.
+        """
+        # One shard: the records are read in the order they were packed
+        shards = dataset.pack(self.folder, os.path.join(self.root, "shards"), shards=1)
+        self.assertMixed(dataset.fromShards(os.path.dirname(shards[0]), batch_size=32, training=True,
+                                            cache=None, seed=0, onehot=False, size=8))
+
+    def test_create_data_batches(self):
+        """
+        The training batches of `create_data_batches` shuffle all the file paths.
+        """
+        onehot = np.eye(26)[self.labels]
+        self.assertMixed(util.create_data_batches(self.paths, onehot, batch_size=32),
+                         lambda labels: np.argmax(labels, axis=1))
+
+if __name__ == "__main__":
+    utest.main()
@@ -0,0 +1,94 @@
+"""
+@file test_export.py Used for testing the engine `export` module.
+
+This module exports a tiny Keras classifier to TensorFlow Lite, runs it through
+`charclf.TFLiteModel` and compares it with the Keras model.
+"""
+import os
+import shutil
+import tempfile
+import unittest as utest
+import cv2 as cv
+import numpy as np
+import charclf as cf
+import export
+
+class TestExport(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        import tensorflow as tf
+        tf.keras.utils.set_random_seed(0)
+        cls.root = tempfile.mkdtemp()
+        cls.keras = tf.keras.Sequential([tf.keras.Input((8, 8, 3)), tf.keras.layers.Flatten(),
+                                         tf.keras.layers.Dense(26, activation="softmax")])
+        cls.path = os.path.join(cls.root, "tiny.h5")
+        cls.keras.save(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_float16(self):
+        """
+        The float16 model predicts as the Keras one, also batches larger than `batch_size`.
+        """
+        out = export.export(self.path, quantize="float16")
+        self.assertEqual(out, os.path.join(self.root, "tiny-float16.tflite"))
+
+        model = cf.load(out)
+        self.assertIsInstance(model, cf.TFLiteModel)
+        self.assertEqual(cf.inputShape(model), (8, 3))
+        batch = np.random.default_rng(0).random((23, 8, 8, 3), dtype=np.float32)
+        expected = self.keras.predict(batch, verbose=0)
+        for batch_size in (4, 23, 64):
+            np.testing.assert_allclose(model.predict(batch, batch_size=batch_size), expected,
+                                       atol=1e-3)
+
+    def test_int8_needs_calibration(self):
+        """
+        Unknown quantizations and int8 without calibration crops are refused.
+        """
+        with self.assertRaises(ValueError):
+            export.export(self.path, quantize="int4")
+        with self.assertRaises(ValueError):
+            export.export(self.path, quantize="int8")
+
+    def test_compare(self):
+        """
+        Crops kept in one folder per letter are compared with their accuracy.
+        """
+        folder = os.path.join(self.root, "crops")
+        rng = np.random.default_rng(1)
+        for letter in ("A", "B"):
+            os.makedirs(os.path.join(folder, letter))
+            for i in range(3):
+                crop = rng.integers(0, 256, (12, 10, 3), dtype=np.uint8)
+                cv.imwrite(os.path.join(folder, letter, f"{i}.png"), crop)
+
+        out = export.export(self.path, os.path.join(self.root, "tiny.tflite"))
+        reports = export.compare([self.path, out], folder, repeat=1)
+        self.assertEqual([r["model"] for r in reports], [self.path, out])
+        self.assertEqual(reports[0]["agreement"], 1.0)
+        self.assertEqual(reports[1]["agreement"], 1.0)
+        self.assertEqual(reports[0]["input_kb"], 8 * 8 * 3 * 4 / 1024)
+        self.assertIn("accuracy", reports[1])
+
+    def test_unreadable_crop(self):
+        """
+        A crop that cannot be read is reported by name, before any model runs.
+        """
+        folder = os.path.join(self.root, "corrupt")
+        os.makedirs(folder)
+        cv.imwrite(os.path.join(folder, "0.png"), np.zeros((12, 10, 3), dtype=np.uint8))
+        with open(os.path.join(folder, "1.png"), "wb") as f:
+            f.write(b"not a png")
+        with self.assertRaisesRegex(ValueError, "1.png"):
+            export.readCrops(folder)
+        with self.assertRaisesRegex(ValueError, "1.png"):
+            export.export(self.path, os.path.join(self.root, "int8.tflite"), "int8", folder)
+        with self.assertRaisesRegex(ValueError, "1.png"):
+            export.compare([self.path], folder)
+
+if __name__ == "__main__":
+    utest.main()
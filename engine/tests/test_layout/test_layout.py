@@ -0,0 +1,106 @@
+"""
+@file test_layout.py Used for testing the engine `layout` module.
+
+This module contains the test cases for the structured page layout.
+"""
+import os
+import json
+import unittest as utest
+import numpy as np
+import util
+import cv2 as cv
+import main as Main
+import layout
+import wordext as wx
+from tests.test_main.test_main import SequenceModel
+
+IMAGE = os.path.join(os.path.dirname(util.__file__), "images", "test_sample.jpg")
+
+class TestPageLayout(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.image = util.readImage(IMAGE)
+        cls.page = Main.recognizeLayout(cls.image, SequenceModel())
+
+    def test_text(self):
+        """
+        The layout holds the same text as the plain recognition.
+        """
+        self.assertEqual(self.page.text(), Main.recognize(self.image, SequenceModel()))
+
+    def test_boxes(self):
+        """
+        Boxes are in original image coordinates and characters lie in their word.
+        """
+        h, w = self.image.shape[:2]
+        self.assertEqual((self.page.width, self.page.height), (w, h))
+        words = {(r["line"], r["word"]): r for r in self.page.words}
+        for c in self.page.chars:
+            word = words[(c["line"], c["word"])]
+            self.assertTrue(word["x"] - 1 <= c["x"] and c["x"] + c["w"] <= word["x"] + word["w"] + 1)
+            self.assertTrue(0 <= c["y"] and c["y"] + c["h"] <= h + 1)
+        self.assertTrue(np.all(self.page.chars["confidence"] == 1))
+        self.assertEqual(len(self.page.lines()), len(np.unique(self.page.words["line"])))
+
+    def test_serialization(self):
+        """
+        JSON and binary round trips give back the same records.
+        """
+        for page in (layout.PageLayout.fromDict(json.loads(json.dumps(self.page.toDict()))),
+                     layout.PageLayout.fromBytes(self.page.toBytes())):
+            np.testing.assert_array_equal(page.words, self.page.words)
+            np.testing.assert_array_equal(page.chars, self.page.chars)
+            self.assertEqual(page.text(), self.page.text())
+
+class TestCoordinates(utest.TestCase):
+    """
+    Synthetic page of known words, each made of three bars (characters).
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.image = np.full((560, 1120, 3), 255, dtype=np.uint8)
+        cls.words, cls.bars = [], []
+        for y in (60, 320):
+            for x in (80, 420, 760):
+                cls.words.append((x, y, 210, 150))
+                for k in range(3):
+                    cls.bars.append((x + 75 * k, y, 60, 150))
+                    cv.rectangle(cls.image, (x + 75 * k, y), (x + 75 * k + 59, y + 149), (0, 0, 0), -1)
+        cls.page = Main.recognizeLayout(cls.image, SequenceModel())
+
+    def test_word_boxes(self):
+        """
+        Every word is found where it was drawn (grown by the dilation only).
+        """
+        found = [tuple(int(r[k]) for k in "xywh") for r in self.page.words]
+        self.assertEqual(len(found), len(self.words))
+        for (x, y, w, h), (fx, fy, fw, fh) in zip(self.words, found):
+            self.assertTrue(0 <= x - fx <= 15 and 0 <= y - fy <= 15)
+            self.assertTrue(0 <= fx + fw - x - w <= 15 and 0 <= fy + fh - y - h <= 15)
+
+    def test_char_boxes(self):
+        """
+        Every character box holds the center of exactly one bar of its word.
+        """
+        chars = self.page.chars
+        self.assertEqual(len(chars), len(self.bars))
+        for c, (x, y, w, h) in zip(chars, self.bars):
+            cx, cy = x + w / 2, y + h / 2
+            self.assertTrue(c["x"] <= cx <= c["x"] + c["w"] and c["y"] <= cy <= c["y"] + c["h"])
+
+    def test_word_crops(self):
+        """
+        Word images are cut out of the rescaled page at their boxes.
+        """
+        boxes, rect = wx.locate(self.image)
+        s = self.image.shape[1] / rect.shape[1]
+        for line, crops in zip(boxes, wx.extract(self.image)):
+            for (x, y, w, h), crop in zip(line, crops):
+                region = self.image[int(y * s):int((y + h) * s), int(x * s):int((x + w) * s)]
+                back = cv.resize(crop, (region.shape[1], region.shape[0]))
+                self.assertLess(np.abs(back.astype(int) - region).mean(), 20)
+
+
+if __name__ == "__main__":
+    utest.main()
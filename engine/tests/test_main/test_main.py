@@ -4,9 +4,27 @@
 
 This module contains various test cases which the engine `main` must pass.
 """
+import os
 import unittest as utest 
+import numpy as np
+import util
 import main as Main
 
+WORD_DIR = os.path.join(os.path.dirname(util.__file__), "images", "words", "test_sample")
+
+class SequenceModel:
+    """
+    Stand-in classifier predicting A, B, C, ... in the order it is called.
+    """
+    def __init__(self):
+        self.calls, self.count = 0, 0
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        self.calls += 1
+        labels = (np.arange(len(batch)) + self.count) % 26
+        self.count += len(batch)
+        return np.eye(26)[labels]
+
 class TestMain(utest.TestCase):
 
     def test_location_empty(self):
@@ -35,6 +53,50 @@ class TestMain(utest.TestCase):
         # self.assertEqual(text, "File Found!")
 
 
+class TestTranscribe(utest.TestCase):
+
+    def setUp(self):
+        words = [util.readImage(os.path.join(WORD_DIR, f)) for f in sorted(os.listdir(WORD_DIR))]
+        self.lines = [words[:2], words[2:3], words[3:]]
+
+    def test_layout_restored(self):
+        """
+        Characters classified page-wide end up in their own word and line.
+        """
+        model = SequenceModel()
+        stats = {}
+        text = Main.transcribe(self.lines, model, max_inflight=3, stats=stats)
+
+        lines = text.split("\n")[:-1]
+        self.assertEqual([len(l.split()) for l in lines], [2, 1, 3])
+        letters = "".join(text.split())
+        self.assertEqual(len(letters), stats["chars"])
+        self.assertTrue("ABCDEFGHIJKLMNOPQRSTUVWXYZ".startswith(letters[:26]))
+
+    def test_batched_calls(self):
+        """
+        A window of pages is classified with one call per `max_inflight` characters.
+        """
+        model = SequenceModel()
+        stats = {}
+        texts = Main.transcribePages([self.lines] * 2, model, stats=stats)
+
+        self.assertEqual(len(texts), 2)
+        self.assertEqual(model.calls, -(-stats["chars"] // Main.cf.MAX_INFLIGHT))
+
+class TestStream(utest.TestCase):
+
+    def test_same_text_as_page(self):
+        """
+        Lines streamed one by one add up to the text of the whole page.
+        """
+        image = util.readImage(os.path.join(os.path.dirname(util.__file__), "images", "test_sample.jpg"))
+        text = Main.recognize(image, SequenceModel())
+        lines = list(Main.streamLines(image, SequenceModel()))
+
+        self.assertEqual([l["line"] for l in lines], list(range(len(lines))))
+        self.assertEqual("".join(l["text"] + "\n" for l in lines), text)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,103 @@
+"""
+@file test_profiler.py Used for testing the engine `profiler` module.
+
+This module checks the stage timers and counters, their exports and the
+instrumentation of the word extraction.
+"""
+import os
+import threading
+import unittest as utest
+import util
+import wordext as wx
+import profiler
+
+ENGINE_DIR = os.path.dirname(util.__file__)
+
+@profiler.timed("test.work")
+def work(n):
+    profiler.count("items", n)
+    return n * 2
+
+class TestProfiler(utest.TestCase):
+
+    def setUp(self):
+        profiler.resetTotals()
+
+    def test_disabled(self):
+        """
+        Without an active profile stages and counters measure nothing.
+        """
+        self.assertIsNone(profiler.active())
+        with profiler.stage("test.block"):
+            self.assertEqual(work(3), 6)
+        with profiler.profile(enabled=False) as p:
+            self.assertIsNone(p)
+            work(3)
+        self.assertNotIn("test.work", profiler.prometheus())
+
+    def test_stages_and_counters(self):
+        """
+        Calls and seconds of a stage add up, nested stages are kept apart.
+        """
+        with profiler.profile() as p:
+            with profiler.stage("test.block"):
+                work(2)
+                work(3)
+        result = p.toDict()
+        self.assertEqual(result["stages"]["test.work"]["calls"], 2)
+        self.assertEqual(result["stages"]["test.block"]["calls"], 1)
+        self.assertGreaterEqual(result["stages"]["test.block"]["seconds"],
+                                result["stages"]["test.work"]["seconds"])
+        self.assertEqual(result["counters"], {"items": 5})
+        self.assertIsNone(profiler.active())
+
+    def test_threads(self):
+        """
+        A profile only sees the work of its own thread.
+        """
+        def other():
+            with profiler.profile() as q:
+                work(100)
+            results.append(q.toDict())
+
+        results = []
+        with profiler.profile() as p:
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join()
+            work(1)
+        self.assertEqual(p.toDict()["counters"], {"items": 1})
+        self.assertEqual(results[0]["counters"], {"items": 100})
+
+    def test_exports(self):
+        """
+        Finished profiles add up in the Prometheus text, trace events cover every call.
+        """
+        for _ in range(2):
+            with profiler.profile() as p:
+                work(4)
+        text = profiler.prometheus()
+        self.assertIn('ocr_stage_calls_total{stage="test.work"} 2', text)
+        self.assertIn('ocr_items_total{item="items"} 8', text)
+
+        events = p.chromeTrace()["traceEvents"]
+        spans = [e for e in events if e["ph"] == "X"]
+        self.assertEqual([e["name"] for e in spans], ["test.work"])
+        self.assertGreaterEqual(spans[0]["dur"], 0)
+
+    def test_wordext(self):
+        """
+        The word extraction stages and word count of a page are recorded.
+        """
+        image = util.readImage(os.path.join(ENGINE_DIR, "images", "test_sample.jpg"))
+        with profiler.profile() as p:
+            boxes, rect = wx.locate(image)
+        result = p.toDict()
+        for name in ("wordext.preprocess", "wordext.dilate", "wordext.componentStats",
+                     "wordext.readingOrder"):
+            self.assertEqual(result["stages"][name]["calls"], 1)
+        self.assertEqual(result["counters"]["words"], sum(len(l) for l in boxes))
+        self.assertEqual(result["counters"]["lines"], len(boxes))
+
+if __name__ == "__main__":
+    utest.main()
@@ -0,0 +1,65 @@
+"""
+@file test_readorder.py Used for testing the engine `readorder` module.
+
+This module contains the test cases for the line grouping and reading order.
+"""
+import unittest as utest
+import numpy as np
+import readorder as ro
+from benchmarks.reference import page
+
+class TestReadingOrder(utest.TestCase):
+
+    def check(self, boxes, truth, **kwargs):
+        lines = ro.readingOrder(boxes, **kwargs)
+        position = {tuple(b): t for b, t in zip(boxes.tolist(), truth)}
+        found = [[position[tuple(b)] for b in line.tolist()] for line in lines]
+        expected = [[(i, j) for j in range(max(t[1] for t in truth) + 1)]
+                    for i in range(max(t[0] for t in truth) + 1)]
+        self.assertEqual(found, expected)
+
+    def test_page(self):
+        """
+        Every line found once, words from left to right.
+        """
+        self.check(*page())
+
+    def test_band_boundary(self):
+        """
+        Lines crossing the fixed 30 pixel bands of `extractLines` stay whole.
+        """
+        self.check(*page(lines=4, height=24, pitch=29))
+
+    def test_skew(self):
+        """
+        Slightly rotated lines are grouped correctly.
+        """
+        self.check(*page(lines=6, words=12, pitch=40, slope=0.08))
+        self.check(*page(lines=6, words=12, pitch=40, slope=-0.08))
+
+    def test_same_position(self):
+        """
+        Words sharing the same position are all kept.
+        """
+        boxes = np.array([[10, 10, 20, 20], [10, 10, 20, 20], [50, 10, 20, 20]])
+        lines = ro.readingOrder(boxes)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(len(lines[0]), 3)
+
+    def test_specks(self):
+        """
+        Specks join the nearest line instead of starting one.
+        """
+        boxes = np.array([[10, 10, 40, 20], [60, 10, 40, 20], [40, 22, 4, 4],
+                          [10, 50, 40, 20], [120, 58, 3, 3]])
+        self.assertEqual(ro.groupLines(boxes).tolist(), [0, 0, 0, 1, 1])
+
+    def test_empty(self):
+        """
+        No boxes, no lines.
+        """
+        self.assertEqual(ro.readingOrder(np.zeros((0, 4), dtype=np.int32)), [])
+        self.assertEqual(ro.groupLines(np.array([[0, 0, 5, 5]])).tolist(), [0])
+
+if __name__ == "__main__":
+    utest.main()
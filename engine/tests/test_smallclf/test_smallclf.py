@@ -0,0 +1,93 @@
+"""
+@file test_smallclf.py Used for testing the engine `smallclf` module.
+
+This module trains the small grayscale classifier on a tiny dataset and
+classifies characters with it, and checks the order of its training batches.
+"""
+import os
+import shutil
+import tempfile
+import unittest as utest
+from unittest import mock
+import numpy as np
+import util
+import charclf as cf
+import dataset
+import smallclf
+
+CHAR_DIR = os.path.join(os.path.dirname(util.__file__), "images", "chars", "saved")
+
+class TestSmallClassifier(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Two letters with the saved crops each
+        cls.root = tempfile.mkdtemp()
+        cls.folder = os.path.join(cls.root, "chars")
+        for letter in ("A", "C"):
+            shutil.copytree(CHAR_DIR, os.path.join(cls.folder, letter))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_soften(self):
+        """
+        Softened probabilities keep their order and spread with the temperature.
+        """
+        p = np.array([[0.7, 0.2, 0.1] + [0.0] * 23])
+        np.testing.assert_allclose(smallclf.soften(p, 1.0)[0, :3], [0.7, 0.2, 0.1], rtol=1e-5)
+        soft = smallclf.soften(p, 4.0)
+        np.testing.assert_allclose(soft.sum(axis=1), 1.0)
+        self.assertTrue(soft[0, 0] > soft[0, 1] > soft[0, 2] and soft[0, 0] < 0.7)
+
+    def test_split(self):
+        """
+        Every k-th image is held out, the same ones on every run.
+        """
+        paths = [f"{i}.png" for i in range(20)]
+        (train, trainLabels), (valid, validLabels) = smallclf.split(paths, list(range(20)), 0.25)
+        self.assertEqual(valid, ["3.png", "7.png", "11.png", "15.png", "19.png"])
+        self.assertEqual(len(train) + len(valid), 20)
+        self.assertEqual(validLabels, [3, 7, 11, 15, 19])
+
+    def test_train_and_classify(self):
+        """
+        A trained model is loaded by `charclf` and fed grayscale characters of its size.
+        """
+        out = os.path.join(self.root, "small.h5")
+        model, history = smallclf.train(self.folder, out, size=32, epochs=1, batch_size=4,
+                                        validation=0, verbose=0)
+        self.assertEqual(model.input_shape, (None, 32, 32, 1))
+
+        loaded = cf.load(out)
+        self.assertEqual(cf.inputShape(loaded), (32, 1))
+        crops = [util.readImage(os.path.join(CHAR_DIR, f)) for f in sorted(os.listdir(CHAR_DIR))]
+        predictions = cf.predict(loaded, crops)
+        self.assertEqual(predictions.shape, (len(crops), 26))
+        np.testing.assert_allclose(predictions.sum(axis=1), 1.0, rtol=1e-5)
+
+    def test_mixed_batches(self):
+        """
+        A letter sorted folder larger than the shuffle buffer is trained on in mixed batches.
+        """
+        folder = os.path.join(self.root, "large")
+        crop = os.path.join(CHAR_DIR, sorted(os.listdir(CHAR_DIR))[0])
+        for letter in ("A", "B"):
+            os.makedirs(os.path.join(folder, letter))
+            for i in range(dataset.SHUFFLE_BUFFER + 100):
+                os.link(crop, os.path.join(folder, letter, f"{i}.png"))
+
+        streams, stream = [], dataset.fromFiles
+        def fromFiles(*args, **kwargs):
+            streams.append(stream(*args, **kwargs))
+            return streams[-1]
+
+        with mock.patch.object(dataset, "fromFiles", fromFiles):
+            smallclf.train(folder, os.path.join(self.root, "large.h5"), epochs=1, batch_size=256,
+                           validation=0, verbose=0)
+        for _, (images, labels) in zip(range(3), streams[0]):
+            self.assertEqual(sorted(set(np.argmax(labels, axis=1).tolist())), [0, 1])
+
+if __name__ == "__main__":
+    utest.main()
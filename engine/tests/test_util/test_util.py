@@ -0,0 +1,136 @@
+"""
+@file test_util.py Used for testing the engine `util` module.
+
+This module contains the test cases for the image and batching utilities.
+"""
+import os
+import string
+import tracemalloc
+import unittest as utest
+import cv2 as cv
+import numpy as np
+import util
+
+CHAR_DIR = os.path.join(os.path.dirname(util.__file__), "images", "chars", "saved")
+
+class TestImageBatch(utest.TestCase):
+
+    def test_matches_file_pipeline(self):
+        """
+        In-memory batches must match the batches created from the png files.
+        """
+        files = [os.path.join(CHAR_DIR, f) for f in sorted(os.listdir(CHAR_DIR))]
+        expected = np.stack([util.process_image(f).numpy() for f in files])
+        batch = util.create_image_batch([cv.imread(f) for f in files])
+
+        self.assertEqual(batch.shape, expected.shape)
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch, expected, atol=1 / 255)
+
+    def test_grayscale_input(self):
+        """
+        Grayscale crops are expanded to 3 channels.
+        """
+        gray = np.full((40, 12), 255, dtype=np.uint8)
+        batch = util.create_image_batch([gray])
+
+        self.assertEqual(batch.shape, (1, util.IMG_SIZE, util.IMG_SIZE, 3))
+        np.testing.assert_allclose(batch, 1.0)
+
+    def test_small_grayscale(self):
+        """
+        Single channel batches of the small classifiers match their training input.
+        """
+        import tensorflow as tf
+        import dataset
+
+        files = [os.path.join(CHAR_DIR, f) for f in sorted(os.listdir(CHAR_DIR))]
+        expected = np.stack([dataset.decodeImage(tf.io.read_file(f), 32, 1).numpy() for f in files])
+        batch = util.create_image_batch([cv.imread(f) for f in files], 32, 1)
+
+        self.assertEqual(batch.shape, (len(files), 32, 32, 1))
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch, expected, atol=2 / 255)
+
+class TestResize(utest.TestCase):
+
+    def setUp(self):
+        self.image = np.random.default_rng(0).integers(0, 255, (60, 90, 3), dtype=np.uint8)
+
+    def test_reshape(self):
+        """
+        Sizes are (width, height) with the aspect ratio kept.
+        """
+        self.assertEqual(util.reshape(self.image), (224, 149))
+        self.assertEqual(util.reshape(self.image, width=45), (45, 30))
+        self.assertEqual(util.rescaleImage(self.image, (45, 30)).shape, (30, 45, 3))
+
+    def test_interpolation(self):
+        """
+        The requested interpolation is used.
+        """
+        for interpolation in (cv.INTER_NEAREST, cv.INTER_CUBIC):
+            np.testing.assert_array_equal(
+                util.rescaleImage(self.image, (224, 149), interpolation=interpolation),
+                cv.resize(self.image, (224, 149), interpolation=interpolation))
+
+    def test_resized(self):
+        """
+        Each size of an image is computed once and shared, read-only.
+        """
+        a = util.resized(self.image, (45, 30))
+        self.assertIs(util.resized(self.image, (45, 30)), a)
+        self.assertIsNot(util.resized(self.image, (45, 30), cv.INTER_CUBIC), a)
+        self.assertIsNot(util.resized(self.image.copy(), (45, 30)), a)
+        self.assertFalse(a.flags.writeable)
+        np.testing.assert_array_equal(a, util.rescaleImage(self.image, (45, 30)))
+
+class TestLabels(utest.TestCase):
+
+    def setUp(self):
+        self.predictions = np.random.default_rng(0).random((1000, 26)).astype(np.float32)
+
+    def test_decode(self):
+        """
+        The text matches the letter of the argmax of every prediction.
+        """
+        expected = "".join(string.ascii_uppercase[np.argmax(p)] for p in self.predictions)
+        self.assertEqual(util.decodeLabels(self.predictions), expected)
+        self.assertEqual("".join(util.get_pred_label(p) for p in self.predictions), expected)
+        self.assertEqual(util.decodeLabels(np.zeros((0, 26))), "")
+
+    def test_top(self):
+        """
+        Candidates come most likely first, the first one being the decoded letter.
+        """
+        letters, confidences = util.topLabels(self.predictions, k=3)
+        self.assertEqual(letters.shape, (1000, 3))
+        self.assertEqual("".join(letters[:, 0]), util.decodeLabels(self.predictions))
+        np.testing.assert_array_equal(confidences[:, 0], self.predictions.max(axis=1))
+        self.assertTrue(np.all(np.diff(confidences, axis=1) <= 0))
+        expected = np.sort(self.predictions, axis=1)[:, ::-1][:, :3]
+        np.testing.assert_array_equal(confidences, expected)
+
+    def test_memory_flat(self):
+        """
+        Millions of decoded characters leave the memory where it was.
+        """
+        util.decodeLabels(self.predictions)
+        util.get_pred_label(self.predictions[0])
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(1000):
+            util.decodeLabels(self.predictions)
+        for p in self.predictions[:200]:
+            for _ in range(50):
+                util.get_pred_label(p)
+                util.runparam()
+        grown = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        self.assertLess(grown, 64 * 1024)
+        self.assertLessEqual(len(util.letters), 26)
+
+
+if __name__ == "__main__":
+    utest.main()
@@ -0,0 +1,96 @@
+"""
+@file test_wordext.py Used for testing the engine `wordext` module.
+
+This module checks the connected components word detection against the
+contour approximation method on the sample images.
+"""
+import os
+import unittest as utest
+import cv2 as cv
+import numpy as np
+import util
+import wordext as wx
+
+ENGINE_DIR = os.path.dirname(util.__file__)
+PAGES = [os.path.join(ENGINE_DIR, "images", "test_sample.jpg"),
+         os.path.join(ENGINE_DIR, "data", "images", "test_sample.jpeg")]
+
+def nested(box, boxes):
+    # True if the box lies inside another one (a hole found by the contour tree)
+    x, y, w, h = box
+    return any(tuple(b) != tuple(box) and b[0] <= x and b[1] <= y and
+               x + w <= b[0] + b[2] and y + h <= b[1] + b[3] for b in boxes)
+
+class TestComponents(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.images = [util.readImage(p) for p in PAGES]
+
+    def test_sample_boxes(self):
+        """
+        Both methods find the same word boxes, in the same reading order.
+        """
+        for image in self.images:
+            components, rect = wx.locate(image, "components")
+            contours, _ = wx.locate(image, "contours")
+            expected = [tuple(b) for b in np.concatenate(contours) if not nested(b, np.concatenate(contours))]
+            found = [tuple(b) for b in np.concatenate(components)]
+
+            self.assertTrue(set(expected) <= set(found))
+            # Components may keep specks whose pixel count (not outline area) passes the threshold
+            extra = [b for b in found if b not in expected]
+            self.assertTrue(all(w * h < 2 * wx.MIN_AREA for x, y, w, h in extra))
+            self.assertEqual([b for b in found if b in expected], expected)
+
+    def test_stats(self):
+        """
+        Areas and centroids belong to the returned boxes.
+        """
+        image = np.zeros((100, 200), dtype=np.uint8)
+        image[10:30, 20:80] = 255
+        image[60:62, 150:152] = 255
+        boxes, areas, centroids = wx.componentStats(image)
+        self.assertEqual(boxes.tolist(), [[20, 10, 60, 20]])
+        self.assertEqual(areas.tolist(), [1200])
+        np.testing.assert_allclose(centroids, [[49.5, 19.5]])
+
+class TestTiled(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.images = [util.readImage(p) for p in PAGES]
+
+    def test_sample_boxes(self):
+        """
+        Downscaling in strips finds the same words as the whole page at once.
+        """
+        buffers = {}
+        for image in self.images:
+            boxes, rect = wx.locate(image)
+            # A small budget gives bands of a few rows
+            tiled, tiledRect = wx.locate(image, budget=512 * 1024, buffers=buffers)
+            self.assertEqual([l.tolist() for l in tiled], [l.tolist() for l in boxes])
+            self.assertEqual(tiledRect.shape, rect.shape)
+            self.assertLessEqual(np.abs(tiledRect.astype(int) - rect).max(), 1)
+
+    def test_downscale(self):
+        """
+        Grayscale and color results of the bands match the whole page resize.
+        """
+        image = self.images[0]
+        shape = util.reshape(image)
+        gray, color = wx.downscaleTiled(image, shape, budget=300 * 1024)
+        expected = util.rescaleImage(cv.cvtColor(image, cv.COLOR_BGR2GRAY), shape)
+        self.assertLessEqual(np.abs(gray.astype(int) - expected).max(), 1)
+        self.assertLessEqual(np.abs(color.astype(int) - util.rescaleImage(image, shape)).max(), 1)
+
+    def test_budget(self):
+        """
+        A budget too small for a single band is refused.
+        """
+        with self.assertRaises(MemoryError):
+            wx.downscaleTiled(self.images[0], util.reshape(self.images[0]), budget=1000)
+
+if __name__ == "__main__":
+    utest.main()
@@ -0,0 +1,165 @@
+"""
+@file test_worker.py Used for testing the engine `worker` module.
+
+This module checks that the model cache reloads a changed model file (and
+keeps the old model when the new file is broken), and serves the worker
+protocol on an ephemeral port with a stand-in classifier.
+"""
+import os
+import json
+import shutil
+import tempfile
+import threading
+import http.client
+import unittest as utest
+from http.server import ThreadingHTTPServer
+import util
+import cache
+import worker
+from tests.test_main.test_main import SequenceModel
+
+IMAGE = os.path.join(os.path.dirname(util.__file__), "images", "test_sample.jpg")
+
+def stubLoader(path):
+    # The "model file" holds a version name, or "broken"
+    with open(path) as f:
+        version = f.read()
+    if version == "broken":
+        raise ValueError("Not a model")
+    model = SequenceModel()
+    model.version = version
+    return model
+
+def writeModel(path, version, mtime):
+    with open(path, "w") as f:
+        f.write(version)
+    # Explicit times, the writes of a test are quicker than the mtime resolution
+    os.utime(path, (mtime, mtime))
+
+class TestModelCache(utest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "model.h5")
+        writeModel(self.path, "v1", 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_reload(self):
+        """
+        The model is loaded once and reloaded when its file changes.
+        """
+        models = worker.ModelCache(self.path, stubLoader)
+        first = models.get()
+        self.assertEqual(first.version, "v1")
+        self.assertIs(models.get(), first)
+        identifier = models.identifier()
+
+        writeModel(self.path, "v2", 2000)
+        self.assertEqual(models.get().version, "v2")
+        self.assertNotEqual(models.identifier(), identifier)
+
+    def test_broken_reload(self):
+        """
+        A broken file keeps the old model, the first load of one fails.
+        """
+        models = worker.ModelCache(self.path, stubLoader)
+        first = models.get()
+        writeModel(self.path, "broken", 2000)
+        self.assertIs(models.get(), first)
+        # Not retried until the file changes again
+        writeModel(self.path, "v3", 3000)
+        self.assertEqual(models.get().version, "v3")
+
+        writeModel(self.path, "broken", 4000)
+        with self.assertRaises(ValueError):
+            worker.ModelCache(self.path, stubLoader).get()
+
+class TestHandler(utest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        path = os.path.join(cls.folder, "model.h5")
+        writeModel(path, "v1", 1000)
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), worker.OCRHandler)
+        cls.server.models = worker.ModelCache(path, stubLoader)
+        cls.server.fastModels = None
+        worker._attach(cls.server, 64, 0.002, cache.MAX_BYTES, None)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        worker._detach(cls.server)
+        cls.server.server_close()
+        shutil.rmtree(cls.folder)
+
+    def request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection(*self.server.server_address, timeout=60)
+        try:
+            connection.request(method, path, body, headers or {})
+            response = connection.getresponse()
+            return response.status, response.getheader("Content-Type"), response.read()
+        finally:
+            connection.close()
+
+    def test_ocr(self):
+        """
+        An image is recognized from its path and from its bytes (the same page, cached).
+        """
+        body = json.dumps({"path": IMAGE})
+        status, contentType, data = self.request("POST", "/ocr", body,
+                                                 {"Content-Type": "application/json"})
+        self.assertEqual((status, contentType), (200, "application/json"))
+        byPath = json.loads(data)
+        self.assertEqual(byPath["status"], "success")
+        self.assertTrue(byPath["text"].strip())
+
+        with open(IMAGE, "rb") as f:
+            status, contentType, data = self.request("POST", "/ocr", f.read(),
+                                                     {"Content-Type": "image/jpeg"})
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(data)["text"], byPath["text"])
+
+    def test_bad_requests(self):
+        """
+        Missing files and undecodable bytes are refused with 400, unknown paths with 404.
+        """
+        status, _, data = self.request("POST", "/ocr", json.dumps({"path": "missing.png"}),
+                                       {"Content-Type": "application/json"})
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(data)["status"], "error")
+        status, _, data = self.request("POST", "/ocr", b"not an image",
+                                       {"Content-Type": "image/png"})
+        self.assertEqual(status, 400)
+        self.assertEqual(self.request("POST", "/other", b"")[0], 404)
+        self.assertEqual(self.request("GET", "/other")[0], 404)
+
+    def test_health_and_stats(self):
+        """
+        Health reports the model, stats the batcher and the cache, metrics are text.
+        """
+        status, _, data = self.request("GET", "/health")
+        self.assertEqual(status, 200)
+        health = json.loads(data)
+        self.assertEqual(health["status"], "success")
+        self.assertEqual(health["model"], self.server.models.path)
+
+        status, _, data = self.request("GET", "/stats")
+        self.assertEqual(status, 200)
+        stats = json.loads(data)
+        self.assertEqual(stats["status"], "success")
+        self.assertIn("fill_ratio", stats["batcher"])
+        self.assertEqual(set(stats["cache"]), {"pages", "words"})
+        self.assertNotIn("cascade", stats)
+
+        status, contentType, data = self.request("GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertTrue(contentType.startswith("text/plain"))
+        self.assertIn(b"# TYPE ocr_stage_seconds_total counter", data)
+
+if __name__ == "__main__":
+    utest.main()
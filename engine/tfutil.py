@@ -0,0 +1,91 @@
+"""
+@file tfutil.py
+@author Himanshu Mishra
+
+This module contains the model and dataset helpers, the only part of the
+utilities that needs TensorFlow. It is loaded on demand, see `util.py`.
+"""
+import tensorflow as tf
+import tensorflow_hub as hub
+
+from util import IMG_SIZE, BATCH_SIZE
+
+# ---------- MODEL ----------
+# Importing the model
+def load_model(model_path):
+  """
+  Loads a saved model from a specified path.
+  """
+  print(f"Loading saved model from: {model_path}")
+  model = tf.keras.models.load_model(model_path,
+                                     custom_objects={"KerasLayer":hub.KerasLayer})
+  return model
+
+
+
+def process_image(image_path):
+    """
+    Takes an image file path and turns it into a Tensor.
+    """
+    # Read in image file
+    image = tf.io.read_file(image_path)
+
+    # Preprocess the image
+#     image = preprocess_image(image_path)
+
+    # Turn the image (png or jpeg) into numerical Tensor with 3 color channels
+    image = tf.io.decode_image(image, channels=3, expand_animations=False)
+    # Convert the colour channel values from 0-255 values to 0-1 values
+    image = tf.image.convert_image_dtype(image, tf.float32)
+
+    # Resize the image to our desired size (224, 224)
+    image = tf.image.resize(image, size=[IMG_SIZE, IMG_SIZE])
+    return image
+
+def get_image_label(image_path, label):
+    """
+    Takes an image file path name and the associated label,
+    processes the image and returns a tuple of (image, label).
+    """
+    image = process_image(image_path)
+    return image, label
+
+
+# Create a function to turn data into batches
+def create_data_batches(x, y=None, batch_size=BATCH_SIZE, valid_data=False, test_data=False):
+    """
+    Create batches of data out of image (x) and label (y) pairs.
+    Shuffles the data if it's training data but doesn't shuffle it if it is the validation data.
+    Also accepts test data as input (no labels)
+    """
+    # If the data is a test dataset, we probably don't have labels
+    if test_data:
+        print("Creating test data batches...")
+        data = tf.data.Dataset.from_tensor_slices(tf.constant(x)) # Only file paths
+        data_batch = data.map(process_image, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size)
+        return data_batch.prefetch(tf.data.AUTOTUNE)
+
+    elif valid_data:
+        print("Creating validation data batches...")
+        data = tf.data.Dataset.from_tensor_slices((tf.constant(x), # file paths
+                                                   tf.constant(y)))# labels
+        data_batch = data.map(get_image_label, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size)
+        return data_batch.prefetch(tf.data.AUTOTUNE)
+
+    else:
+        # If the data is a training dataset, we shuffle it
+        print("Creating training data batches...")
+        # Turn filepaths and labels into Tensors
+        data = tf.data.Dataset.from_tensor_slices((tf.constant(x), # filepaths
+                                                   tf.constant(y)))# labels
+
+        # Shuffling pathnames and labels before mapping image processing function,
+        # this is done to reduce the time required (less dense data = less time taken).
+        data = data.shuffle(buffer_size=len(x))
+
+        # Create (image, label) tuples (this also turns image path into preprocessed image)
+        data = data.map(get_image_label, num_parallel_calls=tf.data.AUTOTUNE)
+
+        # Turn the data into batches
+        data_batch = data.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    return data_batch
@@ -3,25 +3,52 @@
 @author Himanshu Mishra
 
 This module contains all the utility functions required by other modules.
-All the plotting and displaying features are included with this module.
+
+Only the light weight image operations (OpenCV and NumPy) live here, so that
+importing the segmentation modules stays fast. The plotting and displaying
+features (`display.py`, Matplotlib) and the model and dataset helpers
+(`tfutil.py`, TensorFlow) are still reachable as `util.<name>`, but their
+modules are only imported the first time one of them is used.
 """
 # Necessary libraries
 import os, shutil
 import sys
 import string
+import weakref
+import importlib
+import threading
+from collections import OrderedDict
 import cv2 as cv  # OpenCV library used for image processing
 import numpy as np  # Numpy used for numerical calculations
-import tensorflow as tf
-import tensorflow_hub as hub
-import matplotlib.pyplot as plt  # Matplotlib used for plotting
 
 # Define image size
 IMG_SIZE = 224
 # Define the batch size, 32 is a good default
 BATCH_SIZE = 32
+# Rescaled images kept by `resized`
+RESIZE_CACHE = 32
 true_labels = {}
 letters = []
 
+# Names loaded on demand from the heavier modules
+_LAZY = {
+    "display": ["displayImage", "plotImage", "drawContour", "drawAllContours",
+                "plotAllLines", "plotAllWords", "displayAllWords", "saveAllWords",
+                "saveAllChars", "plotGraph", "segmentImage", "plotDualGraphs"],
+    "tfutil": ["load_model", "process_image", "get_image_label", "create_data_batches"],
+}
+
+def __getattr__(name):
+    """
+    Imports the module holding `name` the first time it is asked for.
+    """
+    for module, names in _LAZY.items():
+        if name in names:
+            value = getattr(importlib.import_module(module), name)
+            globals()[name] = value
+            return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # --- Clear Dir ---
 def clearDir(folder):
     for filename in os.listdir(folder):
@@ -47,40 +74,6 @@ def readImage(imageFile):
     return image
 
 
-# --- Displaying Image ---
-def displayImage(image, comments="Test Image"):
-    """
-    Displays image in a window using OpenCV.
-
-    @params image {numpy array} Image to display
-    @params comments {string} Sets the title of the image window 
-    """
-    cv.imshow(comments, image)
-    cv.waitKey(0)
-
-    cv.destroyAllWindows()
-    return
-
-
-# --- Plotting Image ---
-def plotImage(image, comments="Test Image", col="gray"):
-    """
-    Plots image using Matplotlib.
-
-    @params image {numpy array} Image to plot
-    @params comments {string} Sets the title of the plot
-    @params col {string} Color channel of the image (Gray by default)
-    """
-    if col == "gray":
-        plt.imshow(image, cmap=col)
-    else:
-        plt.imshow(image)
-
-    plt.title(comments)
-    plt.axis("off")
-    return
-
-
 ############### Preprocessing of Image ###############
 
 # --- GrayScale Conversion ---
@@ -101,12 +94,48 @@ def rescaleImage(image, shape, interpolation=cv.INTER_LINEAR):
     Rescales the given image to the given shape using the given interpolation.
 
     @params image {numpy array} Image to rescale
-    @params shape {(h,w) tuple} Shape of the final image
+    @params shape {(w,h) tuple} Size of the final image, in the order of `cv.resize` (see `reshape`)
     @params interpolation {OpenCV method} Interpolation to use (LinearInterpolation by default)
 
     @returns rescaled image
     """
-    rescale = cv.resize(image, shape, interpolation)
+    rescale = cv.resize(image, shape, interpolation=interpolation)
+    return rescale
+
+
+# --- Shared Rescaling ---
+_resizes = OrderedDict()
+_resizeLock = threading.Lock()
+
+def resized(image, shape, interpolation=cv.INTER_LINEAR):
+    """
+    Memoized `rescaleImage`: the stages working on the same image (e.g. the word
+    extraction thresholding a page and then cutting the words out of it) share
+    one rescaled copy per size and interpolation instead of resizing it again.
+
+    Entries are keyed by the identity of the image, which must not be modified
+    in between, and are not used once it has been freed. The rescaled images are
+    shared, hence read-only.
+
+    @params image {numpy array} Image to rescale
+    @params shape {(w,h) tuple} Size of the final image
+    @params interpolation {OpenCV method} Interpolation to use
+
+    @returns read-only rescaled image
+    """
+    key = (id(image), tuple(shape), interpolation)
+    with _resizeLock:
+        entry = _resizes.get(key)
+        if entry is not None and entry[0]() is image:
+            _resizes.move_to_end(key)
+            return entry[1]
+
+    rescale = rescaleImage(image, tuple(shape), interpolation)
+    rescale.flags.writeable = False
+    with _resizeLock:
+        _resizes[key] = (weakref.ref(image), rescale)
+        while len(_resizes) > RESIZE_CACHE:
+            _resizes.popitem(last=False)
     return rescale
 
 
@@ -123,243 +152,56 @@ def getAspectRatio(image):
 
 
 # --- Reshape Image ---
-def reshape(image, height=224):
+def reshape(image, width=224):
     """
-    Finds the new shape of the image when height is changed to the given height maintaining the aspect ratio.
+    Finds the new size of the image when its width is changed to the given width maintaining the aspect ratio.
 
     @params image {numpy array} image to reshape
-    @params height {integer} new height of the image (128 by default)
+    @params width {integer} new width of the image (224 by default)
 
-    @returns new shape of the image
+    @returns new size of the image as (width, height), the order of `cv.resize`
     """
-    shape = (height, int(height * getAspectRatio(image)))
+    shape = (width, max(1, int(width * getAspectRatio(image))))
     return shape
 
 
-############### Contours ###############
-
-# --- Draw Contours ---
-def drawContour(image, cnt, num):
-    """
-    Draws a bounded rectangle around the contour passed and puts the given text into the rectangle.
-
-    @params image {numpy array} Image to draw contour on.
-    @params cnt {numpy array} Contour to bound
-    @params num {string / integer} Text to put in
-    """
-    M = cv.moments(cnt)
-    cX = int(M["m10"] / M["m00"])
-    cY = int(M["m01"] / M["m00"])
-
-    # drawing the contour number on the image
-    cv.putText(image, f"{num + 1}", (cX - 20, cY), cv.FONT_HERSHEY_PLAIN, \
-               1.0, (255, 128, 0), 1)
-    x, y, w, h = cv.boundingRect(cnt)
-    cv.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
-    return image
-
-def drawAllContours(image, contours):
-    """
-
-    Draws a bounded rectangle around all the contours passed and puts an index to each.
-
-    :param image: {numpy array} image to draw contours on
-    :param contours: {list} list of all contours to be drawn
-    :return: image with contours drawn on it
-    """
-    for i, cnt in enumerate(contours):
-        M = cv.moments(cnt)
-        cX = int(M["m10"] / M["m00"])
-        cY = int(M["m01"] / M["m00"])
-
-        # drawing the contour number on the image
-        cv.putText(image, f"{i + 1}", (cX - 20, cY), cv.FONT_HERSHEY_PLAIN,\
-                   1.0, (255, 128, 0), 1)
-        x, y, w, h = cv.boundingRect(cnt)
-        cv.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
-
-    return image
-
-
-# --- Plot All Lines ---
-def plotAllLines(image, lines, comments="All lines"):
-    """
-    Plots all lines
-    """
-    image_rect = rescaleImage(image, reshape(image))
-    lineCount = 0
-    for line in lines:
-        for word in line:
-            drawContour(image_rect, word, lineCount)
-        lineCount += 1
-
-    displayImage(image_rect, comments)
-
-# --- Plot All Words ---
-def plotAllWords(image, lines, comments="Final Result"):
-    """
-    Plots all the words in order.
-    """
-    wordCount = 0
-    image_rect = rescaleImage(image.copy(), reshape(image))
-
-    for words in lines:
-        for word in words:
-            drawContour(image_rect, word, wordCount)
-            wordCount += 1
-
-    # plotImage(image_rect, comments)
-    displayImage(image_rect, comments)
-
-# --- Display All Words ---
-def displayAllWords(lines, comments="All Words"):
+# ---------- Model Input ----------
+def create_image_batch(images, size=IMG_SIZE, channels=3):
     """
-    Displays all the words in reading order one by one.
-    """
-    wordCount = 0
-    for line in lines:
-        for word in line:
-            displayImage(word, str(wordCount))
-            wordCount += 1
+    Turns in-memory character images (as segmented by `charseg`) into a batch
+    ready for the model, without the png encode/decode round trip through disk.
+    Matches `process_image`: RGB channel order, 0-1 float values, (size, size).
 
-    return
+    With `channels` 1 the batch is grayscale, for the small classifiers (see
+    `smallclf.py`) working on e.g. 32x32 inputs (4 KB per character instead of
+    600 KB at 224x224x3).
 
-# --- Save All Words ---
-def saveAllWords(lines, dir):
+    :param images: {list} BGR or grayscale images as numpy arrays
+    :param size: {integer} Height and width of each image in the batch
+    :param channels: {integer} 3 for RGB, 1 for grayscale
+    :return: {numpy array} float32 batch of shape (N, size, size, channels)
     """
-    Saves all the words in the given directory.
-    """
-    wordCount = 0
-    for line in lines:
-        for word in line:
-            wordFile = dir + "/" + str(wordCount) + ".png"
-            # print(f"Word File: {wordFile}")
-            # print(os.listdir(dir + "/.."))
-
-            cv.imwrite(wordFile, word)
-            # cv.imwrite()
-            wordCount += 1
-    return
-
-# --- Save All Characters ---
-def saveAllChars(chars, dir):
-    """
-    Saves all the character images in the given directory.
-    """
-    for i,c in enumerate(chars):
-        charFile = dir + "/" + str(i) + ".png"
-        cv.imwrite(charFile, c)
-
-    return
-
-
-# Plotting the graph obtained
-def plotGraph(graph):
-    """
-    Plots the given graph.
-    """
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(graph)
-
-
-def segmentImage(image, segment_array, c='g'):
-    """
-    Segments the given image at the positions in the given array.
-    @param c Color of the segmented lines
-    """
-    for x in segment_array:
-        image[:,x] = (0,255,0)
-
-    displayImage(image, "Segmented Image")
-
-
-def plotDualGraphs(graph1, graph2, c2='g'):
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(graph1)
-    ax.plot(graph2, color=c2)
-    return fig, ax
-
-# ---------- MODEL ----------
-# Importing the model
-def load_model(model_path):
-  """
-  Loads a saved model from a specified path.
-  """
-  print(f"Loading saved model from: {model_path}")
-  model = tf.keras.models.load_model(model_path,
-                                     custom_objects={"KerasLayer":hub.KerasLayer})
-  return model
+    if channels == 1:
+        batch = np.empty((len(images), size, size), dtype=np.uint8)
+        for i, image in enumerate(images):
+            if len(image.shape) == 3:
+                image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+            cv.resize(image, (size, size), dst=batch[i], interpolation=cv.INTER_LINEAR)
+        return batch[..., np.newaxis].astype(np.float32) / 255.0
 
+    batch = np.empty((len(images), size, size, 3), dtype=np.uint8)
+    for i, image in enumerate(images):
+        if len(image.shape) == 2:
+            image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+        cv.resize(image, (size, size), dst=batch[i], interpolation=cv.INTER_LINEAR)
 
-
-def process_image(image_path):
-    """
-    Takes an image file path and turns it into a Tensor.
-    """
-    # Read in image file
-    image = tf.io.read_file(image_path)
-
-    # Preprocess the image
-#     image = preprocess_image(image_path)
-
-    # Turn the jpeg image into numerical Tensor with 3 color channels
-    image = tf.image.decode_jpeg(image, channels=3)
-    # Convert the colour channel values from 0-255 values to 0-1 values
-    image = tf.image.convert_image_dtype(image, tf.float32)
-
-    # Resize the image to our desired size (224, 224)
-    image = tf.image.resize(image, size=[IMG_SIZE, IMG_SIZE])
-    return image
-
-def get_image_label(image_path, label):
-    """
-    Takes an image file path name and the associated label,
-    processes the image and returns a tuple of (image, label).
-    """
-    image = process_image(image_path)
-    return image, label
-
-
-# Create a function to turn data into batches
-def create_data_batches(x, y=None, batch_size=BATCH_SIZE, valid_data=False, test_data=False):
-    """
-    Create batches of data out of image (x) and label (y) pairs.
-    Shuffles the data if it's training data but doesn't shuffle it if it is the validation data.
-    Also accepts test data as input (no labels)
-    """
-    # If the data is a test dataset, we probably don't have labels
-    if test_data:
-        print("Creating test data batches...")
-        data = tf.data.Dataset.from_tensor_slices(tf.constant(x)) # Only file paths
-        data_batch = data.map(process_image).batch(batch_size)
-        return data_batch
-
-    elif valid_data:
-        print("Creating validation data batches...")
-        data = tf.data.Dataset.from_tensor_slices((tf.constant(x), # file paths
-                                                   tf.constant(y)))# labels
-        data_batch = data.map(get_image_label).batch(batch_size)
-        return data_batch
-
-    else:
-        # If the data is a training dataset, we shuffle it
-        print("Creating training data batches...")
-        # Turn filepaths and labels into Tensors
-        data = tf.data.Dataset.from_tensor_slices((tf.constant(x), # filepaths
-                                                   tf.constant(y)))# labels
-
-        # Shuffling pathnames and labels before mapping image processing function,
-        # this is done to reduce the time required (less dense data = less time taken).
-        data = data.shuffle(buffer_size=len(x))
-
-        # Create (image, label) tuples (this also turns image path into preprocessed image)
-        data = data.map(get_image_label)
-
-        # Turn the data into batches
-        data_batch = data.batch(batch_size)
-    return data_batch
+    # BGR -> RGB and 0-255 -> 0-1 for the whole batch at once
+    return batch[..., ::-1].astype(np.float32) / 255.0
 
 def runparam():
+    # Fills the tables once, they used to grow by 26 letters on every call
+    if letters:
+        return
     for i, s in enumerate(string.ascii_uppercase):
         letters.append(s)
         true_labels[s] = np.zeros((26))
@@ -369,12 +211,47 @@ def unroll_label(label):
     Utility function used to unroll (get letter) from
     the given label
     """
-    runparam()
-    return letters[np.argmax(label)]
+    return string.ascii_uppercase[int(np.argmax(label))]
 
 # Turn prediction probabilities into their respective label (easier to understand)
 def get_pred_label(prediction_probabilities):
   """
   Turns an array of prediction probabilities into a label.
+  Use `decodeLabels` for many predictions at once.
   """
-  return unroll_label([np.argmax(prediction_probabilities) == i for i in range(26)])
+  return unroll_label(prediction_probabilities)
+
+
+# ---------- Label Decoding ----------
+# Letter of each class of the classifier, one byte each
+LABELS = np.frombuffer(string.ascii_uppercase.encode("ascii"), dtype="S1")
+
+def decodeLabels(predictions):
+    """
+    Turns a whole matrix of prediction probabilities into text: one argmax over
+    the classes and a lookup in `LABELS`.
+
+    :param predictions: {numpy array} Probabilities of shape (N, 26)
+    :return: {string} Most likely letter of every prediction
+    """
+    predictions = np.asarray(predictions)
+    if len(predictions) == 0:
+        return ""
+    return LABELS[np.argmax(predictions, axis=1)].tobytes().decode("ascii")
+
+def topLabels(predictions, k=3):
+    """
+    Finds the `k` most likely letters of every prediction.
+
+    :param predictions: {numpy array} Probabilities of shape (N, 26)
+    :param k: {integer} Candidates per prediction
+    :return: {tuple} (letters {numpy array (N, k) of strings}, their
+    confidences {numpy array (N, k)}), most likely first
+    """
+    predictions = np.asarray(predictions)
+    k = min(k, predictions.shape[1])
+    top = np.argpartition(-predictions, k - 1, axis=1)[:, :k]
+    confidences = np.take_along_axis(predictions, top, axis=1)
+    order = np.argsort(-confidences, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    return LABELS[top].astype(str), np.take_along_axis(confidences, order, axis=1)
@@ -6,40 +6,132 @@ This module has extensively used OpenCV. The algorithm used to extract words out
 text image is `Contour Approximation Method`. The entire module has been implemented
 by the author. This module is to be used only for educational purposes and not for
 production.
+
+Words can also be detected with `Connected Components` statistics (the default),
+which give the area and bounding box of every word in a single call.
+
+Very large scans are downscaled in strips (see `downscaleTiled`) so that no full
+resolution copy of the page is ever made.
 """
 import os
 import sys
 import util
+import readorder
+import profiler
 import cv2 as cv
 import numpy as np
 
+# Word detection method used by `locate`: "components" or "contours"
+DETECTION = "components"
+# Least area (in pixels) of a word, smaller regions are noise
+MIN_AREA = 50
+# Images larger than this (in bytes) are downscaled in strips
+TILE_ABOVE = 64 * 2 ** 20
+# Peak memory (in bytes) the strips of the tiled downscaling may use
+MEMORY_BUDGET = 32 * 2 ** 20
+
+def _buffer(buffers, name, shape, dtype=np.uint8):
+    # Reuses the array kept under `name` when it still fits, None without buffers
+    if buffers is None:
+        return None
+    if name not in buffers or buffers[name].shape != shape or buffers[name].dtype != dtype:
+        buffers[name] = np.empty(shape, dtype=dtype)
+    return buffers[name]
+
 # --- Preprocessing the image ---
-def preprocess(image):
+def preprocess(image, buffers=None):
     """
     Preprocesses the image for better quality and contrast. This function performs
     GrayScale Conversion, Noise Reduction & Image Thresholding. All of which uses
     OpenCV methods.
 
     :param image: Image to preprocess
+    :param buffers: {dict} Arrays reused across calls (see `binarize`)
     :return: The preprocessed image
     """
+    # Image Rescaling (shared with the ROI extraction, see `locate`)
+    rescaled = util.resized(image, util.reshape(image))
     # GrayScale Conversion
-    if len(image.shape) > 2:
-        gray = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
-    else:
-        gray = image
-    # Image Rescaling
-    rescaled = util.rescaleImage(gray, util.reshape(gray))
+    gray = util.toGray(rescaled)
+
+    return binarize(gray, buffers)
+
+# --- Noise Reduction & Thresholding ---
+def binarize(rescaled, buffers=None):
+    """
+    Noise Reduction & Image Thresholding of an already rescaled grayscale image.
+
+    :param rescaled: {numpy array} Rescaled grayscale image
+    :param buffers: {dict} Arrays reused across calls (kept by the caller, e.g.
+    one dict per worker), the result is only valid until the next call
+    :return: The thresholded image
+    """
     # Noise Reduction
-    blur = cv.GaussianBlur(rescaled, (5, 5), 0)
+    blur = cv.GaussianBlur(rescaled, (5, 5), 0, dst=_buffer(buffers, "blur", rescaled.shape))
     # Image Thresholding
     thresh = cv.adaptiveThreshold(blur, 255, cv.ADAPTIVE_THRESH_GAUSSIAN_C,\
-                                  cv.THRESH_BINARY_INV, 11, 2)
+                                  cv.THRESH_BINARY_INV, 11, 2,
+                                  dst=_buffer(buffers, "thresh", rescaled.shape))
 
     return thresh
 
+# --- Tiled Downscaling ---
+def downscaleTiled(image, shape, budget=MEMORY_BUDGET):
+    """
+    Grayscale conversion and `util.rescaleImage` of a large image, one band of
+    output rows at a time.
+
+    Linear interpolation only reads the two source rows around each output row,
+    so only those rows of a band are gathered (neighbouring bands share their
+    boundary rows), converted, shrunk horizontally and blended vertically. No full
+    resolution copy of the image is made and the rows gathered at once stay
+    within the budget. Pixels differ from `cv.resize` by at most one gray level.
+
+    :param image: {numpy array} Image to downscale
+    :param shape: {tuple} Target shape as given to `cv.resize` (`util.reshape`)
+    :param budget: {integer} Peak memory (bytes) of the bands and results
+    :return: {tuple} (rescaled grayscale image, rescaled image)
+    """
+    height, width = image.shape[:2]
+    w, h = shape
+    channels = image.shape[2] if image.ndim > 2 else 1
+
+    # Source rows around each output row and their weights, as in `cv.resize`
+    fy = (np.arange(h) + 0.5) * height / h - 0.5
+    sy = np.floor(fy)
+    weight = (fy - sy).astype(np.float32)
+    r0 = np.clip(sy, 0, height - 1).astype(np.intp)
+    r1 = np.clip(sy + 1, 0, height - 1).astype(np.intp)
+
+    # A gathered row, its grayscale version and both shrunk rows (float)
+    perRow = width * (channels + 1) + w * (channels + 1) * 4 * 2
+    results = h * w * (channels + 1)
+    band = (budget - results) // (2 * perRow)
+    if band < 1:
+        raise MemoryError(f"A budget of {budget} bytes is too small to downscale "
+                          f"a {width}x{height} image to {w}x{h}")
+
+    gray = np.empty((h, w), dtype=np.uint8)
+    color = gray if channels == 1 else np.empty((h, w, channels), dtype=image.dtype)
+    for o0 in range(0, h, band):
+        o1 = min(o0 + band, h)
+        rows = np.unique(np.concatenate((r0[o0:o1], r1[o0:o1])))
+        p0, p1 = np.searchsorted(rows, r0[o0:o1]), np.searchsorted(rows, r1[o0:o1])
+
+        strip = image[rows]
+        sources = [(strip, color)]
+        if channels > 1:
+            sources.append((cv.cvtColor(strip, cv.COLOR_BGR2GRAY), gray))
+        for source, out in sources:
+            shrunk = cv.resize(source, (w, len(rows)), interpolation=cv.INTER_LINEAR)
+            shrunk = shrunk.astype(np.float32)
+            f = weight[o0:o1].reshape((-1,) + (1,) * (shrunk.ndim - 1))
+            out[o0:o1] = np.rint(shrunk[p0] * (1 - f) + shrunk[p1] * f)
+
+    return gray, color
+
 # --- Dilating the image ---
-def dilate(image):
+def dilate(image, dst=None):
     """
     Dilates the image increasing the stroke width of the characters in turn
     merging them together. This method is used to join all the characters
@@ -49,10 +141,11 @@ def dilate(image):
     result in combining two different words (or even two lines).
 
     :param image: Image to dilate
+    :param dst: {numpy array} Array to write the dilated image to
     :return: The dilated image
     """
     kernel = np.ones((5, 5), np.uint8)
-    dilate = cv.dilate(image, kernel, iterations=1)
+    dilate = cv.dilate(image, kernel, dst=dst, iterations=1)
 
     return dilate
 
@@ -74,10 +167,36 @@ def contourApx(image):
 
     # Limiting contours above a threshold (Threshold assigned as the mean of the areas of all contours)
     # threshold = np.mean([cv.contourArea(cnt) for cnt in contours])
-    threshold = 50
+    threshold = MIN_AREA
 
     return [cnt for cnt in contours if cv.contourArea(cnt) > threshold]
 
+# --- Connected Components ---
+def componentStats(image, threshold=MIN_AREA):
+    """
+    Finds the connected components (the words, once dilated) of the image and
+    returns the statistics of those above a threshold.
+
+    Unlike `contourApx` this neither builds a contour hierarchy nor reports the
+    holes inside the words: a single OpenCV call labels the outer regions and
+    measures all of them at once.
+
+    :param image: Dilated Image
+    :param threshold: {integer} Least area (in pixels) of a word
+    :return: {tuple} (boxes {numpy array (N, 4)} of x, y, w, h, areas {numpy
+    array (N,)}, centroids {numpy array (N, 2)})
+    """
+    # 16 bit labels halve the memory traffic when they cannot overflow
+    h, w = image.shape[:2]
+    ltype = cv.CV_16U if ((h + 1) // 2) * ((w + 1) // 2) < 2 ** 16 else cv.CV_32S
+    n, labels, stats, centroids = cv.connectedComponentsWithStats(image, connectivity=8, ltype=ltype)
+
+    # Label 0 is the background
+    stats, centroids = stats[1:], centroids[1:]
+    keep = stats[:, cv.CC_STAT_AREA] > threshold
+
+    return stats[keep, :4], stats[keep, cv.CC_STAT_AREA], centroids[keep]
+
 # --- Extract Lines out of Contours ---
 def extractLines(contours, thresh = 30):
     """
@@ -135,15 +254,15 @@ def extractWords(lines):
     """
     f_lines = []
     for line in lines:
-        mid_dict = {}
-        for i, cnt in enumerate(line):
+        mid = []
+        for cnt in line:
             x, y, w, h = cv.boundingRect(cnt)
-            mid = int(x + w / 2)
-            mid_dict[mid] = i
+            mid.append(int(x + w / 2))
 
+        # Sorting the indices (not a dict keyed by mid) keeps words sharing a mid value
         words = []
-        for v in sorted(mid_dict):
-            words.append(line[mid_dict[v]])
+        for i in sorted(range(len(line)), key=lambda i: mid[i]):
+            words.append(line[i])
         f_lines.append(words)
 
     return f_lines
@@ -168,6 +287,17 @@ def extractROI(lines, image):
 
     return rList
 
+# --- Extract Word ROI from boxes ---
+def cropBoxes(boxes, image):
+    """
+    Cuts the words of a line out of the image.
+
+    :param boxes: {numpy array (k, 4)} Word boxes as x, y, w, h in reading order
+    :param image: {numpy array} Image to extract ROI from
+    :return: {list} ROI of each word
+    """
+    return [image[y:y+h, x:x+w] for x, y, w, h in boxes]
+
 
 # --- Wrapper Function of the module ---
 def main(imageLocation):
@@ -185,36 +315,94 @@ def main(imageLocation):
 
     # 1. Reading the image from file
     image = util.readImage(imageLocation)
-    # 2. Preprocessing the image to make it ready for word extraction
-    preprocessed = preprocess(image)
-    # 3. Dilating the image to merge the characters of a word together
-    dilated = dilate(preprocessed)
-    # 4. Finding all the contours containing a word in the image
-    contours = contourApx(dilated)
 
-    # ## Displaying the contours in the image --- (to be used for debugging)
-    # image_rect = util.rescaleImage(image.copy(), util.reshape(image))
-    # util.displayImage(util.drawAllContours(image_rect, contours), "All word contours")
+    return extract(image)
 
-    # 5. Extracting lines out of the contours
-    lines = extractLines(contours)
+# --- Word Extraction from a decoded image ---
+def extract(image, buffers=None):
+    """
+    Performs the Word Extraction steps on an image that has already been read
+    (or decoded from memory), so that callers holding the image need not write
+    it to disk first.
 
-    # ## Displaying all the lines in the image --- (to be used for debugging)
-    # image_rect = util.rescaleImage(image.copy(), util.reshape(image))
-    # util.plotAllLines(image_rect, lines, "All lines in reading order")
+    :param image: {numpy array} Image to extract the words from
+    :param buffers: {dict} Arrays reused across calls (see `locate`)
+    :return: A 2D list of words, where 1st dimension represents lines in the text and 2nd dimension represents words in the lines.
+    """
+    return list(iterExtract(image, buffers))
 
-    # 6. Extracting words out of lines
-    words = extractWords(lines)
+# --- Line by line Word Extraction ---
+def iterExtract(image, buffers=None):
+    """
+    Generator version of `extract`: yields the word images of each line in
+    reading order, so that callers can start working on the first line before
+    the words of the others are cut out.
 
-    # ## Displaying all the words in the image --- (to be used for debugging)
-    # image_rect = util.rescaleImage(image.copy(), util.reshape(image))
-    # util.plotAllWords(image_rect, words, "All Words in reading order")
+    :param image: {numpy array} Image to extract the words from
+    :param buffers: {dict} Arrays reused across calls (see `locate`)
+    :return: Generator of lists of word images, one list per line
+    """
+    boxes, image_rect = locate(image, buffers=buffers)
 
-    # 7. Extracting ROI out of the word contours from the image
-    image_rect = util.rescaleImage(image.copy(), util.reshape(image))
-    wImage = extractROI(words, image_rect)
+    # 7. Extracting ROI out of the word boxes from the image, line by line
+    for line in boxes:
+        yield cropBoxes(line, image_rect)
 
-    return wImage
+# --- Word Location ---
+def locate(image, method=None, budget=None, buffers=None):
+    """
+    Finds the words of the image without cutting them out (steps 2 to 6 of the
+    Word Extraction).
+
+    Images larger than `TILE_ABOVE` bytes (or any image when a budget is given)
+    are downscaled in strips within the memory budget.
+
+    :param image: {numpy array} Image to extract the words from
+    :param method: {string} "components" or "contours" (`DETECTION` by default)
+    :param budget: {integer} Peak memory (bytes) of the tiled downscaling
+    :param buffers: {dict} Arrays for the intermediate images, reused across
+    calls by a caller processing one image at a time
+    :return: {tuple} (list of the word boxes of each line, as numpy arrays
+    (k, 4) of x, y, w, h in reading order, the rescaled image the boxes refer to)
+    """
+    method = method or DETECTION
+    if method not in ("components", "contours"):
+        raise ValueError(f"Unknown word detection method: {method}")
+
+    # 2. Preprocessing the image to make it ready for word extraction
+    with profiler.stage("wordext.preprocess"):
+        if budget is not None or image.nbytes > TILE_ABOVE:
+            gray, image_rect = downscaleTiled(image, util.reshape(image), budget or MEMORY_BUDGET)
+            preprocessed = binarize(gray, buffers)
+        else:
+            preprocessed = preprocess(image, buffers)
+            image_rect = util.resized(image, util.reshape(image))
+    # 3. Dilating the image to merge the characters of a word together
+    with profiler.stage("wordext.dilate"):
+        dilated = dilate(preprocessed, _buffer(buffers, "dilated", preprocessed.shape))
+
+    if method == "components":
+        # 4-5. Word boxes from the connected components
+        with profiler.stage("wordext.componentStats"):
+            boxes, areas, centroids = componentStats(dilated)
+    else:
+        # 4. Finding all the contours containing a word in the image
+        with profiler.stage("wordext.contourApx"):
+            contours = contourApx(dilated)
+
+        # ## Displaying the contours in the image --- (to be used for debugging)
+        # image_rect = util.rescaleImage(image.copy(), util.reshape(image))
+        # util.displayImage(util.drawAllContours(image_rect, contours), "All word contours")
+
+        # 5. Word boxes of the contours
+        boxes = np.array([cv.boundingRect(cnt) for cnt in contours], dtype=np.int32).reshape(-1, 4)
+
+    # 6. Sorting the boxes in reading order
+    with profiler.stage("wordext.readingOrder"):
+        lines = readorder.readingOrder(boxes)
+    profiler.count("words", len(boxes))
+    profiler.count("lines", len(lines))
+    return lines, image_rect
 
 
 ############### StandAlone Behaviour ###############
@@ -0,0 +1,352 @@
+"""
+@file worker.py Long lived OCR worker of the engine.
+
+Running `main.py` once per image pays the interpreter start up, the TensorFlow
+imports and the model load on every request. This module keeps the model loaded
+in memory and serves recognition requests over a small local HTTP protocol:
+
+    POST /ocr       JSON body `{"path": "<image location>"}` or the raw image bytes
+    POST /ocr?stream=1  Same, answered with one JSON object per line of text
+                    (newline delimited) as soon as each line is recognized
+    POST /ocr?layout=1  Same, answered with the boxes and confidences of every
+                    word and character (see `layout.py`)
+    GET  /health    Liveness check, also reports the loaded model
+    GET  /stats     Micro-batching and cache statistics of the answering process
+    GET  /metrics   Stage timings and counters of the answering process (see
+                    `profiler.py`), in the Prometheus text format
+
+With `--fast <model>` characters are classified by a cascade (see
+`charclf.Cascade`): the fast model first, the heavy one for the characters the
+fast one is unsure of.
+
+Adding `profile=1` to the query of `/ocr` profiles that request and adds its
+stage timings and counters to the answer (`"profile"`, a last line when streamed).
+
+Several worker processes may share one listening socket (pre-forked), and each
+of them reloads the model (`.h5`, or `.tflite` see `export.py`) as soon as the file on disk changes.
+Models are loaded warm (see `charclf.CompiledModel`) and with the cores of the
+host shared between the worker processes, so that they do not oversubscribe them. Within a
+process requests are served on threads, and their characters are classified
+together by a `batcher.MicroBatcher`. Results are cached by image content
+(see `cache.py`), in memory or in an SQLite file shared by the processes.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import functools
+import threading
+import multiprocessing as mp
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cv2 as cv
+import numpy as np
+
+import util
+import main as Main
+import charclf as cf
+import batcher
+import cache
+import profiler
+
+HOST = "127.0.0.1"
+PORT = 5000
+WORKERS = 1
+
+# ---------- Model Cache - Begin ----------
+class ModelCache:
+    """
+    Holds a loaded model and reloads it when the model file changes on disk.
+
+    The new model is loaded completely before it replaces the old one, so
+    requests keep being served by the old model while a reload is going on,
+    and a broken file on disk never takes the worker down.
+    """
+    def __init__(self, path, loader=None):
+        self.path = path
+        self.loader = loader or cf.load
+        self.model = None
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def _modified(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return self.mtime
+
+    def get(self):
+        """
+        Returns the loaded model, (re)loading it first if the file changed.
+
+        :return: {keras model} Currently loaded model
+        """
+        mtime = self._modified()
+        if self.model is not None and mtime == self.mtime:
+            return self.model
+
+        with self.lock:
+            if self.model is None or mtime != self.mtime:
+                try:
+                    model = self.loader(self.path)
+                except Exception as e:
+                    if self.model is None:
+                        raise
+                    print(f"Reload of {self.path} failed, keeping old model: {e}", file=sys.stderr)
+                else:
+                    self.model = model
+                self.mtime = mtime
+        return self.model
+
+    @property
+    def input_shape(self):
+        # Input of the current model, see `charclf.inputShape`
+        return getattr(self.get(), "input_shape", None)
+
+    def identifier(self):
+        """
+        :return: {string} Identifies the model version on disk, for caching results
+        """
+        return f"{self.path}:{self._modified()}"
+
+    def predict(self, batch, batch_size=None, verbose=0):
+        """
+        Predicts with the current model, so the cache can stand in for it.
+        """
+        return self.get().predict(batch, batch_size=batch_size, verbose=verbose)
+# ---------- Model Cache - End ----------
+
+# ---------- Request Handling - Begin ----------
+def decodeImage(data):
+    """
+    Decodes the raw bytes of an encoded image (png, jpeg, ...).
+
+    :param data: {bytes} Encoded image
+    :return: {numpy array} Decoded image, None if the bytes are not an image
+    """
+    return cv.imdecode(np.frombuffer(data, np.uint8), cv.IMREAD_COLOR)
+
+class OCRHandler(BaseHTTPRequestHandler):
+    """
+    Serves the worker protocol. The model cache is attached to the server.
+    """
+    def _send(self, code, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sendText(self, code, text, contentType="text/plain; charset=utf-8"):
+        body = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _readImage(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length)
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            location = json.loads(data or b"{}").get("path", "")
+            if not os.path.exists(location):
+                return None
+            return util.readImage(location)
+        return decodeImage(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._send(200, {"status": "success", "pid": os.getpid(),
+                                    "model": self.server.models.path})
+        if self.path == "/stats":
+            stats = {"status": "success", "pid": os.getpid(),
+                     "batcher": self.server.batcher.stats(),
+                     "cache": self.server.cache.stats()}
+            if isinstance(self.server.classifier, cf.Cascade):
+                stats["cascade"] = self.server.classifier.stats()
+            return self._send(200, stats)
+        if self.path == "/metrics":
+            return self._sendText(200, profiler.prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        self._send(404, {"status": "error", "error": "Not Found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/ocr":
+            return self._send(404, {"status": "error", "error": "Not Found"})
+        try:
+            image = self._readImage()
+        except ValueError as e:
+            return self._send(400, {"status": "error", "error": str(e)})
+        if image is None:
+            return self._send(400, {"status": "error", "error": "Image could not be read"})
+
+        query = parse_qs(url.query)
+        flag = lambda name: query.get(name, ["0"])[0] not in ("0", "")
+        with profiler.profile(enabled=flag("profile")) as p:
+            if flag("stream"):
+                return self._stream(image, p)
+            if flag("layout"):
+                return self._layout(image, p)
+
+            start = time.perf_counter()
+            try:
+                text = Main.recognize(image, self.server.classifier, self.server.cache)
+            except Exception as e:
+                return self._send(500, {"status": "error", "error": str(e)})
+            answer = {"status": "success", "text": text, "time": time.perf_counter() - start}
+            if p is not None:
+                answer["profile"] = p.toDict()
+            self._send(200, answer)
+
+    def _layout(self, image, p=None):
+        start = time.perf_counter()
+        try:
+            page = Main.recognizeLayout(image, self.server.classifier)
+        except Exception as e:
+            return self._send(500, {"status": "error", "error": str(e)})
+        answer = {"status": "success", "text": page.text(), "layout": page.toDict(),
+                  "time": time.perf_counter() - start}
+        if p is not None:
+            answer["profile"] = p.toDict()
+        self._send(200, answer)
+
+    def _stream(self, image, p=None):
+        # No Content-Length: the body ends when the connection is closed
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        start = time.perf_counter()
+        try:
+            for line in Main.streamLines(image, self.server.classifier, self.server.cache):
+                line["time"] = time.perf_counter() - start
+                self.wfile.write((json.dumps(line) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except Exception as e:
+            self.wfile.write((json.dumps({"error": str(e)}) + "\n").encode("utf-8"))
+        if p is not None:
+            self.wfile.write((json.dumps({"profile": p.toDict()}) + "\n").encode("utf-8"))
+
+    def log_message(self, format, *args):
+        # Keep stdout clean, requests are logged on stderr with the worker pid
+        sys.stderr.write(f"[worker {os.getpid()}] {format % args}\n")
+# ---------- Request Handling - End ----------
+
+# ---------- Serving - Begin ----------
+def _attach(server, maxBatch, maxWait, cacheBytes, cachePath):
+    # Loads the model(s) and attaches the batchers and the result cache the
+    # handler works with to the server
+    server.models.get()
+    server.batcher = batcher.MicroBatcher(server.models, maxBatch, maxWait)
+    server.classifier, server.fastBatcher = server.batcher, None
+    identifier = server.models.identifier
+    if server.fastModels is not None:
+        server.fastModels.get()
+        server.fastBatcher = batcher.MicroBatcher(server.fastModels, maxBatch, maxWait)
+        server.classifier = cf.Cascade(server.fastBatcher, server.batcher, server.threshold)
+        # Results depend on both models and on the threshold
+        identifier = lambda: (f"{server.fastModels.identifier()}<{server.threshold}>"
+                              f"{server.models.identifier()}")
+    server.cache = cache.OCRCache(identifier, Main.PIPELINE_VERSION, cacheBytes, cachePath)
+
+def _detach(server):
+    server.batcher.close()
+    if server.fastBatcher is not None:
+        server.fastBatcher.close()
+    server.cache.close()
+
+def _serveForever(server, maxBatch, maxWait, cacheBytes, cachePath):
+    # Each process loads its own copy of the model after the fork, as
+    # TensorFlow's runtime must not be shared between processes (and
+    # neither do the threads of the batcher survive a fork).
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    _attach(server, maxBatch, maxWait, cacheBytes, cachePath)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        _detach(server)
+
+def serve(host=HOST, port=PORT, workers=WORKERS, modelPath=Main.MODEL,
+          maxBatch=batcher.MAX_BATCH, maxWait=batcher.MAX_WAIT,
+          cacheBytes=cache.MAX_BYTES, cachePath=None, threads=None,
+          fastPath=None, threshold=cf.THRESHOLD):
+    """
+    Starts the worker(s) and blocks until interrupted.
+
+    :param host: {string} Interface to listen on
+    :param port: {integer} Port to listen on
+    :param workers: {integer} Number of processes accepting on the same socket
+    :param modelPath: {string} Location of the `.h5` model to serve
+    :param maxBatch: {integer} Most characters per model call across requests
+    :param maxWait: {float} Longest time (seconds) a character waits to be batched
+    :param cacheBytes: {integer} Memory budget of the result cache of each process
+    :param cachePath: {string} SQLite file persisting the result cache (memory only if None)
+    :param threads: {integer} CPU threads of the model of each process (the
+    cores shared between the processes if None)
+    :param fastPath: {string} Fast model of a cascade, None to classify every
+    character with the model only
+    :param threshold: {float} Least confidence accepted from the fast model
+    """
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    loader = functools.partial(cf.load, threads=threads, warm=True)
+    server = ThreadingHTTPServer((host, port), OCRHandler)
+    server.models = ModelCache(modelPath, loader)
+    server.fastModels = ModelCache(fastPath, loader) if fastPath else None
+    server.threshold = threshold
+    print(f"Serving OCR on http://{host}:{port} with {workers} worker(s)", file=sys.stderr)
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        _serveForever(server, maxBatch, maxWait, cacheBytes, cachePath)
+        server.server_close()
+        return
+
+    ctx = mp.get_context("fork")
+    args = (server, maxBatch, maxWait, cacheBytes, cachePath)
+    procs = [ctx.Process(target=_serveForever, args=args) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        server.server_close()
+# ---------- Serving - End ----------
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Long lived OCR worker")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--model", default=Main.MODEL)
+    parser.add_argument("--max-batch", type=int, default=batcher.MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=batcher.MAX_WAIT * 1000)
+    parser.add_argument("--cache-mb", type=float, default=cache.MAX_BYTES / 2 ** 20)
+    parser.add_argument("--cache-db", help="SQLite file persisting cached results")
+    parser.add_argument("--threads", type=int, help="CPU threads of the model of each worker "
+                                                    "(default: the cores shared between the workers)")
+    parser.add_argument("--fast", help="Fast model classifying every character first (cascade)")
+    parser.add_argument("--threshold", type=float, default=cf.THRESHOLD,
+                        help="Characters the fast model is less confident about go to --model")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.model,
+          args.max_batch, args.max_wait_ms / 1000,
+          int(args.cache_mb * 2 ** 20), args.cache_db, args.threads,
+          args.fast, args.threshold)
+    exit(0)
@@ -6,6 +6,7 @@ import style from "./style.module.css";
 export default () => {
   const [selectedFile, setSelectedFile] = useState({ name: "" });
   const [fileUploaded, setFileUploaded] = useState(0);
+  const [jobId, setJobId] = useState("");
   const [output, setOutput] = useState("");
   const onFileChange = (event) => {
     console.log(event.target);
@@ -20,7 +21,8 @@ export default () => {
 
     console.log(selectedFile);
     uploadFile(formData)
-      .then(() => {
+      .then((res) => {
+        setJobId(res.id);
         setFileUploaded(1);
       })
       .catch((err) => {
@@ -29,8 +31,12 @@ export default () => {
   };
   const handleConvert=async ()=>{
     setOutput("!!loading")
-    const res=await convertFile();
-    setOutput(res)
+    try {
+      const res=await convertFile(jobId);
+      setOutput(res)
+    } catch (err) {
+      setOutput("Conversion failed")
+    }
   }
   return (
     <React.Fragment>
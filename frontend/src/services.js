@@ -4,4 +4,24 @@ export const getHeading =()=> axios.get("/heading").then((res, err) => res.data)
 
 export const uploadFile = data=>axios.post("/upload/file",data).then((res,err)=>res.data)
 
-export const convertFile = data=>axios.get("/convert",data).then((res,err)=>res.data)
+const wait = ms => new Promise(resolve => setTimeout(resolve, ms))
+
+// Queues the uploaded job (again after Retry-After while the queue is full),
+// polls it until it finishes and fetches its result
+export const convertFile = async id => {
+  while (true) {
+    try {
+      await axios.post(`/jobs/${id}`)
+      break
+    } catch (err) {
+      if (!err.response || err.response.status !== 429) throw err
+      await wait(1000 * (Number(err.response.headers["retry-after"]) || 1))
+    }
+  }
+  while (true) {
+    const {data} = await axios.get(`/jobs/${id}`)
+    if (data.status === "done" || data.status === "failed") break
+    await wait(1000)
+  }
+  return axios.get(`/jobs/${id}/result`).then((res, err) => res.data)
+}
@@ -0,0 +1,167 @@
+// Bounded queue of OCR jobs with a file backed store.
+//
+// Every job lives in its own folder (see server.js) next to a `job.json`
+// record of its state, so that queued jobs survive a restart of the server and
+// no external broker is needed:
+//
+//     queued -> running -> done | failed
+//
+// At most `workers` jobs run at once. Jobs wait in one of two lanes, small
+// single page images are served before large or multi-page files, but every
+// `burst` small jobs in a row a waiting large job gets its turn. Once `limit`
+// jobs are waiting, new ones are refused with an estimate of when to retry.
+// A job may be submitted with a runner of its own (e.g. one streaming its lines
+// to the client), it still takes its place in the queue like the others.
+const fs = require("fs")
+const path = require("path")
+const EventEmitter = require("events")
+
+const RECORD = "job.json"
+// Multi-page images always go to the large lane
+const MULTI_PAGE = /\.tiff?$/i
+
+// ---------- Job Store ----------
+class JobStore{
+    constructor(dir){
+        this.dir = dir
+        fs.mkdirSync(dir, {recursive: true})
+    }
+
+    folder(id){
+        return path.join(this.dir, id)
+    }
+
+    get(id){
+        try{
+            return JSON.parse(fs.readFileSync(path.join(this.folder(id), RECORD), "utf8"))
+        }
+        catch(err){
+            return null
+        }
+    }
+
+    // Writes the whole record, readers never see a half written file
+    put(job){
+        const file = path.join(this.folder(job.id), RECORD)
+        fs.writeFileSync(file + ".tmp", JSON.stringify(job))
+        fs.renameSync(file + ".tmp", file)
+        return job
+    }
+
+    update(id, fields){
+        const job = this.get(id)
+        return job && this.put({...job, ...fields, updated: Date.now()})
+    }
+
+    list(){
+        return fs.readdirSync(this.dir).map(id => this.get(id)).filter(Boolean)
+    }
+}
+
+// ---------- Job Queue ----------
+class JobQueue extends EventEmitter{
+    // run(job, done) converts a job and calls done(err, text)
+    constructor(store, run, {workers = 1, limit = 100, smallBytes = 1024 * 1024, burst = 4} = {}){
+        super()
+        // One event name per job id, listened to by its subscribers
+        this.setMaxListeners(0)
+        this.store = store
+        this.run = run
+        this.workers = workers
+        this.limit = limit
+        this.smallBytes = smallBytes
+        this.burst = burst
+        this.lanes = {small: [], large: []}
+        // Runners given to `submit`, by job id (in memory only)
+        this.runners = new Map()
+        this.running = 0
+        this.smallInRow = 0
+        // Moving average of the run time, for the retry estimates
+        this.averageMs = 5000
+    }
+
+    lane(job){
+        return job.size <= this.smallBytes && !MULTI_PAGE.test(job.file) ? "small" : "large"
+    }
+
+    get waiting(){
+        return this.lanes.small.length + this.lanes.large.length
+    }
+
+    // Seconds until a place in the queue is likely to be free
+    retryAfter(){
+        const waves = Math.ceil((this.waiting - this.limit + 1) / this.workers)
+        return Math.max(1, Math.ceil(waves * this.averageMs / 1000))
+    }
+
+    // Queues a stored job (once), false when the queue is full. `run` replaces
+    // the runner of the queue for this job.
+    submit(id, run){
+        const stored = this.store.get(id)
+        if(stored && (stored.status === "queued" || stored.status === "running")) return true
+        if(!stored || this.waiting >= this.limit) return false
+        const job = this.store.update(id, {status: "queued", lane: this.lane(stored), queued: Date.now()})
+        if(run) this.runners.set(id, run)
+        this.lanes[job.lane].push(id)
+        this.emit(id, this.status(id))
+        this._next()
+        return true
+    }
+
+    // Requeues the jobs of the store left queued or running by a previous server
+    recover(){
+        const jobs = this.store.list()
+            .filter(job => job.status === "queued" || job.status === "running")
+            .sort((a, b) => a.queued - b.queued)
+        for(const job of jobs){
+            const {lane} = this.store.update(job.id, {status: "queued", lane: this.lane(job)})
+            this.lanes[lane].push(job.id)
+        }
+        this._next()
+        return jobs.length
+    }
+
+    // Job record with its place in its lane while it waits
+    status(id){
+        const job = this.store.get(id)
+        if(job && job.status === "queued"){
+            const position = this.lanes[job.lane].indexOf(id)
+            if(position >= 0) job.position = position + 1
+        }
+        return job
+    }
+
+    _take(){
+        const {small, large} = this.lanes
+        if(large.length && (!small.length || this.smallInRow >= this.burst)){
+            this.smallInRow = 0
+            return large.shift()
+        }
+        this.smallInRow++
+        return small.shift()
+    }
+
+    _next(){
+        while(this.running < this.workers && this.waiting){
+            const id = this._take()
+            const run = this.runners.get(id) || this.run
+            this.runners.delete(id)
+            const job = this.store.update(id, {status: "running", started: Date.now()})
+            if(!job) continue
+            this.running++
+            this.emit(id, job)
+            run(job, (err, text) => {
+                this.running--
+                const finished = Date.now()
+                this.averageMs = 0.8 * this.averageMs + 0.2 * (finished - job.started)
+                const done = err
+                    ? this.store.update(id, {status: "failed", error: String(err), finished})
+                    : this.store.update(id, {status: "done", text, finished})
+                if(done) this.emit(id, done)
+                this._next()
+            })
+        }
+    }
+}
+
+module.exports = {JobStore, JobQueue, RECORD}
@@ -1,41 +1,293 @@
 const express = require('express')
 const fileUpload = require("express-fileupload")
 const fs=require("fs")
-const {execFile} = require('child_process');
+const path = require("path")
+const http = require("http")
+const crypto = require("crypto")
+const {execFile, spawn} = require('child_process');
+const {JobStore, JobQueue} = require("./jobqueue")
 
 const app = express()
 app.use(fileUpload())
-const port = 3000;
-let fileName=""
+const port = process.env.PORT || 3000;
+// Long lived engine worker (engine/worker.py), e.g. http://127.0.0.1:5000
+const engineUrl = process.env.ENGINE_URL
+// One folder per job holding its upload, may be shared by several servers
+const jobsDir = process.env.JOBS_DIR || path.join(__dirname, "data", "jobs")
+// Jobs older than this are deleted
+const jobTtl = 1000 * (Number(process.env.JOB_TTL_SECONDS) || 3600)
+const jobId = /^[0-9a-f-]{36}$/
+// Conversions running at once (each python run loads its own TensorFlow)
+const queueWorkers = Number(process.env.QUEUE_WORKERS) || 1
+// Jobs waiting before new ones are refused with 429
+const queueLimit = Number(process.env.QUEUE_LIMIT) || 50
+// Single page uploads up to this size take the priority lane
+const smallJobBytes = Number(process.env.SMALL_JOB_BYTES) || 1024 * 1024
+
+const store = new JobStore(jobsDir)
+
+// Job record, null for unknown (or expired) jobs
+function findJob(id){
+    return jobId.test(id) ? store.get(id) : null
+}
+
+// Finds the upload of a job, null for unknown (or expired) jobs
+function jobFile(id){
+    const job = findJob(id)
+    return job ? path.join(store.folder(id), job.file) : null
+}
+
+function removeExpiredJobs(){
+    const now = Date.now()
+    for(const id of fs.readdirSync(jobsDir)){
+        const dir = path.join(jobsDir, id)
+        try{
+            const job = store.get(id)
+            if(job && (job.status === "queued" || job.status === "running")) continue
+            if(now - fs.statSync(dir).mtimeMs > jobTtl) fs.rmSync(dir, {recursive: true, force: true})
+        }
+        catch(err){
+            // Removed by another server sharing the folder
+        }
+    }
+}
+setInterval(removeExpiredJobs, Math.min(jobTtl, 60 * 1000)).unref()
+
+function convertWithWorker(imagePath, done){
+    const body = JSON.stringify({path: imagePath})
+    const req = http.request(`${engineUrl}/ocr`, {
+        method: "POST",
+        headers: {"Content-Type": "application/json", "Content-Length": Buffer.byteLength(body)}
+    }, (res) => {
+        let data = ""
+        res.on("data", chunk => data += chunk)
+        res.on("end", () => {
+            try{
+                const result = JSON.parse(data)
+                done(result.status === "success" ? null : result.error, result.text)
+            }
+            catch(err){
+                done(err)
+            }
+        })
+    })
+    req.on("error", done)
+    req.end(body)
+}
+
+// Converts the upload of a job, calls done(err, text)
+function convert(job, done){
+    const imagePath = path.join(store.folder(job.id), job.file)
+    if(engineUrl) return convertWithWorker(imagePath, done)
+    // The engine works on the image in memory, it writes nothing next to it
+    execFile('python', ['engine/main.py', imagePath], (err, stdout) => {
+        if(err) return done(err)
+        const result = stdout.lastIndexOf("Result: ")
+        done(null, result < 0 ? stdout : stdout.slice(result + "Result: ".length).trimEnd())
+    })
+}
+
+const queue = new JobQueue(store, convert, {workers: queueWorkers, limit: queueLimit, smallBytes: smallJobBytes})
+queue.recover()
+
+// Stores an upload in a new job folder, returns the job id
+function storeUpload(req){
+    const {myFile} = req.files
+    const id = crypto.randomUUID()
+    fs.mkdirSync(store.folder(id))
+    // Only the base name, the upload cannot leave its job folder
+    const file = path.basename(myFile.name) || "upload"
+    fs.writeFileSync(path.join(store.folder(id), file), myFile.data)
+    store.put({id, file, size: myFile.data.length, status: "uploaded", created: Date.now()})
+    return id
+}
+
+// Done and failed jobs are answered from their record, never run again
+function finished(job){
+    return job.status === "done" || job.status === "failed"
+}
+
+// Answers the result of a finished job, as /jobs/:id/result does
+function sendResult(job, res){
+    if(job.status === "failed") return res.status(500).send({status:"error", error: job.error})
+    res.send("Result: " + job.text)
+}
+
+// Queues a job, answers 429 with a Retry-After header when the queue is full
+function submit(id, res, run){
+    if(queue.submit(id, run)) return true
+    const retryAfter = queue.retryAfter()
+    res.set("Retry-After", String(retryAfter))
+    res.status(429).send({status:"error", error:"Too many jobs waiting", retryAfter})
+    return false
+}
 
 app.post('/upload/file',(req,res)=>{
     try{
-        const {myFile} = req.files
-        fs.writeFileSync(`./data/${myFile.name}`,myFile.data)
-        fileName=myFile.name
+        res.send({status:"success", id: storeUpload(req)})
     }
     catch(err){
-        res.send(err)
-    }
-    finally{
-        res.send({status:"success"})
-    }
-    
-})
-app.get("/convert",(req,res)=>{
-    var dataToSend;
-    const python = execFile('python', ['engine/main.py',`${__dirname}/data/${fileName}`]);
-    python.stdout.on('data', function (data) {   
-     dataToSend = data.toString();
-     console.log(dataToSend)
-    });
-    python.on("error",(err)=>{
-        console.log("err",err)
-    })
-    python.on('close', (code) => {
-       console.log("close",code) 
-       res.send(dataToSend)
-    });
+        res.status(400).send({status:"error", error: String(err)})
+    }
+})
+
+// ---------- Job API - Begin ----------
+// Upload and queue in one request
+app.post("/jobs",(req,res)=>{
+    let id
+    try{
+        id = storeUpload(req)
+    }
+    catch(err){
+        return res.status(400).send({status:"error", error: String(err)})
+    }
+    if(!submit(id, res)) return fs.rmSync(store.folder(id), {recursive: true, force: true})
+    res.status(202).set("Location", `/jobs/${id}`).send(queue.status(id))
+})
+
+// Queues a job uploaded with /upload/file
+app.post("/jobs/:id",(req,res)=>{
+    const job = findJob(req.params.id)
+    if(!job) return res.status(404).send({status:"error", error:"Unknown job"})
+    if(finished(job)){
+        const {text, ...state} = job
+        return res.send(state)
+    }
+    if(submit(req.params.id, res)) res.status(202).set("Location", `/jobs/${req.params.id}`).send(queue.status(req.params.id))
+})
+
+// Polling: state of the job, with its place in the queue while it waits
+app.get("/jobs/:id",(req,res)=>{
+    const job = findJob(req.params.id) && queue.status(req.params.id)
+    if(!job) return res.status(404).send({status:"error", error:"Unknown job"})
+    const {text, ...state} = job
+    res.send(state)
+})
+
+// Subscription: server sent events, one per change of state until the job ends
+app.get("/jobs/:id/events",(req,res)=>{
+    const id = req.params.id
+    const job = findJob(id) && queue.status(id)
+    if(!job) return res.status(404).send({status:"error", error:"Unknown job"})
+    res.set({"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    const send = ({text, ...state}) => {
+        res.write(`data: ${JSON.stringify(state)}\n\n`)
+        if(state.status === "done" || state.status === "failed"){
+            queue.removeListener(id, send)
+            res.end()
+        }
+    }
+    queue.on(id, send)
+    req.on("close", () => queue.removeListener(id, send))
+    send(job)
+})
+
+app.get("/jobs/:id/result",(req,res)=>{
+    const job = findJob(req.params.id)
+    if(!job) return res.status(404).send({status:"error", error:"Unknown job"})
+    if(!finished(job)) return res.status(409).send({status: job.status, error:"Not finished"})
+    sendResult(job, res)
+})
+// ---------- Job API - End ----------
+
+// Runner of a streamed job: pipes the newline delimited JSON of the engine
+// (one object per recognized line) to `res`, keeps the text for the job record
+// (one line of the image per line, as `main.py` gives it)
+function convertStream(res){
+    return (job, done) => {
+        const imagePath = path.join(store.folder(job.id), job.file)
+        const lines = []
+        let rest = "", finished = false
+        // A failed spawn is followed by its close
+        const finish = (err, text) => {
+            if(finished) return
+            finished = true
+            done(err, text)
+        }
+        const collect = (chunk) => {
+            const parts = (rest + chunk).split("\n")
+            rest = parts.pop()
+            for(const part of parts){
+                try{
+                    const line = JSON.parse(part)
+                    if(typeof line.text === "string") lines.push(line.text)
+                }
+                catch(err){
+                    // Not a line of text (e.g. a log line of the engine)
+                }
+            }
+        }
+        const failed = (err) => {
+            console.log("err",err)
+            // Nothing streamed yet: the client also sees the failure in the status
+            if(!res.headersSent) res.status(502)
+            res.end(JSON.stringify({error: String(err)}) + "\n")
+            finish(err)
+        }
+        if(engineUrl){
+            const body = JSON.stringify({path: imagePath})
+            const request = http.request(`${engineUrl}/ocr?stream=1`, {
+                method: "POST",
+                headers: {"Content-Type": "application/json", "Content-Length": Buffer.byteLength(body)}
+            }, (engineRes) => {
+                if(engineRes.statusCode < 200 || engineRes.statusCode >= 300){
+                    engineRes.resume()
+                    return failed(new Error(`engine answered ${engineRes.statusCode}`))
+                }
+                engineRes.on("data", collect)
+                engineRes.on("end", () => finish(null, lines.map(line => line + "\n").join("")))
+                engineRes.pipe(res)
+            })
+            request.on("error", failed)
+            request.end(body)
+            return
+        }
+        const python = spawn('python', ['engine/main.py', imagePath, '--stream'])
+        // Also keeps reading when the client has gone, the result is stored all the same
+        python.stdout.on("data", collect)
+        python.stdout.pipe(res)
+        python.on("error", failed)
+        python.on("close", (code) => finish(code !== 0 ? new Error(`engine exited with code ${code}`) : null,
+                                            lines.map(line => line + "\n").join("")))
+    }
+}
+
+// Streams the lines of a job as they are recognized, once the job's turn in the queue comes
+app.get("/convert/stream/:id",(req,res)=>{
+    const id = req.params.id
+    const job = findJob(id)
+    if(!job) return res.status(404).send({status:"error", error:"Unknown job"})
+    if(finished(job)){
+        // The stored text, line by line as the engine streamed it
+        if(job.status === "failed") return sendResult(job, res)
+        res.setHeader("Content-Type", "application/x-ndjson")
+        return res.end(job.text.replace(/\n$/, "").split("\n").map((text, line) => JSON.stringify({line, text}) + "\n").join(""))
+    }
+    if(job.status === "queued" || job.status === "running"){
+        return res.status(409).set("Location", `/jobs/${id}`).send({status: job.status, error:"Already queued"})
+    }
+    // The runner writes nothing before the engine answers
+    if(submit(id, res, convertStream(res))) res.setHeader("Content-Type", "application/x-ndjson")
+})
+
+// Synchronous conversion, goes through the queue like the job API
+app.get("/convert/:id",(req,res)=>{
+    const id = req.params.id
+    const job = findJob(id)
+    if(!job) return res.status(404).send({status:"error", error:"Unknown job"})
+    if(finished(job)) return sendResult(job, res)
+    const answer = (job) => {
+        if(!finished(job)) return
+        queue.removeListener(id, answer)
+        if(job.status === "failed"){
+            console.log("err",job.error)
+            return res.status(500).send(job.error)
+        }
+        res.send("Result: " + job.text)
+    }
+    queue.on(id, answer)
+    // A job already queued or running is only waited for
+    if(!submit(id, res)) queue.removeListener(id, answer)
 })
 
-app.listen(port, () => console.log(`listening on port 3000!`))
\ No newline at end of file
+app.listen(port, () => console.log(`listening on port ${port}!`))
@@ -0,0 +1,116 @@
+// Tests of the job queue (jobqueue.js), run with `npm test`
+const test = require("node:test")
+const assert = require("node:assert")
+const fs = require("fs")
+const os = require("os")
+const path = require("path")
+const {JobStore, JobQueue} = require("../jobqueue")
+
+function tempStore(){
+    return new JobStore(fs.mkdtempSync(path.join(os.tmpdir(), "ocr-queue-")))
+}
+
+function addJob(store, id, file = "scan.png", size = 10){
+    fs.mkdirSync(store.folder(id))
+    return store.put({id, file, size, status: "uploaded", created: Date.now()})
+}
+
+// Runner finishing jobs only when told to
+function manualRunner(){
+    const pending = []
+    const run = (job, done) => pending.push({job, done})
+    return {run, pending}
+}
+
+test("runs at most `workers` jobs at once", () => {
+    const store = tempStore()
+    const {run, pending} = manualRunner()
+    const queue = new JobQueue(store, run, {workers: 2})
+    for(const id of ["a", "b", "c"]) queue.submit(addJob(store, id).id)
+
+    assert.deepStrictEqual(pending.map(p => p.job.id), ["a", "b"])
+    assert.strictEqual(store.get("c").status, "queued")
+    assert.strictEqual(queue.status("c").position, 1)
+
+    pending[0].done(null, "TEXT")
+    assert.deepStrictEqual(pending.map(p => p.job.id), ["a", "b", "c"])
+    assert.strictEqual(store.get("a").status, "done")
+    assert.strictEqual(store.get("a").text, "TEXT")
+    pending[1].done(new Error("broken"))
+    assert.strictEqual(store.get("b").status, "failed")
+})
+
+test("refuses jobs once the queue is full", () => {
+    const store = tempStore()
+    const {run} = manualRunner()
+    const queue = new JobQueue(store, run, {workers: 1, limit: 2})
+    const accepted = ["a", "b", "c", "d"].map(id => queue.submit(addJob(store, id).id))
+
+    // One running, two waiting
+    assert.deepStrictEqual(accepted, [true, true, true, false])
+    assert.strictEqual(store.get("d").status, "uploaded")
+    assert.ok(queue.retryAfter() >= 1)
+    // Queuing a waiting job again does not take another place
+    assert.strictEqual(queue.submit("b"), true)
+    assert.strictEqual(queue.waiting, 2)
+})
+
+test("small jobs go first without starving large ones", () => {
+    const store = tempStore()
+    const {run, pending} = manualRunner()
+    const queue = new JobQueue(store, run, {workers: 1, smallBytes: 100, burst: 2})
+    queue.submit(addJob(store, "busy").id)
+    queue.submit(addJob(store, "big", "scan.png", 1000).id)
+    queue.submit(addJob(store, "pages", "scan.tiff", 10).id)
+    for(const id of ["s1", "s2", "s3"]) queue.submit(addJob(store, id).id)
+
+    while(pending.length < 6) pending[pending.length - 1].done(null, "")
+    assert.deepStrictEqual(pending.map(p => p.job.id), ["busy", "s1", "big", "s2", "s3", "pages"])
+})
+
+test("requeues the jobs left by a previous server", () => {
+    const store = tempStore()
+    addJob(store, "a")
+    addJob(store, "b")
+    store.update("a", {status: "running", queued: 1})
+    store.update("b", {status: "queued", queued: 2})
+    addJob(store, "c")
+
+    const {run, pending} = manualRunner()
+    const queue = new JobQueue(store, run, {workers: 1})
+    assert.strictEqual(queue.recover(), 2)
+    assert.deepStrictEqual(pending.map(p => p.job.id), ["a"])
+    assert.strictEqual(queue.status("b").position, 1)
+    assert.strictEqual(store.get("c").status, "uploaded")
+})
+
+test("notifies the subscribers of a job", () => {
+    const store = tempStore()
+    const {run, pending} = manualRunner()
+    const queue = new JobQueue(store, run)
+    const seen = []
+    queue.on("a", job => seen.push(job.status))
+    queue.submit(addJob(store, "a").id)
+    pending[0].done(null, "")
+    assert.deepStrictEqual(seen, ["queued", "running", "done"])
+})
+
+test("runs a job with the runner it was submitted with", () => {
+    const store = tempStore()
+    const {run, pending} = manualRunner()
+    const queue = new JobQueue(store, run, {workers: 1, limit: 1})
+    const streamed = []
+    queue.submit(addJob(store, "a").id)
+    queue.submit(addJob(store, "b").id, (job, done) => {
+        streamed.push(job.id)
+        done(null, "B")
+    })
+
+    // Waits for its turn and counts against the limit like any other job
+    assert.deepStrictEqual(streamed, [])
+    assert.strictEqual(queue.submit(addJob(store, "c").id, () => {}), false)
+    pending[0].done(null, "A")
+    assert.deepStrictEqual(streamed, ["b"])
+    assert.strictEqual(store.get("b").text, "B")
+    assert.deepStrictEqual(pending.map(p => p.job.id), ["a"])
+})
@@ -0,0 +1,109 @@
+// Load test of the upload / convert service: many parallel jobs uploading
+// files of the same name, each of which must get back its own result.
+//
+// Usage: node test/load.js [--jobs 200] [--concurrency 50] [--engine URL]
+//
+// Without --engine a stand-in engine worker answering with the contents of the
+// uploaded file is started, so that every result can be checked against its
+// upload. With --engine (a running engine/worker.py) only latency is reported.
+const http = require("http")
+const fs = require("fs")
+const os = require("os")
+const path = require("path")
+const {spawn} = require("child_process")
+
+function option(name, fallback){
+    const i = process.argv.indexOf(`--${name}`)
+    return i > 0 ? process.argv[i + 1] : fallback
+}
+const jobs = Number(option("jobs", 200))
+const concurrency = Number(option("concurrency", 50))
+const engine = option("engine")
+
+// Stand-in for engine/worker.py: the "text" of an image is its contents
+function startEngine(){
+    const server = http.createServer((req, res) => {
+        let body = ""
+        req.on("data", chunk => body += chunk)
+        req.on("end", () => {
+            const text = fs.readFileSync(JSON.parse(body).path, "utf8")
+            // Answers out of order
+            setTimeout(() => res.end(JSON.stringify({status: "success", text})), Math.random() * 20)
+        })
+    })
+    return new Promise(resolve => server.listen(0, "127.0.0.1", () => resolve(server)))
+}
+
+function startService(engineUrl, jobsDir, port){
+    const service = spawn("node", [path.join(__dirname, "..", "server.js")], {
+        env: {...process.env, PORT: String(port), ENGINE_URL: engineUrl, JOBS_DIR: jobsDir},
+        stdio: ["ignore", "pipe", "inherit"],
+    })
+    return new Promise((resolve, reject) => {
+        service.stdout.on("data", data => {
+            if(String(data).includes("listening")) resolve(service)
+        })
+        service.on("exit", code => reject(new Error(`server.js exited with ${code}`)))
+    })
+}
+
+async function runJob(base, i){
+    const contents = `job ${i} ${Math.random().toString(36).slice(2)}`
+    const form = new FormData()
+    // Every job uploads a file of the same name
+    form.append("myFile", new Blob([contents]), "scan.png")
+
+    const start = process.hrtime.bigint()
+    const upload = await (await fetch(`${base}/upload/file`, {method: "POST", body: form})).json()
+    const result = await (await fetch(`${base}/convert/${upload.id}`)).text()
+    const ms = Number(process.hrtime.bigint() - start) / 1e6
+    return {ms, id: upload.id, ok: result === `Result: ${contents}`}
+}
+
+function percentile(sorted, p){
+    return sorted[Math.min(sorted.length - 1, Math.floor(p / 100 * sorted.length))]
+}
+
+async function main(){
+    const jobsDir = fs.mkdtempSync(path.join(os.tmpdir(), "ocr-jobs-"))
+    const stub = engine ? null : await startEngine()
+    const engineUrl = engine || `http://127.0.0.1:${stub.address().port}`
+    const port = 20000 + Math.floor(Math.random() * 20000)
+    const service = await startService(engineUrl, jobsDir, port)
+    const base = `http://127.0.0.1:${port}`
+
+    const results = []
+    let next = 0
+    const start = Date.now()
+    await Promise.all(Array.from({length: concurrency}, async () => {
+        while(next < jobs){
+            const i = next++
+            try{
+                results.push(await runJob(base, i))
+            }
+            catch(err){
+                results.push({ms: NaN, ok: false, error: String(err)})
+            }
+        }
+    }))
+    const seconds = (Date.now() - start) / 1000
+
+    service.kill()
+    if(stub) stub.close()
+    fs.rmSync(jobsDir, {recursive: true, force: true})
+
+    const latencies = results.map(r => r.ms).filter(ms => !isNaN(ms)).sort((a, b) => a - b)
+    const failed = results.filter(r => r.error).length
+    const crossTalk = engine ? 0 : results.filter(r => !r.error && !r.ok).length
+    const ids = new Set(results.map(r => r.id).filter(Boolean))
+    console.log(`${jobs} jobs, ${concurrency} in parallel, ${seconds.toFixed(2)}s ` +
+                `(${(jobs / seconds).toFixed(1)} jobs/sec)`)
+    console.log(`p50 ${percentile(latencies, 50).toFixed(1)} ms, p99 ${percentile(latencies, 99).toFixed(1)} ms`)
+    console.log(`failed: ${failed}, wrong results (cross-talk): ${crossTalk}, distinct job ids: ${ids.size}`)
+    process.exit(failed || crossTalk || ids.size !== jobs ? 1 : 0)
+}
+
+main().catch(err => {
+    console.error(err)
+    process.exit(1)
+})